@@ -0,0 +1,236 @@
+import json
+import random
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from report import SEVERITIES, build_report
+
+
+# =========================
+# Latency distributions
+# =========================
+class Latency:
+    """
+    モデル呼び出しの遅延（秒）の分布。仕様文字列から作る（値はミリ秒）。
+      fixed:50 / uniform:20:120 / exp:80 / lognormal:80:0.5（中央値, sigma）
+    """
+
+    def __init__(self, spec: str, rng: random.Random):
+        kind, _, rest = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in rest.split(":") if a]
+        self.rng = rng
+        if kind not in {"fixed", "uniform", "exp", "lognormal"}:
+            raise ValueError(f"unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        a = self.args
+        if self.kind == "fixed":
+            ms = a[0]
+        elif self.kind == "uniform":
+            ms = self.rng.uniform(a[0], a[1])
+        elif self.kind == "exp":
+            ms = self.rng.expovariate(1.0 / a[0])
+        else:
+            ms = self.rng.lognormvariate(0.0, a[1]) * a[0]
+        return max(0.0, ms) / 1000.0
+
+
+class FakeRateLimit(Exception):
+    """google-genai の 429 と同じく、メッセージに 429 / RESOURCE_EXHAUSTED を含む例外。"""
+
+    code = 429
+
+    def __init__(self) -> None:
+        super().__init__("429 RESOURCE_EXHAUSTED: fake quota exceeded")
+
+
+# =========================
+# Fake client
+# =========================
+@dataclass
+class FakeConfig:
+    latency: str = "lognormal:120:0.4"
+    # 呼び出しのうち 429 を返す割合
+    rate_429: float = 0.0
+    # report の findings 件数の範囲
+    min_findings: int = 1
+    max_findings: int = 6
+    # reason 等の文字列の長さ（文字数）
+    text_chars: int = 120
+    # 各 finding の severity の重み（low, medium, high, critical）
+    severity_weights: List[float] = field(default_factory=lambda: [0.7, 0.3, 0.0, 0.0])
+    # ストリーミング時の 1 チャンクの文字数
+    stream_chunk_chars: int = 64
+    seed: Optional[int] = None
+
+
+@dataclass
+class FakeResponse:
+    text: str
+    usage_metadata: Any = None
+
+
+@dataclass
+class FakeCached:
+    name: str
+
+
+class FakeStats:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.throttled = 0
+        self.injected_seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "meanLatencyMs": round(self.injected_seconds / self.calls * 1000, 2) if self.calls else 0.0,
+        }
+
+
+def _section(prompt: str, name: str) -> str:
+    """プロンプトの [name] セクションの本文を取り出す（無ければ空文字）。"""
+    marker = f"[{name}]\n"
+    start = prompt.find(marker)
+    if start < 0:
+        return ""
+    start += len(marker)
+    end = prompt.find("\n[", start)
+    return prompt[start:] if end < 0 else prompt[start:end]
+
+
+class FakeModels:
+    def __init__(self, config: FakeConfig, rng: random.Random, stats: FakeStats):
+        self.config = config
+        self.rng = rng
+        self.latency = Latency(config.latency, rng)
+        self.stats = stats
+
+    async def _delay(self) -> None:
+        self.stats.calls += 1
+        seconds = self.latency.sample()
+        self.stats.injected_seconds += seconds
+        await asyncio.sleep(seconds)
+        if self.rng.random() < self.config.rate_429:
+            self.stats.throttled += 1
+            raise FakeRateLimit()
+
+    def _filler(self, label: str) -> str:
+        base = f"{label}に関する説明文です。"
+        return (base * (self.config.text_chars // len(base) + 1))[: self.config.text_chars]
+
+    def _snippet(self, markdown: str) -> str:
+        """本文中に実在する短い文字列（ハイライトのオフセットが解決できるように）。"""
+        lines = [l.strip() for l in markdown.splitlines() if len(l.strip()) >= 8 and not l.startswith(("#", "!"))]
+        if not lines:
+            return markdown.strip()[:20] or "text"
+        line = self.rng.choice(lines)
+        start = self.rng.randrange(0, max(1, len(line) - 12))
+        return line[start:start + 12]
+
+    def _report(self, prompt: str) -> Dict[str, Any]:
+        markdown = _section(prompt, "markdown")
+        n = self.rng.randint(self.config.min_findings, self.config.max_findings)
+        findings = []
+        for i in range(n):
+            severity = self.rng.choices(SEVERITIES, weights=self.config.severity_weights)[0]
+            findings.append({
+                "id": f"f_{i + 1:03d}",
+                "category": self.rng.choice(["privacy", "security", "legal", "quality", "tone"]),
+                "severity": severity,
+                "title": f"指摘 {i + 1}",
+                "reason": self._filler("理由"),
+                "suggestion": self._filler("修正案"),
+                "highlights": [{"text": self._snippet(markdown), "context": "..."}],
+                "tags": ["bench"],
+            })
+        return build_report(findings)
+
+    def _payload(self, prompt: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+        props = schema.get("properties", {})
+        if "findings" in props:
+            return self._report(prompt)
+        if "patches" in props:
+            briefs = json.loads(_section(prompt, "findings") or "[]")
+            return {"patches": [
+                {"findingId": b["id"], "originalText": h, "replacement": f"〔{h}〕"}
+                for b in briefs for h in b.get("highlights", [])
+            ]}
+        if "originalText" in props:
+            original = _section(prompt, "originalText").strip() or "text"
+            return {"originalText": original, "replacement": f"〔{original}〕", "note": "bench"}
+        if "fixSummary" in props:
+            return {"fixSummary": [self._filler("修正")], "checklist": [self._filler("確認")]}
+        if "audience" in props:
+            audience = "engineers"
+            for line in _section(prompt, "settings").splitlines():
+                if line.startswith("audience="):
+                    audience = line.split("=", 1)[1]
+            return {
+                "audience": audience,
+                "verdict": "warn",
+                "summary": {"total": 1, "bySeverity": {"low": 0, "medium": 1, "high": 0, "critical": 0}},
+                "items": [{
+                    "id": "p_001",
+                    "severity": "medium",
+                    "title": "読者への配慮",
+                    "reason": self._filler("理由"),
+                    "suggestion": self._filler("修正案"),
+                    "highlights": [{"text": self._snippet(_section(prompt, "markdown")), "context": "..."}],
+                }],
+            }
+        return {}
+
+    @staticmethod
+    def _prompt(contents: Any) -> str:
+        if isinstance(contents, str):
+            return contents
+        return "\n".join(c for c in contents if isinstance(c, str))
+
+    async def generate_content(self, model: str, contents: Any, config: Any) -> FakeResponse:
+        await self._delay()
+        payload = self._payload(self._prompt(contents), config.response_schema or {})
+        return FakeResponse(json.dumps(payload, ensure_ascii=False))
+
+    async def generate_content_stream(self, model: str, contents: Any, config: Any) -> AsyncIterator[FakeResponse]:
+        await self._delay()
+        text = json.dumps(self._payload(self._prompt(contents), config.response_schema or {}), ensure_ascii=False)
+        size = self.config.stream_chunk_chars
+
+        async def chunks() -> AsyncIterator[FakeResponse]:
+            for i in range(0, len(text), size):
+                await asyncio.sleep(0)
+                yield FakeResponse(text[i:i + size])
+
+        return chunks()
+
+
+class FakeCaches:
+    def __init__(self, models: FakeModels):
+        self.models = models
+        self.created = 0
+
+    async def create(self, model: str, config: Any) -> FakeCached:
+        await self.models._delay()
+        self.created += 1
+        return FakeCached(name=f"cachedContents/bench-{self.created}")
+
+    async def delete(self, name: str) -> None:
+        return None
+
+
+class FakeGenaiClient:
+    """
+    genai.Client(...).aio の代わりに main.client に差し込む偽クライアント。
+    response_schema を見て、各エンドポイントに合う形の JSON を遅延付きで返す。
+    """
+
+    def __init__(self, config: Optional[FakeConfig] = None):
+        self.config = config or FakeConfig()
+        self.stats = FakeStats()
+        rng = random.Random(self.config.seed)
+        self.models = FakeModels(self.config, rng, self.stats)
+        self.caches = FakeCaches(self.models)
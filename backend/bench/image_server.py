@@ -0,0 +1,115 @@
+import io
+import time
+import zlib
+import struct
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+
+# =========================
+# Test images
+# =========================
+def make_png(width: int, height: int, seed: int) -> bytes:
+    """seed ごとに異なる単色の PNG を作る（Pillow があればノイズ入りの大きめの画像）。"""
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+
+    if Image is not None:
+        img = Image.effect_noise((width, height), 40 + seed % 50).convert("RGB")
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        return buf.getvalue()
+
+    color = bytes([(seed * 37) % 256, (seed * 91) % 256, (seed * 53) % 256])
+    raw = b"".join(b"\x00" + color * width for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+# =========================
+# Local image server
+# =========================
+class ImageServer:
+    """
+    ベンチマーク用のローカル画像サーバー。/img/<n>.png で n ごとに異なる画像を返す。
+    ETag による条件付き GET（304）に対応し、latency 秒の遅延を入れられる。
+    """
+
+    def __init__(self, width: int = 640, height: int = 480, latency: float = 0.0, host: str = "127.0.0.1"):
+        self.width = width
+        self.height = height
+        self.latency = latency
+        self.host = host
+        self.requests = 0
+        self.not_modified = 0
+        self._images: Dict[int, Tuple[bytes, str]] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def image(self, n: int) -> Tuple[bytes, str]:
+        with self._lock:
+            if n not in self._images:
+                data = make_png(self.width, self.height, n)
+                self._images[n] = (data, '"' + hashlib.sha256(data).hexdigest()[:16] + '"')
+            return self._images[n]
+
+    def url(self, n: int) -> str:
+        return f"http://{self.host}:{self.port}/img/{n}.png"
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1] if self._server else 0
+
+    def start(self) -> "ImageServer":
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                owner.requests += 1
+                if owner.latency:
+                    time.sleep(owner.latency)
+                name = self.path.rsplit("/", 1)[-1]
+                if not (self.path.startswith("/img/") and name.endswith(".png") and name[:-4].isdigit()):
+                    self.send_error(404)
+                    return
+                data, etag = owner.image(int(name[:-4]))
+                if self.headers.get("If-None-Match") == etag:
+                    owner.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "max-age=60")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
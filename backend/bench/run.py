@@ -0,0 +1,422 @@
+"""
+バックエンドの負荷試験。偽の genai クライアントとローカル画像サーバーを使い、
+実際の FastAPI アプリ（uvicorn）に check → recheck → patch → persona-review → release の流れを並行して流す。
+
+  cd backend
+  python -m bench.run --concurrency 16 --duration 30
+  python -m bench.run --save-baseline bench/baseline.json
+  python -m bench.run --baseline bench/baseline.json --tolerance 0.2   # 劣化していれば終了コード 1
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import resource
+import threading
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from bench.fake_genai import FakeConfig, FakeGenaiClient
+from bench.image_server import ImageServer
+
+
+ENDPOINTS = ["check", "recheck", "patch", "persona", "release"]
+
+SETTINGS = {"publishScope": "public", "tone": "technical", "audience": "engineers", "redactMode": "light"}
+
+
+# =========================
+# Measurements
+# =========================
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def rss_mb() -> float:
+    """現在の RSS（MB）。/proc が無い環境では最大 RSS を返す。"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LoopMonitor:
+    """サーバーのイベントループの遅れ（sleep が予定より何秒遅れて戻ったか）と RSS を定期的に記録する。"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lags: List[float] = []
+        self.rss: List[float] = []
+        self._stop = False
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        n = 0
+        while not self._stop:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - start - self.interval))
+            n += 1
+            if n % 10 == 0:
+                self.rss.append(rss_mb())
+
+    def stop(self) -> None:
+        self._stop = True
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {e: [] for e in ENDPOINTS}
+        self.errors: Dict[str, Dict[str, int]] = {e: {} for e in ENDPOINTS}
+        self.skipped: Dict[str, int] = {e: 0 for e in ENDPOINTS}
+
+    def ok(self, endpoint: str, seconds: float) -> None:
+        self.latencies[endpoint].append(seconds)
+
+    def error(self, endpoint: str, status: Any) -> None:
+        bucket = self.errors[endpoint]
+        bucket[str(status)] = bucket.get(str(status), 0) + 1
+
+
+# =========================
+# Server
+# =========================
+class ServerThread:
+    """uvicorn を別スレッドのイベントループで動かす（ループの遅れを負荷生成側と分けて測るため）。"""
+
+    def __init__(self, app: Any):
+        import uvicorn
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False, lifespan="on"))
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve(sockets=[self.sock]))
+
+    def start(self) -> "ServerThread":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def submit(self, coro: Any) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+# =========================
+# Load
+# =========================
+def make_document(n: int, rng: random.Random, paragraphs: int, images: List[str]) -> str:
+    lines = [f"# ベンチマーク記事 {n}", ""]
+    for p in range(paragraphs):
+        lines.append(f"## 節 {p + 1}")
+        lines.append("")
+        lines.append(
+            f"これは負荷試験用の段落 {p + 1} です。記事 {n} の内容として、"
+            f"設定手順や運用上の注意点を説明します。識別子 {rng.randrange(10**8):08d} を含みます。"
+        )
+        lines.append("")
+        if p < len(images):
+            lines.append(f"![図 {p + 1}]({images[p]})")
+            lines.append("")
+    return "\n".join(lines)
+
+
+async def timed(
+    http: httpx.AsyncClient,
+    rec: Recorder,
+    endpoint: str,
+    path: str,
+    body: Dict[str, Any],
+) -> Optional[Dict[str, Any]]:
+    start = time.perf_counter()
+    try:
+        resp = await http.post(path, json=body)
+    except httpx.HTTPError as e:
+        rec.error(endpoint, type(e).__name__)
+        return None
+    elapsed = time.perf_counter() - start
+    if resp.status_code != 200:
+        rec.error(endpoint, resp.status_code)
+        return None
+    rec.ok(endpoint, elapsed)
+    return resp.json()
+
+
+async def session(
+    http: httpx.AsyncClient,
+    rec: Recorder,
+    n: int,
+    args: argparse.Namespace,
+    rng: random.Random,
+    images: ImageServer,
+) -> None:
+    """1 人の利用者の流れ: check → recheck → patch → persona-review → release。"""
+    # 画像は記事ごとに --image-pool の中から選ぶ（同じ画像を複数の記事で共有する）
+    urls = [images.url(rng.randrange(args.image_pool)) for _ in range(args.images)]
+    text = make_document(n, rng, args.paragraphs, urls)
+    endpoints = set(args.endpoints)
+
+    created = await timed(http, rec, "check", "/v1/checks", {"text": text, "settings": SETTINGS})
+    if not created:
+        return
+    check_id = created["checkId"]
+    report = created["report"]
+
+    if "recheck" in endpoints:
+        text = text + f"\n\n追記 {rng.randrange(10**6)}。内容を補足しました。\n"
+        out = await timed(
+            http, rec, "recheck", f"/v1/checks/{check_id}/recheck", {"text": text, "settings": SETTINGS}
+        )
+        report = out["report"] if out else report
+
+    if "patch" in endpoints:
+        if report["findings"]:
+            await timed(
+                http, rec, "patch", "/v1/patches",
+                {"checkId": check_id, "findingId": report["findings"][0]["id"], "text": text},
+            )
+        else:
+            rec.skipped["patch"] += 1
+
+    if "persona" in endpoints:
+        await timed(http, rec, "persona", "/v1/persona-review", {"text": text, "settings": SETTINGS})
+
+    if "release" in endpoints:
+        if report["score"] >= 70:
+            await timed(
+                http, rec, "release", "/v1/release", {"checkId": check_id, "text": text, "settings": SETTINGS}
+            )
+        else:
+            rec.skipped["release"] += 1
+
+
+async def drive(port: int, args: argparse.Namespace, rec: Recorder, images: ImageServer) -> float:
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    counter = iter(range(10**9))
+    deadline = time.perf_counter() + args.duration
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60.0) as http:
+
+        async def worker() -> None:
+            while time.perf_counter() < deadline:
+                n = next(counter)
+                if args.sessions and n >= args.sessions:
+                    return
+                await session(http, rec, n, args, rng, images)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        return time.perf_counter() - start
+
+
+# =========================
+# Report / baseline
+# =========================
+def summarize(rec: Recorder, monitor: LoopMonitor, elapsed: float, fake: FakeGenaiClient, args: argparse.Namespace) -> Dict[str, Any]:
+    endpoints: Dict[str, Any] = {}
+    total = 0
+    for e in ENDPOINTS:
+        values = rec.latencies[e]
+        errors = sum(rec.errors[e].values())
+        total += len(values)
+        if not values and not errors:
+            continue
+        endpoints[e] = {
+            "count": len(values),
+            "errors": rec.errors[e],
+            "errorRate": round(errors / (len(values) + errors), 4) if values or errors else 0.0,
+            "skipped": rec.skipped[e],
+            "p50Ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95Ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99Ms": round(percentile(values, 0.99) * 1000, 2),
+        }
+    return {
+        "config": {
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "latency": args.latency,
+            "rate429": args.rate_429,
+            "images": args.images,
+            "paragraphs": args.paragraphs,
+        },
+        "elapsedSeconds": round(elapsed, 2),
+        "requests": total,
+        "throughputRps": round(total / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints,
+        "loopLagMs": {
+            "p50": round(percentile(monitor.lags, 0.50) * 1000, 2),
+            "p99": round(percentile(monitor.lags, 0.99) * 1000, 2),
+            "max": round(max(monitor.lags, default=0.0) * 1000, 2),
+        },
+        "rssMb": {
+            "end": round(rss_mb(), 1),
+            "peak": round(max(monitor.rss, default=rss_mb()), 1),
+        },
+        "fakeModel": fake.stats.as_dict(),
+    }
+
+
+def compare(
+    result: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float,
+    slack_ms: float,
+    endpoints: List[str],
+) -> List[str]:
+    """
+    baseline より悪化した項目を返す。レイテンシは tolerance の比率に加えて slack_ms までの揺れを許す。
+    endpoints（今回流したもの）に無いエンドポイントは比較しない。
+    """
+    problems: List[str] = []
+
+    def worse(name: str, current: float, base: float) -> None:
+        if current > base * (1 + tolerance) + slack_ms:
+            problems.append(f"{name}: {current} > baseline {base} (+{tolerance:.0%} +{slack_ms}ms)")
+
+    for e, base in baseline.get("endpoints", {}).items():
+        if e != "check" and e not in endpoints:
+            continue
+        cur = result["endpoints"].get(e)
+        if cur is None:
+            problems.append(f"{e}: no successful requests")
+            continue
+        worse(f"{e} p95Ms", cur["p95Ms"], base["p95Ms"])
+        worse(f"{e} p99Ms", cur["p99Ms"], base["p99Ms"])
+        if cur["errorRate"] > base["errorRate"] + 0.01:
+            problems.append(f"{e} errorRate: {cur['errorRate']} > baseline {base['errorRate']}")
+
+    base_rps = baseline.get("throughputRps", 0.0)
+    if result["throughputRps"] < base_rps * (1 - tolerance):
+        problems.append(f"throughputRps: {result['throughputRps']} < baseline {base_rps} (-{tolerance:.0%})")
+    worse("loopLagMs p99", result["loopLagMs"]["p99"], baseline.get("loopLagMs", {}).get("p99", 0.0))
+    peak = baseline.get("rssMb", {}).get("peak")
+    if peak and result["rssMb"]["peak"] > peak * (1 + tolerance):
+        problems.append(f"rssMb peak: {result['rssMb']['peak']} > baseline {peak} (+{tolerance:.0%})")
+    return problems
+
+
+def print_table(result: Dict[str, Any]) -> None:
+    print(f"{'endpoint':<10} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for e, s in result["endpoints"].items():
+        errors = sum(s["errors"].values())
+        print(f"{e:<10} {s['count']:>7} {errors:>7} {s['p50Ms']:>9} {s['p95Ms']:>9} {s['p99Ms']:>9}")
+    lag = result["loopLagMs"]
+    print(
+        f"\nthroughput {result['throughputRps']} req/s over {result['elapsedSeconds']}s | "
+        f"loop lag p50 {lag['p50']}ms p99 {lag['p99']}ms max {lag['max']}ms | "
+        f"RSS peak {result['rssMb']['peak']}MB | fake model {result['fakeModel']}"
+    )
+
+
+# =========================
+# CLI
+# =========================
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Blog Risk Checker backend benchmark")
+    p.add_argument("--concurrency", type=int, default=8, help="同時に動かす利用者の数")
+    p.add_argument("--duration", type=float, default=20.0, help="実行時間（秒）")
+    p.add_argument("--sessions", type=int, default=0, help="利用者の流れの総数（0 なら duration まで）")
+    p.add_argument("--endpoints", nargs="+", default=ENDPOINTS, choices=ENDPOINTS, help="check 以外に流すもの")
+    p.add_argument("--latency", default="lognormal:120:0.4", help="モデルの遅延分布（ms）: fixed:50 / uniform:20:120 / exp:80 / lognormal:80:0.5")
+    p.add_argument("--rate-429", type=float, default=0.0, help="モデル呼び出しが 429 になる割合")
+    p.add_argument("--findings", default="1:6", help="report の findings 件数の範囲 min:max")
+    p.add_argument("--text-chars", type=int, default=120, help="reason などの文字数")
+    p.add_argument("--paragraphs", type=int, default=8, help="記事の段落数")
+    p.add_argument("--images", type=int, default=2, help="記事あたりの画像数")
+    p.add_argument("--image-pool", type=int, default=20, help="画像サーバーが返す画像の種類")
+    p.add_argument("--image-latency", type=float, default=0.01, help="画像サーバーの遅延（秒）")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--output", help="結果の JSON を書き出すパス")
+    p.add_argument("--save-baseline", help="結果を baseline として保存するパス")
+    p.add_argument("--baseline", help="比較する baseline の JSON")
+    p.add_argument("--tolerance", type=float, default=0.2, help="baseline から許容する悪化の比率")
+    p.add_argument("--slack-ms", type=float, default=5.0, help="レイテンシ比較で許容する絶対的な揺れ（ms）")
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    # 実際の Vertex AI には接続しない（main.client を偽クライアントに差し替える）
+    os.environ["MOCK"] = "0"
+    os.environ.pop("API_KEY", None)
+    import main as app_module
+
+    lo, _, hi = args.findings.partition(":")
+    fake = FakeGenaiClient(FakeConfig(
+        latency=args.latency,
+        rate_429=args.rate_429,
+        min_findings=int(lo),
+        max_findings=int(hi or lo),
+        text_chars=args.text_chars,
+        seed=args.seed,
+    ))
+    app_module.client = fake
+    # 偽クライアントでも設定には genai.types を使う。本番では warm_up が起動時に import するので、計測の前に済ませておく
+    app_module.genai_types()
+
+    images = ImageServer(latency=args.image_latency).start()
+    server = ServerThread(app_module.app).start()
+    monitor = LoopMonitor()
+    monitor_future = server.submit(monitor.run())
+
+    rec = Recorder()
+    try:
+        elapsed = asyncio.run(drive(server.port, args, rec, images))
+    finally:
+        monitor.stop()
+        monitor_future.result(timeout=5)
+        server.stop()
+        images.stop()
+
+    result = summarize(rec, monitor, elapsed, fake, args)
+    print_table(result)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(result, baseline, args.tolerance, args.slack_ms, args.endpoints)
+        if problems:
+            print("\nREGRESSION")
+            for p in problems:
+                print(f"  - {p}")
+            return 1
+        print("\nwithin baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
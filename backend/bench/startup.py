@@ -0,0 +1,193 @@
+"""
+コールドスタートの計測。Vertex AI の設定なし（mock モード）で、別プロセスのまま次を測る。
+  - import main にかかる時間と、時間のかかっている import の内訳
+  - uvicorn を起動してから最初のリクエストに応答するまでの時間
+
+  cd backend
+  python -m bench.startup --runs 5
+  python -m bench.startup --save-baseline bench/startup_baseline.json
+  python -m bench.startup --baseline bench/startup_baseline.json --tolerance 0.2   # 劣化していれば終了コード 1
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETTINGS = {"publishScope": "public", "tone": "technical", "audience": "engineers", "redactMode": "light"}
+
+
+def cold_env() -> Dict[str, str]:
+    """Vertex AI の設定を外し、mock モードで起動する環境変数。"""
+    env = {k: v for k, v in os.environ.items() if k not in {"GOOGLE_CLOUD_PROJECT", "API_KEY"}}
+    env["MOCK"] = "1"
+    return env
+
+
+# =========================
+# Import time
+# =========================
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def measure_import() -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=BACKEND_DIR, env=cold_env(), capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def import_breakdown(top: int) -> List[Tuple[str, float]]:
+    """-X importtime の出力から、main が直接 import しているモジュールを累計時間の長い順に返す（ms）。"""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=cold_env(), capture_output=True, text=True, check=True,
+    )
+    children: List[Tuple[str, float]] = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # main の直下は 2 段下げ（"| main" の 1 空白 + 2）
+        depth = len(name) - len(name.lstrip())
+        if depth == 3:
+            children.append((name.strip(), int(cumulative) / 1000))
+    return sorted(children, key=lambda c: -c[1])[:top]
+
+
+# =========================
+# Startup to first response
+# =========================
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_startup(timeout: float) -> Dict[str, float]:
+    """
+    uvicorn を起動し、mock の /v1/checks に最初に応答するまでの時間を測る。
+    Returns: {"readyMs": 起動から最初の応答まで, "firstRequestMs": その最初のリクエスト自体の時間}
+    """
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=cold_env(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    body = {"text": "# cold start\n\n本文です。\n", "settings": SETTINGS, "config": {"mock": "on"}}
+    try:
+        with httpx.Client(timeout=5.0) as http:
+            while time.perf_counter() - start < timeout:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"server exited: {proc.stderr.read().decode(errors='replace')}")
+                sent = time.perf_counter()
+                try:
+                    resp = http.post(f"http://127.0.0.1:{port}/v1/checks", json=body)
+                except httpx.TransportError:
+                    time.sleep(0.005)
+                    continue
+                done = time.perf_counter()
+                resp.raise_for_status()
+                return {"readyMs": (done - start) * 1000, "firstRequestMs": (done - sent) * 1000}
+        raise RuntimeError(f"server did not respond within {timeout}s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# =========================
+# Report
+# =========================
+def summarize(imports: List[float], startups: List[Dict[str, float]], breakdown: List[Tuple[str, float]]) -> Dict[str, Any]:
+    def ms(values: List[float]) -> Dict[str, float]:
+        return {"median": round(statistics.median(values), 1), "max": round(max(values), 1)}
+
+    return {
+        "runs": len(imports),
+        "importMs": ms([s * 1000 for s in imports]),
+        "readyMs": ms([s["readyMs"] for s in startups]),
+        "firstRequestMs": ms([s["firstRequestMs"] for s in startups]),
+        "slowestImports": [{"module": name, "ms": round(t, 1)} for name, t in breakdown],
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, slack_ms: float) -> List[str]:
+    """baseline より悪化した項目を返す（中央値を tolerance の比率 + slack_ms で比べる）。"""
+    problems: List[str] = []
+    for key in ("importMs", "readyMs", "firstRequestMs"):
+        base = baseline.get(key, {}).get("median")
+        current = result[key]["median"]
+        if base is not None and current > base * (1 + tolerance) + slack_ms:
+            problems.append(f"{key} median: {current} > baseline {base} (+{tolerance:.0%} +{slack_ms}ms)")
+    return problems
+
+
+def print_table(result: Dict[str, Any]) -> None:
+    print(f"{'metric':<16} {'median ms':>10} {'max ms':>10}")
+    for key in ("importMs", "readyMs", "firstRequestMs"):
+        print(f"{key:<16} {result[key]['median']:>10} {result[key]['max']:>10}")
+    print("\nslowest imports under main (cumulative ms)")
+    for item in result["slowestImports"]:
+        print(f"  {item['module']:<32} {item['ms']:>8}")
+
+
+# =========================
+# CLI
+# =========================
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Blog Risk Checker cold-start benchmark")
+    p.add_argument("--runs", type=int, default=5, help="計測の回数（中央値を使う）")
+    p.add_argument("--top", type=int, default=10, help="表示する import の数")
+    p.add_argument("--timeout", type=float, default=30.0, help="起動を待つ最大時間（秒）")
+    p.add_argument("--output", help="結果の JSON を書き出すパス")
+    p.add_argument("--save-baseline", help="結果を baseline として保存するパス")
+    p.add_argument("--baseline", help="比較する baseline の JSON")
+    p.add_argument("--tolerance", type=float, default=0.2, help="baseline から許容する悪化の比率")
+    p.add_argument("--slack-ms", type=float, default=50.0, help="許容する絶対的な揺れ（ms）")
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    imports = [measure_import() for _ in range(args.runs)]
+    startups = [measure_startup(args.timeout) for _ in range(args.runs)]
+    result = summarize(imports, startups, import_breakdown(args.top))
+    print_table(result)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(result, baseline, args.tolerance, args.slack_ms)
+        if problems:
+            print("\nREGRESSION")
+            for p in problems:
+                print(f"  - {p}")
+            return 1
+        print("\nwithin baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import re
+import hashlib
+from collections import Counter
+from typing import Any, Dict, List
+
+
+# =========================
+# Markdown block splitting
+# =========================
+FENCE_PATTERN = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+HEADING_PATTERN = re.compile(r"^\s{0,3}#{1,6}(\s|$)")
+IMAGE_LINE_PATTERN = re.compile(r"^\s*!\[[^\]]*\]\([^)]+\)\s*$")
+
+
+def block_hash(text: str) -> str:
+    return hashlib.sha256(text.rstrip().encode("utf-8")).hexdigest()[:16]
+
+
+def _make_block(kind: str, markdown: str, start: int, end: int) -> Dict[str, Any]:
+    text = markdown[start:end]
+    return {"kind": kind, "text": text, "start": start, "end": end, "hash": block_hash(text)}
+
+
+def split_blocks(markdown: str) -> List[Dict[str, Any]]:
+    """
+    Markdown を安定したブロックに分割する。
+    kind: "heading" | "paragraph" | "code" | "image"
+    Returns: [{"kind": str, "text": str, "start": int, "end": int, "hash": str}, ...]
+    start/end は markdown 内の文字オフセット（end は末尾の改行を含まない）。
+    """
+    lines = markdown.splitlines(keepends=True)
+    blocks: List[Dict[str, Any]] = []
+
+    pos = 0
+    para_start = -1
+    para_end = -1
+    i = 0
+
+    def flush_paragraph() -> None:
+        nonlocal para_start
+        if para_start >= 0:
+            blocks.append(_make_block("paragraph", markdown, para_start, para_end))
+            para_start = -1
+
+    while i < len(lines):
+        line = lines[i]
+        body = line.rstrip("\r\n")
+        line_end = pos + len(body)
+
+        fence = FENCE_PATTERN.match(body)
+        if fence:
+            flush_paragraph()
+            marker = fence.group(1)
+            start = pos
+            end = line_end
+            pos += len(line)
+            i += 1
+            # 閉じフェンスまで（無ければ文書末尾まで）を 1 ブロックにする
+            while i < len(lines):
+                inner = lines[i]
+                inner_body = inner.rstrip("\r\n")
+                end = pos + len(inner_body)
+                pos += len(inner)
+                i += 1
+                if inner_body.strip().startswith(marker[0] * len(marker)):
+                    break
+            blocks.append(_make_block("code", markdown, start, end))
+            continue
+
+        if not body.strip():
+            flush_paragraph()
+        elif HEADING_PATTERN.match(body):
+            flush_paragraph()
+            blocks.append(_make_block("heading", markdown, pos, line_end))
+        elif IMAGE_LINE_PATTERN.match(body):
+            flush_paragraph()
+            blocks.append(_make_block("image", markdown, pos, line_end))
+        else:
+            if para_start < 0:
+                para_start = pos
+            para_end = line_end
+
+        pos += len(line)
+        i += 1
+
+    flush_paragraph()
+    return blocks
+
+
+def changed_block_indices(old_hashes: List[str], new_blocks: List[Dict[str, Any]]) -> List[int]:
+    """
+    new_blocks のうち、old_hashes に同じ内容が無いブロックの index を返す。
+    同じ内容のブロックが複数ある場合は出現回数まで一致とみなす。
+    """
+    remaining = Counter(old_hashes)
+    changed: List[int] = []
+    for i, b in enumerate(new_blocks):
+        if remaining[b["hash"]] > 0:
+            remaining[b["hash"]] -= 1
+        else:
+            changed.append(i)
+    return changed
+
+
+def with_context(indices: List[int], total: int, window: int) -> List[int]:
+    """変更ブロックの前後 window 個を含めた index を昇順で返す。"""
+    picked = set()
+    for i in indices:
+        for j in range(max(0, i - window), min(total, i + window + 1)):
+            picked.add(j)
+    return sorted(picked)
+
+
+def chunk_blocks(
+    blocks: List[Dict[str, Any]],
+    max_chars: int,
+    overlap: int = 1,
+) -> List[Dict[str, Any]]:
+    """
+    ブロックを max_chars 程度のチャンクにまとめる。ブロックの途中では切らない。
+    各チャンクの先頭には直前のチャンクの末尾 overlap 個のブロックを重ねる（文脈用）。
+    Returns: [{"blocks": [index, ...], "own": [index, ...]}, ...]
+    own は重なり部分を除いた、そのチャンクが担当するブロック。
+    """
+    chunks: List[Dict[str, Any]] = []
+    current: List[int] = []
+    size = 0
+    for i, b in enumerate(blocks):
+        length = len(b["text"])
+        if current and size + length > max_chars:
+            chunks.append({"own": current})
+            current, size = [], 0
+        current.append(i)
+        size += length
+    if current:
+        chunks.append({"own": current})
+
+    for n, chunk in enumerate(chunks):
+        first = chunk["own"][0]
+        lead = list(range(max(0, first - overlap), first)) if n > 0 else []
+        chunk["blocks"] = lead + chunk["own"]
+    return chunks
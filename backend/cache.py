@@ -0,0 +1,518 @@
+import os
+import abc
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import fastjson
+
+T = TypeVar("T")
+
+
+# =========================
+# Key helpers
+# =========================
+def content_digest(*parts: str) -> str:
+    """
+    複数の文字列から安定した SHA-256 ダイジェストを作る。
+    区切りに \\x00 を挟むので ("ab", "c") と ("a", "bc") は衝突しない。
+    """
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    """改行コードと末尾の空白の揺れを吸収する（キャッシュキー用）。"""
+    return text.replace("\r\n", "\n").replace("\r", "\n").rstrip()
+
+
+# =========================
+# Backends
+# =========================
+class CacheBackend(abc.ABC):
+    """文字列値を保存するキャッシュの最小インターフェース。"""
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    async def get_decoded(self, key: str, decode: Callable[[str], T]) -> Optional[T]:
+        """
+        key の値を decode に通して返す（無ければ None）。decode はイベントループの外（スレッド）で行う。
+        読み込み自体をスレッドで行うバックエンドは、読み込みと decode を 1 回のスレッド呼び出しにまとめる。
+        """
+        raw = await self.get(key)
+        if raw is None:
+            return None
+        return await asyncio.to_thread(decode, raw)
+
+    async def update(self, key: str, fn: Callable[[Optional[str]], Optional[str]], ttl: float) -> Optional[str]:
+        """
+        key の値を fn(今の値) の戻り値で置き換える。読んでから書くまでの間に同じ key の update は割り込まない。
+        fn が None を返したら書き込まない。Returns: 書き込んだ値（書き込まなかったら None）
+        既定の実装はこのプロセスの中だけで直列化する（複数プロセスで共有するバックエンドは上書きする）。
+        """
+        async with self._key_lock(key):
+            value = fn(await self.get(key))
+            if value is not None:
+                await self.set(key, value, ttl)
+            return value
+
+    def _key_lock(self, key: str) -> asyncio.Lock:
+        # 使われている間だけ残す（キーごとの Lock を溜め込まない）
+        locks = self.__dict__.setdefault("_update_locks", weakref.WeakValueDictionary())
+        lock = locks.get(key)
+        if lock is None:
+            lock = locks[key] = asyncio.Lock()
+        return lock
+
+    async def close(self) -> None:
+        return None
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    プロセス内 LRU + TTL キャッシュ。
+    件数 (max_entries) と値の合計サイズ (max_bytes, UTF-8 のバイト数) の両方で追い出す。
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (expires_at, value, UTF-8 のバイト数)
+        self._data: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self._bytes = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value, _ = item
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        # 日本語は 1 文字 3 バイトなので、文字数ではなくバイト数で数える
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._data[key] = (time.monotonic() + ttl, value, size)
+        self._bytes += size
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+
+    async def delete(self, key: str) -> None:
+        self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DiskCacheBackend(CacheBackend):
+    """
+    ディレクトリに 1キー1ファイルで保存するキャッシュ。
+    プロセス再起動後も残り、同一ホストのワーカー間で共有できる。
+    LRU はファイルの mtime で近似する。ファイル操作はイベントループを止めないようスレッドで行う。
+    """
+
+    # 件数の見積もりが上限を超えたとき、またはこの回数の書き込みごとにディレクトリを数え直して追い出す
+    # （他のプロセスも書くので見積もりはずれうる）
+    EVICT_EVERY = 256
+    # 追い出すときは上限のこの割合まで減らす（上限付近で書くたびに追い出さないように）
+    EVICT_TO = 0.9
+
+    def __init__(self, directory: str, max_entries: int = 4096):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self._count_lock = threading.Lock()
+        self._writes = 0
+        self._count = self._scan_count()
+
+    def _scan_count(self) -> int:
+        try:
+            return sum(1 for e in os.scandir(self.directory) if e.name.endswith(".json"))
+        except OSError:
+            return 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if payload.get("expiresAt", 0) < time.time():
+            self._remove(key)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return payload.get("value")
+
+    def _write(self, key: str, value: str, ttl: float) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"expiresAt": time.time() + ttl, "value": value}, f, ensure_ascii=False)
+        added = not os.path.exists(path)
+        os.replace(tmp, path)
+        with self._count_lock:
+            self._count += added
+            self._writes += 1
+            evict = self._count > self.max_entries or self._writes % self.EVICT_EVERY == 0
+        if evict:
+            self._evict()
+
+    def _remove(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            return
+        with self._count_lock:
+            self._count -= 1
+
+    def _update(self, key: str, fn: Callable[[Optional[str]], Optional[str]], ttl: float) -> Optional[str]:
+        # 同じディレクトリを使う他のプロセスとはロックファイルで直列化する
+        with open(os.path.join(self.directory, ".update.lock"), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            value = fn(self._read(key))
+            if value is not None:
+                self._write(key, value, ttl)
+            return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._read, key)
+
+    async def get_decoded(self, key: str, decode: Callable[[str], T]) -> Optional[T]:
+        return await asyncio.to_thread(_read_decoded, self._read, key, decode)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await asyncio.to_thread(self._write, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._remove, key)
+
+    async def update(self, key: str, fn: Callable[[Optional[str]], Optional[str]], ttl: float) -> Optional[str]:
+        async with self._key_lock(key):
+            return await asyncio.to_thread(self._update, key, fn, ttl)
+
+    def _evict(self) -> None:
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".json")]
+        except OSError:
+            return
+        removed = 0
+        if len(entries) > self.max_entries:
+            entries.sort(key=_mtime)
+            for e in entries[:len(entries) - int(self.max_entries * self.EVICT_TO)]:
+                try:
+                    os.remove(e.path)
+                    removed += 1
+                except OSError:
+                    pass
+        with self._count_lock:
+            self._count = len(entries) - removed
+
+
+def _read_decoded(read: Callable[[str], Optional[str]], key: str, decode: Callable[[str], T]) -> Optional[T]:
+    raw = read(key)
+    return None if raw is None else decode(raw)
+
+
+def _mtime(entry: "os.DirEntry[str]") -> float:
+    # 数えてから消されたファイルは最も古いものとして扱う
+    try:
+        return entry.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+class SqliteCacheBackend(CacheBackend):
+    """
+    SQLite (WAL モード) に保存するバックエンド。
+    再起動後も残り、同一ホスト上の複数ワーカーから共有できる。
+    アクセス時刻で LRU、expires_at で TTL を管理する。
+    """
+
+    # set の度に件数チェックするとコストが高いので、この回数ごとに追い出す
+    EVICT_EVERY = 64
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed_at)")
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def _set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._conn.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN ("
+                    " SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _update(self, key: str, fn: Callable[[Optional[str]], Optional[str]], ttl: float) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE で書き込みロックを先に取り、他のプロセスの更新と読み書きが交差しないようにする
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                value = fn(row[0] if row is not None and row[1] >= now else None)
+                if value is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                        (key, value, now + ttl, now),
+                    )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def get_decoded(self, key: str, decode: Callable[[str], T]) -> Optional[T]:
+        return await asyncio.to_thread(_read_decoded, self._get, key, decode)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    async def update(self, key: str, fn: Callable[[Optional[str]], Optional[str]], ttl: float) -> Optional[str]:
+        return await asyncio.to_thread(self._update, key, fn, ttl)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Redis プロトコル互換サーバーを使うキャッシュ（redis パッケージが必要）。
+    追い出しはサーバー側の maxmemory-policy (allkeys-lru 推奨) に任せる。
+    client に redis.asyncio 互換のオブジェクト（fakeredis 等）を渡すこともできる。
+    """
+
+    def __init__(self, url: str, prefix: str = "brc:", client: Any = None):
+        self.prefix = prefix
+        if client is not None:
+            self._redis = client
+            return
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError("redis package is required for the redis cache backend") from e
+        self._redis = redis_asyncio.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._redis.get(self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await self._redis.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(self.prefix + key)
+
+    async def update(self, key: str, fn: Callable[[Optional[str]], Optional[str]], ttl: float) -> Optional[str]:
+        # WATCH したキーが EXEC までに書き換えられていたら読み直してやり直す
+        from redis.exceptions import WatchError
+
+        name = self.prefix + key
+        async with self._redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(name)
+                    value = fn(await pipe.get(name))
+                    if value is None:
+                        await pipe.unwatch()
+                        return None
+                    pipe.multi()
+                    pipe.set(name, value, ex=max(1, int(ttl)))
+                    await pipe.execute()
+                    return value
+                except WatchError:
+                    continue
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def cache_backend_from_env(
+    prefix: str,
+    default: str = "memory",
+    default_max_entries: int = 512,
+) -> Optional[CacheBackend]:
+    """
+    {prefix}_BACKEND などの環境変数からバックエンドを組み立てる。
+    BACKEND: memory | disk | sqlite | redis | none（none/off の場合は None = 無効）
+    """
+    kind = os.getenv(f"{prefix}_BACKEND", default).lower()
+    if kind in {"none", "off", "0", "false"}:
+        return None
+    max_entries = int(os.getenv(f"{prefix}_MAX_ENTRIES", str(default_max_entries)))
+    if kind == "memory":
+        max_bytes = int(os.getenv(f"{prefix}_MAX_BYTES", str(64 * 1024 * 1024)))
+        return MemoryCacheBackend(max_entries=max_entries, max_bytes=max_bytes)
+    if kind == "disk":
+        directory = os.getenv(f"{prefix}_DIR", os.path.join(".cache", prefix.lower()))
+        return DiskCacheBackend(directory, max_entries=max_entries)
+    if kind == "sqlite":
+        path = os.getenv(f"{prefix}_SQLITE_PATH", os.path.join(".cache", f"{prefix.lower()}.sqlite3"))
+        return SqliteCacheBackend(path, max_entries=max_entries)
+    if kind == "redis":
+        url = os.getenv(f"{prefix}_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return RedisCacheBackend(url, prefix=f"{prefix.lower()}:")
+    raise RuntimeError(f"Unknown {prefix}_BACKEND: {kind}")
+
+
+# =========================
+# JSON cache facade
+# =========================
+class JsonCache:
+    """
+    dict を JSON 文字列として保存するキャッシュ。
+    取り出すたびに新しい dict を返すので、呼び出し側で変更しても共有されない。
+    """
+
+    def __init__(self, backend: Optional[CacheBackend], ttl: float = 3600.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.backend is None:
+            return None
+        try:
+            # 大きな report の decode でイベントループを止めないよう、読み込みと一緒にスレッドで行う
+            value = await self.backend.get_decoded(key, fastjson.loads)
+        except Exception as e:
+            self.errors += 1
+            print(f"[WARN] cache get failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        if self.backend is None:
+            return
+        try:
+            await self.backend.set(key, fastjson.dumps(value), self.ttl)
+        except Exception as e:
+            self.errors += 1
+            print(f"[WARN] cache set failed: {e}")
+
+    async def delete(self, key: str) -> None:
+        if self.backend is not None:
+            await self.backend.delete(key)
+
+    async def close(self) -> None:
+        if self.backend is not None:
+            await self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hitRate": (self.hits / total) if total else 0.0,
+        }
+
+
+def json_cache_from_env(prefix: str, default_ttl: float = 3600.0, default_backend: str = "memory") -> JsonCache:
+    ttl = float(os.getenv(f"{prefix}_TTL", str(default_ttl)))
+    return JsonCache(cache_backend_from_env(prefix, default_backend), ttl=ttl)
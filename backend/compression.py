@@ -0,0 +1,128 @@
+import gzip
+from typing import Any, Dict, List, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli が無い環境では gzip だけを使う
+    brotli = None
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from offload import OffloadBusy, Offloader
+
+
+# =========================
+# Response compression
+# =========================
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Accept-Encoding から使う圧縮方式を選ぶ（br を優先）。q=0 は受け付けないものとして扱う。"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in {"q=0", "q=0.0", "q=0.00", "q=0.000"}:
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 5) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level)
+
+
+class CompressionMiddleware:
+    """
+    minimum_size 以上のレスポンスを brotli / gzip で圧縮する。
+    ストリーミングのレスポンス（SSE など、body が複数回に分かれるもの）や圧縮済みのものはそのまま返す。
+    offload_min_size 以上の body は、イベントループを止めないよう offloader のプールで圧縮する
+    （プールが埋まっていれば圧縮せずに返す）。
+    """
+
+    EXCLUDED_TYPES = ("text/event-stream", "image/", "application/gzip", "application/zip")
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 5,
+        offloader: Optional[Offloader] = None,
+        offload_min_size: int = 64 * 1024,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.offloader = offloader
+        self.offload_min_size = offload_min_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        # None: 未判定, True: 圧縮する, False: そのまま流す
+        buffering: Optional[bool] = None
+        chunks: List[bytes] = []
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, buffering
+            if message["type"] == "http.response.start":
+                start = message
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                buffering = not (
+                    "content-encoding" in headers
+                    or any(content_type.startswith(t) for t in self.EXCLUDED_TYPES)
+                )
+                if not buffering:
+                    await send(start)
+                return
+
+            if message["type"] != "http.response.body" or not buffering:
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                # 分割されたレスポンスはストリーミングとみなして圧縮しない
+                buffering = False
+                await send(start)
+                await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+                return
+
+            await self._send_buffered(start, b"".join(chunks), encoding, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _send_buffered(self, start: Dict[str, Any], body: bytes, encoding: str, send: Send) -> None:
+        headers = MutableHeaders(raw=start["headers"])
+        if len(body) >= self.minimum_size:
+            compressed = await self._compress(body, encoding)
+            if compressed is not None:
+                body = compressed
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+        await send(start)
+        await send({"type": "http.response.body", "body": body})
+
+    async def _compress(self, body: bytes, encoding: str) -> Optional[bytes]:
+        if self.offloader is None or len(body) < self.offload_min_size:
+            return compress(body, encoding, self.gzip_level, self.brotli_quality)
+        try:
+            return await self.offloader.run(compress, body, encoding, self.gzip_level, self.brotli_quality)
+        except OffloadBusy:
+            # 作り終えたレスポンスを 503 にするより、圧縮せずに返すほうがよい
+            return None
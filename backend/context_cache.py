@@ -0,0 +1,128 @@
+import time
+import asyncio
+from typing import Any, Callable, Dict, Optional
+
+from cache import content_digest
+
+
+# =========================
+# Vertex context caching
+# =========================
+class ContextCache:
+    """
+    文書 1 版ごとに Vertex AI の cached content を作って使い回す。
+    check の後の patch / persona-review / release では文書本体を送り直さず、
+    cached content の名前と差分（finding や audience）だけを送る。
+
+    キャッシュは本文のダイジェストで引く。作成に失敗した本文は TTL の間は再作成しない。
+    Vertex の最小トークン数に満たない短い文書（min_chars 未満）はキャッシュしない。
+    """
+
+    # 期限切れ直前のキャッシュは使わない（リクエスト中に切れるのを避ける）
+    EXPIRY_MARGIN = 30.0
+
+    def __init__(
+        self,
+        client_getter: Callable[[], Any],
+        model: str,
+        ttl_seconds: int = 900,
+        min_chars: int = 8000,
+        enabled: bool = True,
+    ):
+        self.client_getter = client_getter
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.min_chars = min_chars
+        self.enabled = enabled
+        # digest -> {"name": str | None, "expiresAt": float}
+        self._handles: Dict[str, Dict[str, Any]] = {}
+        self._creating: Dict[str, "asyncio.Task[Optional[Dict[str, Any]]]"] = {}
+        self.created = 0
+        self.reused = 0
+        self.failed = 0
+
+    def digest(self, text: str) -> str:
+        return content_digest("context", self.model, text)
+
+    def _usable(self, handle: Optional[Dict[str, Any]]) -> bool:
+        return bool(handle) and handle["expiresAt"] - self.EXPIRY_MARGIN > time.time()
+
+    async def handle_for(self, text: str, known: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        本文に対応する cached content を返す（無ければ作る）。
+        known には CHECK_STORE のエントリに記録済みのハンドルを渡せる（他ワーカーで作ったもの）。
+        Returns: {"name": str, "expiresAt": float, "digest": str} | None
+        """
+        if not self.enabled or len(text) < self.min_chars:
+            return None
+        digest = self.digest(text)
+
+        if known and known.get("digest") == digest and self._usable(known):
+            self.reused += 1
+            return known
+        handle = self._handles.get(digest)
+        if self._usable(handle):
+            if handle["name"] is None:
+                return None
+            self.reused += 1
+            return handle
+
+        task = self._creating.get(digest)
+        if task is None:
+            task = asyncio.ensure_future(self._create(digest, text))
+            self._creating[digest] = task
+            task.add_done_callback(lambda _: self._creating.pop(digest, None))
+        return await asyncio.shield(task)
+
+    async def _create(self, digest: str, text: str) -> Optional[Dict[str, Any]]:
+        expires_at = time.time() + self.ttl_seconds
+        try:
+            # google.genai は import が重いので、実際に作るときまで読み込まない
+            from google.genai import types
+
+            cached = await self.client_getter().caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    contents=[types.Content(role="user", parts=[types.Part(text=f"[markdown]\n{text}\n")])],
+                    ttl=f"{self.ttl_seconds}s",
+                    display_name=f"brc-{digest[:16]}",
+                ),
+            )
+        except Exception as e:
+            # 失敗した本文は TTL の間は作り直さない（毎回失敗して遅くなるのを避ける）
+            print(f"[WARN] Failed to create context cache: {e}")
+            self.failed += 1
+            self._handles[digest] = {"name": None, "expiresAt": expires_at, "digest": digest}
+            return None
+
+        self.created += 1
+        handle = {"name": cached.name, "expiresAt": expires_at, "digest": digest}
+        self._handles[digest] = handle
+        self._prune()
+        return handle
+
+    def _prune(self) -> None:
+        now = time.time()
+        for digest in [d for d, h in self._handles.items() if h["expiresAt"] < now]:
+            self._handles.pop(digest, None)
+
+    async def invalidate(self, handle: Optional[Dict[str, Any]]) -> None:
+        """
+        使えなくなった（期限切れ・削除済みなどの）cached content を削除する。
+        ハンドルは本文のダイジェストで共有されるので、まだ使える cached content には呼ばない（TTL で切れるのを待つ）。
+        """
+        if not handle or not handle.get("name"):
+            return
+        self._handles.pop(handle.get("digest", ""), None)
+        try:
+            await self.client_getter().caches.delete(name=handle["name"])
+        except Exception as e:
+            print(f"[WARN] Failed to delete context cache {handle['name']}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "handles": len(self._handles),
+            "created": self.created,
+            "reused": self.reused,
+            "failed": self.failed,
+        }
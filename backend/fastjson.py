@@ -0,0 +1,70 @@
+import json
+from typing import Any, Callable, Coroutine
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import orjson
+except ImportError:  # orjson が無い環境では標準の json を使う
+    orjson = None
+
+
+# =========================
+# JSON encode / decode
+# =========================
+def _default(obj: Any) -> Any:
+    # pydantic モデル（CheckSettings など）がそのまま渡された場合
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def loads(data: Any) -> Any:
+    """bytes / str の JSON をデコードする。不正な JSON は json.JSONDecodeError（orjson のものも同じ型）。"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumpb(obj: Any) -> bytes:
+    """JSON を UTF-8 の bytes にエンコードする（日本語はエスケープしない、空白なし）。"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    return dumpb(obj).decode("utf-8")
+
+
+# =========================
+# FastAPI integration
+# =========================
+class FastJSONResponse(JSONResponse):
+    """orjson でエンコードするレスポンス。dict を返すと jsonable_encoder を通るので、直接これを返す。"""
+
+    def render(self, content: Any) -> bytes:
+        return dumpb(content)
+
+
+class FastJSONRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = loads(await self.body())
+        return self._json
+
+
+class FastJSONRoute(APIRoute):
+    """リクエストボディを orjson でデコードするルート。"""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(FastJSONRequest(request.scope, request.receive))
+
+        return route_handler
@@ -0,0 +1,102 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+# =========================
+# Image fetch cache
+# =========================
+class ImageCache:
+    """
+    URL をキーにした画像キャッシュ（バイト数上限付き LRU）。
+    entry: {"data": bytes, "mime_type": str, "sha256": str, "phash": int|None,
+            "etag": str|None, "last_modified": str|None, "fetched_at": float}
+    fresh_seconds 以内に取得したものは再検証せずに使い、
+    それより古いものは ETag / Last-Modified で条件付き GET する。
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024, fresh_seconds: float = 300.0):
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() - entry["fetched_at"] < self.fresh_seconds
+
+    def conditional_headers(self, entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        if not entry:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def mark_revalidated(self, url: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        304 Not Modified を受けたエントリ（条件付き GET の前に読んだもの）の取得時刻を更新して返す。
+        再検証している間に追い出されていたら入れ直す。
+        """
+        entry["fetched_at"] = time.monotonic()
+        self.revalidated += 1
+        if url in self._entries:
+            self._entries.move_to_end(url)
+        else:
+            self._insert(url, entry)
+        return entry
+
+    def put(
+        self,
+        url: str,
+        data: bytes,
+        mime_type: str,
+        sha256: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        phash: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        entry = {
+            "data": data,
+            "mime_type": mime_type,
+            "sha256": sha256,
+            "phash": phash,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.monotonic(),
+        }
+        self._insert(url, entry)
+        return entry
+
+    def _insert(self, url: str, entry: Dict[str, Any]) -> None:
+        if len(entry["data"]) > self.max_bytes:
+            return
+        self._remove(url)
+        self._entries[url] = entry
+        self._bytes += len(entry["data"])
+        while self._entries and self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, url: str) -> None:
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._bytes -= len(entry["data"])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+        }
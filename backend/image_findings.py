@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from imaging import hamming_distance
+
+
+# =========================
+# Image finding cache
+# =========================
+# pHash（64 bit）を 8 bit ずつの帯に分けて索引にする。
+# ハミング距離が 7 以下なら少なくとも 1 つの帯は完全に一致する（鳩の巣原理）ので、候補を帯で絞れる
+PHASH_BANDS = 8
+PHASH_BAND_BITS = 64 // PHASH_BANDS
+
+
+def _bands(phash: int) -> List[Tuple[int, int]]:
+    mask = (1 << PHASH_BAND_BITS) - 1
+    return [(i, (phash >> (i * PHASH_BAND_BITS)) & mask) for i in range(PHASH_BANDS)]
+
+
+class ImageFindingCache:
+    """
+    画像ごとの指摘（ハイライトを持たない findings）を、画像内容の sha256 と pHash で引けるようにする LRU。
+    sha256 が一致すれば同じ画像として結果を使い回す。max_distance を 0 以上にすると、pHash のハミング距離が
+    それ以下の画像も再圧縮・縮小などのほぼ同じ画像として使い回す（既定の -1 では使わない）。
+    entry: {"sha256": str, "phash": int|None, "findings": [...]}
+    """
+
+    def __init__(self, max_entries: int = 4096, max_distance: int = -1):
+        self.max_entries = max_entries
+        # 帯による索引で確実に見つけられるのは距離 PHASH_BANDS - 1 まで
+        self.max_distance = min(max_distance, PHASH_BANDS - 1)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._index: Dict[Tuple[int, int], set] = {}
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def get(self, sha256: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(sha256)
+        if entry is not None:
+            self._entries.move_to_end(sha256)
+        return entry
+
+    def find_similar(self, phash: Optional[int]) -> Optional[Dict[str, Any]]:
+        """pHash が最も近い（max_distance 以下の）エントリ。"""
+        if phash is None or self.max_distance < 0:
+            return None
+        candidates = set()
+        for band in _bands(phash):
+            candidates |= self._index.get(band, set())
+        best: Optional[Tuple[int, str]] = None
+        for sha in candidates:
+            distance = hamming_distance(phash, self._entries[sha]["phash"])
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, sha)
+        return self.get(best[1]) if best else None
+
+    def put(self, sha256: str, phash: Optional[int], findings: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self._remove(sha256)
+        entry = {"sha256": sha256, "phash": phash, "findings": findings}
+        self._entries[sha256] = entry
+        if phash is not None:
+            for band in _bands(phash):
+                self._index.setdefault(band, set()).add(sha256)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        return entry
+
+    def _remove(self, sha256: str) -> None:
+        entry = self._entries.pop(sha256, None)
+        if entry is None or entry["phash"] is None:
+            return
+        for band in _bands(entry["phash"]):
+            shas = self._index.get(band)
+            if shas is not None:
+                shas.discard(sha256)
+                if not shas:
+                    del self._index[band]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "nearHits": self.near_hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,122 @@
+import io
+import math
+from typing import Optional, Tuple
+
+
+# =========================
+# MIME sniffing
+# =========================
+def sniff_mime(data: bytes) -> Optional[str]:
+    """
+    先頭のマジックバイトから画像の MIME タイプを判定する。
+    Gemini が受け付けない形式や画像でないもの（HTML のエラーページ等）は None。
+    """
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if len(data) >= 12 and data[4:8] == b"ftyp":
+        brand = data[8:12]
+        if brand in {b"heic", b"heix", b"hevc", b"hevx"}:
+            return "image/heic"
+        if brand in {b"mif1", b"msf1", b"heif"}:
+            return "image/heif"
+    return None
+
+
+# =========================
+# Downscaling
+# =========================
+def downscale_image(
+    data: bytes,
+    mime_type: str,
+    max_dimension: int,
+    quality: int = 85,
+) -> Tuple[bytes, str]:
+    """
+    長辺が max_dimension を超える画像を縮小して再エンコードする。
+    Pillow が無い場合・縮小不要な場合・デコードできない場合は入力をそのまま返す。
+    透過を持つ画像は PNG、それ以外は JPEG で再エンコードする。
+    """
+    if max_dimension <= 0 or mime_type not in {"image/png", "image/jpeg", "image/gif", "image/webp"}:
+        return data, mime_type
+    try:
+        from PIL import Image
+    except ImportError:
+        return data, mime_type
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if max(img.size) <= max_dimension:
+                return data, mime_type
+            img.seek(0)  # アニメーション GIF は先頭フレームのみ
+            has_alpha = img.mode in {"RGBA", "LA"} or (img.mode == "P" and "transparency" in img.info)
+            frame = img.convert("RGBA" if has_alpha else "RGB")
+            frame.thumbnail((max_dimension, max_dimension))
+
+            out = io.BytesIO()
+            if has_alpha:
+                frame.save(out, format="PNG", optimize=True)
+                return out.getvalue(), "image/png"
+            frame.save(out, format="JPEG", quality=quality, optimize=True)
+            return out.getvalue(), "image/jpeg"
+    except Exception as e:
+        print(f"[WARN] Failed to downscale image: {e}")
+        return data, mime_type
+
+
+# =========================
+# Perceptual hash
+# =========================
+PHASH_SIZE = 32
+PHASH_LOW = 8
+
+# DCT-II の係数表（PHASH_LOW x PHASH_SIZE）。低周波の 8 成分だけを使う
+_DCT = [
+    [math.cos(math.pi * (2 * x + 1) * u / (2 * PHASH_SIZE)) for x in range(PHASH_SIZE)]
+    for u in range(PHASH_LOW)
+]
+
+
+def perceptual_hash(data: bytes) -> Optional[int]:
+    """
+    画像の pHash（64 bit）。32x32 のグレースケールに縮小して DCT をとり、
+    低周波 8x8 成分（直流成分を除く）の中央値との大小をビットにする。
+    再圧縮・縮小・軽い色調の違いではハミング距離が小さいままになる。
+    Pillow が無い場合・デコードできない場合は None。
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.seek(0)
+            gray = img.convert("L").resize((PHASH_SIZE, PHASH_SIZE), Image.Resampling.LANCZOS)
+            pixels = list(gray.getdata())
+    except Exception as e:
+        print(f"[WARN] Failed to hash image: {e}")
+        return None
+
+    rows = [pixels[y * PHASH_SIZE:(y + 1) * PHASH_SIZE] for y in range(PHASH_SIZE)]
+    # 行方向 → 列方向の順に 1 次元 DCT をかける（必要な低周波成分だけ）
+    row_dct = [[sum(c * p for c, p in zip(_DCT[u], row)) for u in range(PHASH_LOW)] for row in rows]
+    coeffs = [
+        sum(_DCT[v][y] * row_dct[y][u] for y in range(PHASH_SIZE))
+        for v in range(PHASH_LOW)
+        for u in range(PHASH_LOW)
+    ]
+    median = sorted(coeffs[1:])[len(coeffs[1:]) // 2]
+    bits = 0
+    for c in coeffs:
+        bits = (bits << 1) | (1 if c > median else 0)
+    return bits
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
@@ -0,0 +1,78 @@
+import json
+from typing import Any, Dict, List, Optional
+
+
+# =========================
+# Incremental JSON scanning
+# =========================
+class ArrayItemStream:
+    """
+    生成途中の JSON テキストを少しずつ受け取り、
+    トップレベルオブジェクトの指定キー（既定 "findings"）の配列要素を
+    閉じた時点で 1 件ずつ取り出す。
+
+        parser = ArrayItemStream("findings")
+        for chunk in chunks:
+            for item in parser.feed(chunk):
+                ...
+
+    文字列中の括弧やエスケープは無視する。JSON 全体の妥当性は最後に json.loads で確認すること。
+    """
+
+    def __init__(self, key: str = "findings"):
+        self.key = key
+        self.buf = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = -1
+        self.last_string: Optional[str] = None
+        self.top_key: Optional[str] = None
+        self.in_array = False
+        self.item_start = -1
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.buf += chunk
+        items: List[Dict[str, Any]] = []
+        buf = self.buf
+        i = self.pos
+        while i < len(buf):
+            c = buf[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_string = buf[self.string_start + 1:i]
+            elif c == '"':
+                self.in_string = True
+                self.string_start = i
+            elif c == ":" and self.depth == 1:
+                self.top_key = self.last_string
+            elif c in "{[":
+                self.depth += 1
+                if c == "[" and self.depth == 2 and self.top_key == self.key:
+                    self.in_array = True
+                elif c == "{" and self.depth == 3 and self.in_array:
+                    self.item_start = i
+            elif c in "}]":
+                if c == "}" and self.depth == 3 and self.in_array and self.item_start >= 0:
+                    try:
+                        items.append(json.loads(buf[self.item_start:i + 1]))
+                    except ValueError:
+                        pass
+                    self.item_start = -1
+                elif c == "]" and self.depth == 2 and self.in_array:
+                    self.in_array = False
+                self.depth -= 1
+            i += 1
+        self.pos = i
+        return items
+
+    @property
+    def text(self) -> str:
+        return self.buf
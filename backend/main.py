@@ -2,20 +2,41 @@ import os
 import json
 import uuid
 import base64
+import codecs
+import hashlib
 import asyncio
 import httpx
-from typing import Any, Dict, List, Literal, Optional, Tuple
+from typing import Any, AsyncIterator, Callable, Dict, List, Literal, Optional, Set, Tuple, get_args
 import re
+from contextlib import aclosing, asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Path
+from fastapi import FastAPI, HTTPException, Path, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi import HTTPException
 from pydantic import BaseModel, Field
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from google import genai
-from google.genai import types
+
+from blocks import changed_block_indices, chunk_blocks, split_blocks, with_context
+from cache import content_digest, json_cache_from_env, normalize_text
+from compression import CompressionMiddleware
+from context_cache import ContextCache
+from fastjson import FastJSONResponse, FastJSONRoute
+import fastjson
+from image_cache import ImageCache
+from image_findings import ImageFindingCache
+from json_stream import ArrayItemStream
+from metrics import REGISTRY, MetricsMiddleware, record_model_call, stage
+from offload import LoopLagMonitor, OffloadBusy, Offloader
+from offsets import annotated_copy, apply_edits, remap_items, resolve_spans, shift_items
+from redact import Redactor, redact
+from imaging import downscale_image, perceptual_hash, sniff_mime
+from report import SEVERITIES, build_report, compact_report, dedupe_findings, merge_findings
+from scanner import prescan_note, scan_markdown
+from scheduler import SchedulerTimeout, SharedLane, current_lane, estimate_tokens, priority_lane, scheduler_from_env
+from store import check_store_from_env
 
 
 # =========================
@@ -24,16 +45,50 @@ from google.genai import types
 PROJECT = os.getenv("GOOGLE_CLOUD_PROJECT", "")
 LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
 MODEL_ID = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# 起動時（lifespan）に genai の import とクライアントの作成を済ませておく
+GENAI_WARMUP = os.getenv("GENAI_WARMUP", "1") in {"1", "true", "True"}
+
+# google.genai は import だけで時間がかかるので、最初に使うときまで読み込まない。
+# client は get_client() が作る（ベンチマーク等では差し替えてよい）
+client: Any = None
+
+
+def genai_types() -> Any:
+    from google.genai import types
 
-if not PROJECT:
-    raise RuntimeError("GOOGLE_CLOUD_PROJECT is required")
+    return types
 
-client = genai.Client(
-    vertexai=True,
-    project=PROJECT,
-    location=LOCATION,
-    http_options=types.HttpOptions(api_version="v1"),
-).aio
+
+def get_client() -> Any:
+    """
+    Vertex AI の genai クライアント（aio）を返す。最初の呼び出しで作る。
+    GOOGLE_CLOUD_PROJECT が無ければ 503 にする（mock モードはクライアントを使わないので設定不要）。
+    """
+    global client
+    if client is None:
+        if not PROJECT:
+            raise http_error(503, "MODEL_NOT_CONFIGURED", "GOOGLE_CLOUD_PROJECT is required")
+        from google import genai
+
+        client = genai.Client(
+            vertexai=True,
+            project=PROJECT,
+            location=LOCATION,
+            http_options=genai_types().HttpOptions(api_version="v1"),
+        ).aio
+    return client
+
+# すべてのモデル呼び出しの同時実行数・レート・再試行を管理する
+MODEL_SCHEDULER = scheduler_from_env()
+
+# 文書ごとの cached content（patch / persona-review / release で本文を送り直さない）
+CONTEXT_CACHE = ContextCache(
+    get_client,
+    MODEL_ID,
+    ttl_seconds=int(os.getenv("CONTEXT_CACHE_TTL", "900")),
+    min_chars=int(os.getenv("CONTEXT_CACHE_MIN_CHARS", "8000")),
+    enabled=os.getenv("CONTEXT_CACHE_ENABLED", "1") in {"1", "true", "True"},
+)
 
 
 # =========================
@@ -48,6 +103,8 @@ MockMode = Literal["auto", "on", "off"]
 Verdict = Literal["ok", "warn", "bad"]
 Severity = Literal["low", "medium", "high", "critical"]
 Persona = Literal["frontend", "security", "legal", "general"]
+# compact: report.highlights.items を省き、位置は findings[].highlights[] に入れる
+ResponseFormat = Literal["full", "compact"]
 
 
 # =========================
@@ -83,6 +140,14 @@ class PatchRequest(BaseModel):
     config: Optional[CheckConfig] = CheckConfig()
 
 
+class BulkPatchRequest(BaseModel):
+    checkId: str
+    # 省略時は report のすべての finding
+    findingIds: Optional[List[str]] = None
+    text: str = Field(min_length=1)
+    config: Optional[CheckConfig] = CheckConfig()
+
+
 class ReleaseRequest(BaseModel):
     checkId: str
     text: str = Field(min_length=1)
@@ -91,17 +156,59 @@ class ReleaseRequest(BaseModel):
 
 
 
+class RedactRequest(BaseModel):
+    text: str = Field(min_length=1)
+    mode: RedactMode = "light"
+
+
 class PersonaReviewRequest(BaseModel):
     text: str = Field(min_length=1)
     settings: CheckSettings
     config: Optional[CheckConfig] = CheckConfig()
 
 
+class PersonaReviewsRequest(BaseModel):
+    text: str = Field(min_length=1)
+    settings: CheckSettings
+    # 省略時は 4 つの audience すべて（settings.audience は無視される）
+    audiences: Optional[List[Audience]] = None
+    config: Optional[CheckConfig] = CheckConfig()
+
+
+class FullReviewRequest(BaseModel):
+    text: str = Field(min_length=1)
+    settings: CheckSettings
+    # ペルソナレビューする audience（省略時は settings.audience のみ）
+    audiences: Optional[List[Audience]] = None
+    config: Optional[CheckConfig] = CheckConfig()
+
+
+class BatchDocument(BaseModel):
+    # クライアント側の識別子（結果にそのまま返す）
+    id: Optional[str] = None
+    text: str = Field(min_length=1)
+
+
+class BatchCheckRequest(BaseModel):
+    documents: List[BatchDocument] = Field(min_length=1)
+    settings: CheckSettings
+    config: Optional[CheckConfig] = CheckConfig()
+
+
+# =========================
+# Check store
+# =========================
+# checkId -> {"text": str, "settings": dict, "report": dict, "blocks": [str, ...]}
+# CHECK_STORE_BACKEND=memory|sqlite|redis（既定は memory の LRU + TTL）
+CHECK_STORE = check_store_from_env()
+
+
 # =========================
-# In-memory store (MVP)
+# Result cache
 # =========================
-# checkId -> {"text": str, "settings": dict, "report": dict}
-CHECK_STORE: Dict[str, Dict[str, Any]] = {}
+# 同じ本文・設定・画像に対する check/recheck の結果を再利用する
+# RESULT_CACHE_BACKEND=memory|disk|redis|none, RESULT_CACHE_TTL 秒
+RESULT_CACHE = json_cache_from_env("RESULT_CACHE", default_ttl=3600.0)
 
 
 # =========================
@@ -119,6 +226,10 @@ def new_release_id() -> str:
     return f"rel_{uuid.uuid4().hex[:16]}"
 
 
+def new_job_id() -> str:
+    return f"job_{uuid.uuid4().hex[:16]}"
+
+
 def should_mock(mode: MockMode) -> bool:
     if mode == "on":
         return True
@@ -132,6 +243,44 @@ def http_error(status: int, code: str, message: str) -> HTTPException:
     return HTTPException(status_code=status, detail={"error": code, "message": message})
 
 
+# =========================
+# Offload (CPU-bound work)
+# =========================
+# 大きな本文の走査・ハイライト位置の計算・大きな JSON の読み込み・伏せ字化・画像の処理をイベントループの外で実行する
+# thread | process | inline（ループ上でそのまま実行する）
+OFFLOAD_EXECUTOR = os.getenv("OFFLOAD_EXECUTOR", "thread")
+OFFLOAD_WORKERS = int(os.getenv("OFFLOAD_WORKERS", str(min(4, os.cpu_count() or 1))))
+# プールごとに送り込める件数（実行中を含む）と、空きを待つ秒数（過ぎたら 503）
+OFFLOAD_MAX_PENDING = int(os.getenv("OFFLOAD_MAX_PENDING", "64"))
+OFFLOAD_QUEUE_TIMEOUT = float(os.getenv("OFFLOAD_QUEUE_TIMEOUT", "10"))
+# これより短い本文・JSON はその場で処理する（受け渡しのほうが高くつく）
+OFFLOAD_MIN_CHARS = int(os.getenv("OFFLOAD_MIN_CHARS", "4096"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "4"))
+
+CPU_POOL = Offloader(
+    "cpu", OFFLOAD_EXECUTOR, OFFLOAD_WORKERS, OFFLOAD_MAX_PENDING, OFFLOAD_QUEUE_TIMEOUT, OFFLOAD_MIN_CHARS
+)
+# Pillow はデコード・縮小の間 GIL を離すのでスレッドで足りる（process_image は main の設定を読むので別プロセスには送らない）
+IMAGE_POOL = Offloader(
+    "image", "inline" if OFFLOAD_EXECUTOR == "inline" else "thread", IMAGE_WORKERS, OFFLOAD_MAX_PENDING, OFFLOAD_QUEUE_TIMEOUT
+)
+
+# イベントループがこの時間以上止まったらログに出す（止めている処理のスタックも出す）
+LOOP_LAG_MONITOR = os.getenv("LOOP_LAG_MONITOR", "1") in {"1", "true", "True"}
+LOOP_LAG = LoopLagMonitor(
+    interval=float(os.getenv("LOOP_LAG_INTERVAL_MS", "50")) / 1000,
+    threshold=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")) / 1000,
+)
+
+
+async def offload(pool: Offloader, fn: Any, *args: Any, size: Optional[int] = None) -> Any:
+    """pool で fn(*args) を実行する。size が小さければその場で実行し、待ち行列が埋まっていれば 503 にする。"""
+    try:
+        return await pool.run(fn, *args, size=size)
+    except OffloadBusy as e:
+        raise http_error(503, "SERVER_BUSY", str(e))
+
+
 # =========================
 # Image processing helpers
 # =========================
@@ -145,61 +294,258 @@ def extract_image_urls(markdown: str) -> List[Tuple[str, str]]:
     return IMAGE_URL_PATTERN.findall(markdown)
 
 
-async def download_image(url: str, timeout: float = 10.0) -> Optional[Tuple[bytes, str]]:
-    """
-    画像をダウンロードしてバイトデータとMIMEタイプを返す。
-    失敗した場合はNoneを返す。
-    """
+# 画像取得用の共有クライアント（アプリ起動時に作成し、終了時に閉じる）
+IMAGE_HTTP_TIMEOUT = float(os.getenv("IMAGE_HTTP_TIMEOUT", "10"))
+IMAGE_HTTP_MAX_CONNECTIONS = int(os.getenv("IMAGE_HTTP_MAX_CONNECTIONS", "100"))
+IMAGE_HTTP_MAX_KEEPALIVE = int(os.getenv("IMAGE_HTTP_MAX_KEEPALIVE", "20"))
+# 同一ホストへの同時接続数の上限（CDN / オリジンを叩きすぎないため）
+IMAGE_HTTP_PER_HOST = int(os.getenv("IMAGE_HTTP_PER_HOST", "6"))
+# auto: h2 パッケージがあれば HTTP/2 を使う
+IMAGE_HTTP2 = os.getenv("IMAGE_HTTP2", "auto").lower()
+
+_image_http_client: Optional[httpx.AsyncClient] = None
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def _http2_enabled() -> bool:
+    if IMAGE_HTTP2 in {"0", "false", "off"}:
+        return False
     try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
 
+def image_http_client() -> httpx.AsyncClient:
+    """
+    画像ダウンロード用の共有 AsyncClient を返す。
+    通常は lifespan で作成済みだが、未作成なら遅延生成する。
+    """
+    global _image_http_client
+    if _image_http_client is None or _image_http_client.is_closed:
         default_ua = "MyTool/1.0 (dev@company.com)"
         user_agent = os.getenv("USER_AGENT", default_ua)
-        
+
         headers = {
             "User-Agent": user_agent,
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
             "Accept-Language": "en-US,en;q=0.9",
         }
-        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True, headers=headers) as client:
-            resp = await client.get(url)
-            resp.raise_for_status()
-
-            # MIMEタイプを判定
-            content_type = resp.headers.get("content-type", "").lower()
-            if "png" in content_type:
-                mime_type = "image/png"
-            elif "gif" in content_type:
-                mime_type = "image/gif"
-            elif "webp" in content_type:
-                mime_type = "image/webp"
-            else:
-                mime_type = "image/jpeg"  # デフォルト
+        _image_http_client = httpx.AsyncClient(
+            timeout=IMAGE_HTTP_TIMEOUT,
+            follow_redirects=True,
+            headers=headers,
+            http2=_http2_enabled(),
+            limits=httpx.Limits(
+                max_connections=IMAGE_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=IMAGE_HTTP_MAX_KEEPALIVE,
+            ),
+        )
+    return _image_http_client
 
-            return resp.content, mime_type
+
+async def close_image_http_client() -> None:
+    global _image_http_client
+    if _image_http_client is not None:
+        await _image_http_client.aclose()
+        _image_http_client = None
+
+
+def host_semaphore(url: str) -> asyncio.Semaphore:
+    host = httpx.URL(url).host
+    sem = _host_semaphores.get(host)
+    if sem is None:
+        sem = asyncio.Semaphore(IMAGE_HTTP_PER_HOST)
+        _host_semaphores[host] = sem
+    return sem
+
+
+# ダウンロードする画像 1 枚あたりの上限バイト数
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+# モデルに送る前に長辺をこのピクセル数まで縮小する（0 で無効）
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1536"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# URL -> 画像データのキャッシュ（ETag / Last-Modified で再検証する）
+IMAGE_CACHE = ImageCache(
+    max_bytes=int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(128 * 1024 * 1024))),
+    fresh_seconds=float(os.getenv("IMAGE_CACHE_FRESH_SECONDS", "300")),
+)
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+async def read_limited(resp: httpx.Response, limit: int) -> bytes:
+    """
+    レスポンス本文をストリームで読み、limit バイトを超えた時点で打ち切る。
+    Content-Length が分かっていれば読み始める前に判定する。
+    """
+    length = resp.headers.get("content-length")
+    if length and length.isdigit() and int(length) > limit:
+        raise ImageTooLarge(f"Content-Length {length} exceeds {limit} bytes")
+
+    buf = bytearray()
+    async for chunk in resp.aiter_bytes():
+        buf.extend(chunk)
+        if len(buf) > limit:
+            raise ImageTooLarge(f"body exceeds {limit} bytes")
+    return bytes(buf)
+
+
+# URL -> 進行中のダウンロード（同時に同じ画像を要求されたら 1 回の取得を共有する）
+_image_downloads: Dict[str, "asyncio.Task[Optional[Dict[str, Any]]]"] = {}
+
+
+async def download_image(url: str, timeout: float = IMAGE_HTTP_TIMEOUT) -> Optional[Dict[str, Any]]:
+    """
+    _download_image の結果を、同じ URL を同時に要求した呼び出し間で共有する。
+    待っている側がキャンセルされても取得自体は止めない。
+    """
+    task = _image_downloads.get(url)
+    if task is None:
+        task = asyncio.ensure_future(_download_image(url, timeout))
+        _image_downloads[url] = task
+        task.add_done_callback(lambda _: _image_downloads.pop(url, None))
+    return await asyncio.shield(task)
+
+
+async def _download_image(url: str, timeout: float = IMAGE_HTTP_TIMEOUT) -> Optional[Dict[str, Any]]:
+    """
+    画像をダウンロードして {"data": bytes, "mime_type": str, "sha256": str} を返す。
+    sha256 は元画像のダイジェスト、data はモデル送信用に縮小済みのバイト列。
+    キャッシュ済みの画像は条件付き GET で再検証し、304 なら再ダウンロードしない。
+    失敗した場合・画像でない場合・サイズ上限を超えた場合はNoneを返す。
+    """
+    cached = IMAGE_CACHE.get(url)
+    if cached is not None and IMAGE_CACHE.is_fresh(cached):
+        IMAGE_CACHE.hits += 1
+        return cached
+
+    try:
+        async with host_semaphore(url):
+            async with image_http_client().stream(
+                "GET",
+                url,
+                timeout=timeout,
+                headers=IMAGE_CACHE.conditional_headers(cached),
+            ) as resp:
+                if resp.status_code == 304 and cached is not None:
+                    return IMAGE_CACHE.mark_revalidated(url, cached)
+                resp.raise_for_status()
+                raw = await read_limited(resp, IMAGE_MAX_BYTES)
+                etag = resp.headers.get("etag")
+                last_modified = resp.headers.get("last-modified")
+
+        # MIMEタイプは content-type ではなく実データのマジックバイトで判定する
+        mime_type = sniff_mime(raw)
+        if mime_type is None:
+            print(f"[WARN] Skipped non-image content {url}")
+            return None
+
+        with stage("image_process"):
+            data, mime_type, sha256, phash = await offload(IMAGE_POOL, process_image, raw, mime_type)
+        IMAGE_CACHE.misses += 1
+        return IMAGE_CACHE.put(url, data, mime_type, sha256, etag=etag, last_modified=last_modified, phash=phash)
+    except HTTPException:
+        # プールが埋まっている場合は画像を落とさずにリクエストごと 503 にする
+        raise
     except Exception as e:
         print(f"[WARN] Failed to download image {url}: {e}")
         return None
 
 
+def process_image(raw: bytes, mime_type: str) -> Tuple[bytes, str, str, Optional[int]]:
+    """ハッシュ・縮小・pHash の計算（CPU を使うので IMAGE_POOL で実行する）。"""
+    sha256 = hashlib.sha256(raw).hexdigest()
+    data, mime_type = downscale_image(raw, mime_type, IMAGE_MAX_DIMENSION, IMAGE_JPEG_QUALITY)
+    # pHash は近い画像を探すときだけ使うので、無効なら計算しない
+    phash = perceptual_hash(data) if IMAGE_ANALYSIS == "per-image" and IMAGE_PHASH_MAX_DISTANCE >= 0 else None
+    return data, mime_type, sha256, phash
+
+
 async def fetch_images_from_markdown(markdown: str) -> List[Dict[str, Any]]:
     """
     Markdownから画像URLを抽出し、並列でダウンロードする。
-    Returns: [{"url": str, "alt": str, "data": bytes, "mime_type": str}, ...]
+    同じURLが複数回出てきても取得は1回だけ行う。
+    Returns: [{"url": str, "alt": str, "data": bytes, "mime_type": str, "sha256": str, "phash": int|None}, ...]
     """
-    image_refs = extract_image_urls(markdown)
+    image_refs = await offload(CPU_POOL, extract_image_urls, markdown, size=len(markdown))
     if not image_refs:
         return []
 
-    async def fetch_one(alt: str, url: str) -> Optional[Dict[str, Any]]:
-        result = await download_image(url)
+    urls = list(dict.fromkeys(url for _, url in image_refs))
+    with stage("image_fetch"):
+        downloaded = dict(zip(urls, await asyncio.gather(*(download_image(url) for url in urls))))
+
+    images: List[Dict[str, Any]] = []
+    for alt, url in image_refs:
+        result = downloaded.get(url)
         if result:
-            data, mime_type = result
-            return {"url": url, "alt": alt, "data": data, "mime_type": mime_type}
-        return None
+            images.append({
+                "url": url,
+                "alt": alt,
+                "data": result["data"],
+                "mime_type": result["mime_type"],
+                "sha256": result["sha256"],
+                "phash": result.get("phash"),
+            })
+    return images
+
+
+def check_cache_key(text: str, settings: CheckSettings, images: List[Dict[str, Any]]) -> str:
+    """
+    check 結果のキャッシュキー。
+    本文（正規化済み）・設定・モデル・システムプロンプト・画像内容のダイジェストから作る。
+    """
+    image_digests = ",".join(img["sha256"] for img in images)
+    return content_digest(
+        "check",
+        MODEL_ID,
+        CHECK_SYSTEM,
+        json.dumps(settings.model_dump(), sort_keys=True),
+        normalize_text(text),
+        image_digests,
+    )
+
+
+async def parse_model_output(resp: Any) -> Dict[str, Any]:
+    """モデルの応答テキストを JSON として読み、呼び出しの成功とトークン数を記録する。"""
+    with stage("parse"):
+        text = resp.text
+        out = await offload(CPU_POOL, fastjson.loads, text, size=len(text))
+    record_model_call(MODEL_ID, "ok", getattr(resp, "usage_metadata", None))
+    return out
+
+
+def model_error(e: Exception) -> HTTPException:
+    """モデル呼び出しの例外を API のエラーに変換し、失敗の種類を記録する。"""
+    if isinstance(e, HTTPException):
+        return e
+
+    if isinstance(e, json.JSONDecodeError):
+        record_model_call(MODEL_ID, "bad_output")
+        return http_error(502, "BAD_MODEL_OUTPUT", "Model returned non-JSON output")
+
+    if isinstance(e, SchedulerTimeout):
+        record_model_call(MODEL_ID, "queue_timeout")
+        return HTTPException(status_code=429, detail={"error": "RESOURCE_EXHAUSTED", "message": str(e)})
 
-    tasks = [fetch_one(alt, url) for alt, url in image_refs]
-    results = await asyncio.gather(*tasks)
-    return [r for r in results if r is not None]
+    msg = str(e)
+
+    # Vertex AI が 429 RESOURCE_EXHAUSTED を返した場合は 429 で返す
+    # 例: "429 RESOURCE_EXHAUSTED. {...}"
+    if "429" in msg and "RESOURCE_EXHAUSTED" in msg:
+        record_model_call(MODEL_ID, "rate_limited")
+        return HTTPException(
+            status_code=429,
+            detail={"error": "RESOURCE_EXHAUSTED", "message": msg},
+        )
+
+    record_model_call(MODEL_ID, "error")
+    return http_error(500, "INTERNAL_ERROR", msg)
 
 
 async def gemini_json(system_instruction: str, user_prompt: str, schema: Dict[str, Any]) -> Dict[str, Any]:
@@ -208,40 +554,55 @@ async def gemini_json(system_instruction: str, user_prompt: str, schema: Dict[st
     schema は response_schema に渡す。
     """
     try:
-        resp = await client.models.generate_content(
-            model=MODEL_ID,
-            contents=user_prompt,
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                temperature=0.2,
-                response_mime_type="application/json",
-                response_schema=schema,
-            ),
-        )
-        return json.loads(resp.text)
-
-    except json.JSONDecodeError:
-        raise http_error(502, "BAD_MODEL_OUTPUT", "Model returned non-JSON output")
+        with stage("model"):
+            # 設定の不備（503 MODEL_NOT_CONFIGURED）を再試行しないよう、クライアントは実行枠の外で用意する
+            models = get_client().models
+            resp = await MODEL_SCHEDULER.run(
+                lambda: models.generate_content(
+                    model=MODEL_ID,
+                    contents=user_prompt,
+                    config=genai_types().GenerateContentConfig(
+                        system_instruction=system_instruction,
+                        temperature=0.2,
+                        response_mime_type="application/json",
+                        response_schema=schema,
+                    ),
+                ),
+                tokens=estimate_tokens(user_prompt),
+            )
+        return await parse_model_output(resp)
 
     except Exception as e:
-        msg = str(e)
+        raise model_error(e)
 
-        # Vertex AI が 429 RESOURCE_EXHAUSTED を返した場合は 429 で返す
-        # 例: "429 RESOURCE_EXHAUSTED. {...}"
-        if "429" in msg and "RESOURCE_EXHAUSTED" in msg:
-            raise HTTPException(
-                status_code=429,
-                detail={"error": "RESOURCE_EXHAUSTED", "message": msg},
-            )
 
-        raise http_error(500, "INTERNAL_ERROR", msg)
+def multimodal_contents(user_prompt: str, images: List[Dict[str, Any]], labels: bool = True) -> List[Any]:
+    """
+    テキスト + 画像のコンテンツを構築する。
+    images: [{"url": str, "alt": str, "data": bytes, "mime_type": str}, ...]
+    labels=False なら画像の後に alt / URL の説明を付けない（画像の内容だけで判断させる場合）。
+    """
+    contents: List[Any] = [user_prompt]
+
+    for img in images:
+        # 画像データをbase64エンコードしてPartとして追加
+        img_part = genai_types().Part.from_bytes(
+            data=img["data"],
+            mime_type=img["mime_type"]
+        )
+        contents.append(img_part)
+        # 画像の説明を追加
+        if labels:
+            contents.append(f"\n[上記は画像: {img['alt'] or img['url']} ]\n")
+    return contents
 
 
 async def gemini_json_multimodal(
     system_instruction: str,
     user_prompt: str,
     images: List[Dict[str, Any]],
-    schema: Dict[str, Any]
+    schema: Dict[str, Any],
+    labels: bool = True,
 ) -> Dict[str, Any]:
     """
     Gemini に画像を含むマルチモーダル入力でJSON生成を要求する。
@@ -249,41 +610,129 @@ async def gemini_json_multimodal(
     """
     try:
         # コンテンツを構築: テキスト + 画像
-        contents = [user_prompt]
-
-        for img in images:
-            # 画像データをbase64エンコードしてPartとして追加
-            img_part = types.Part.from_bytes(
-                data=img["data"],
-                mime_type=img["mime_type"]
+        contents = multimodal_contents(user_prompt, images, labels)
+
+        with stage("model"):
+            # 設定の不備（503 MODEL_NOT_CONFIGURED）を再試行しないよう、クライアントは実行枠の外で用意する
+            models = get_client().models
+            resp = await MODEL_SCHEDULER.run(
+                lambda: models.generate_content(
+                    model=MODEL_ID,
+                    contents=contents,
+                    config=genai_types().GenerateContentConfig(
+                        system_instruction=system_instruction,
+                        temperature=0.2,
+                        response_mime_type="application/json",
+                        response_schema=schema,
+                    ),
+                ),
+                tokens=estimate_tokens(contents),
             )
-            contents.append(img_part)
-            # 画像の説明を追加
-            contents.append(f"\n[上記は画像: {img['alt'] or img['url']} ]\n")
+        return await parse_model_output(resp)
 
-        resp = await client.models.generate_content(
-            model=MODEL_ID,
-            contents=contents,
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                temperature=0.2,
-                response_mime_type="application/json",
-                response_schema=schema,
-            ),
-        )
-        return json.loads(resp.text)
+    except Exception as e:
+        raise model_error(e)
 
-    except json.JSONDecodeError:
-        raise http_error(502, "BAD_MODEL_OUTPUT", "Model returned non-JSON output")
+
+async def gemini_json_stream(
+    system_instruction: str,
+    contents: Any,
+    schema: Dict[str, Any],
+) -> AsyncIterator[str]:
+    """
+    Gemini の generate_content_stream で JSON を生成し、テキスト断片を順に返す。
+    断片をつなげたものが response_schema に沿った JSON になる。
+    """
+    try:
+        # ストリームは途中から再試行できないので、実行枠だけ確保して 1 回で流す
+        usage = None
+        with stage("model_stream"):
+            models = get_client().models
+            async with MODEL_SCHEDULER.slot(tokens=estimate_tokens(contents)):
+                stream = await models.generate_content_stream(
+                    model=MODEL_ID,
+                    contents=contents,
+                    config=genai_types().GenerateContentConfig(
+                        system_instruction=system_instruction,
+                        temperature=0.2,
+                        response_mime_type="application/json",
+                        response_schema=schema,
+                    ),
+                )
+                async for chunk in stream:
+                    # usage_metadata は最後のチャンクに入る
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    if chunk.text:
+                        yield chunk.text
+        record_model_call(MODEL_ID, "ok", usage)
 
     except Exception as e:
-        msg = str(e)
-        if "429" in msg and "RESOURCE_EXHAUSTED" in msg:
-            raise HTTPException(
-                status_code=429,
-                detail={"error": "RESOURCE_EXHAUSTED", "message": msg},
+        raise model_error(e)
+
+
+async def gemini_json_cached(
+    system_instruction: str,
+    cached_content: str,
+    delta_prompt: str,
+    schema: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    cached content（文書本体）に差分プロンプトだけを足して JSON 生成を要求する。
+    cached content を使うリクエストには system_instruction を付けられないため、指示はユーザー側に入れる。
+    """
+    prompt = f"[instructions]\n{system_instruction.strip()}\n\n{delta_prompt}"
+    try:
+        with stage("model"):
+            # 設定の不備（503 MODEL_NOT_CONFIGURED）を再試行しないよう、クライアントは実行枠の外で用意する
+            models = get_client().models
+            resp = await MODEL_SCHEDULER.run(
+                lambda: models.generate_content(
+                    model=MODEL_ID,
+                    contents=prompt,
+                    config=genai_types().GenerateContentConfig(
+                        cached_content=cached_content,
+                        temperature=0.2,
+                        response_mime_type="application/json",
+                        response_schema=schema,
+                    ),
+                ),
+                tokens=estimate_tokens(prompt),
             )
-        raise http_error(500, "INTERNAL_ERROR", msg)
+        return await parse_model_output(resp)
+
+    except Exception as e:
+        raise model_error(e)
+
+
+async def gemini_json_for_document(
+    system_instruction: str,
+    text: str,
+    delta_prompt: str,
+    schema: Dict[str, Any],
+    saved: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    文書 text に対する追加のリクエスト（patch / persona / release）を送る。
+    文書の cached content が使えれば差分だけを送り、使えなければ本文込みのプロンプトで送る。
+    saved を渡すと、使ったハンドルをそのエントリに記録する（呼び出し側で保存すること）。
+    """
+    known = saved.get("contextCache") if saved else None
+    handle = await CONTEXT_CACHE.handle_for(text, known)
+    if handle:
+        if saved is not None:
+            saved["contextCache"] = handle
+        try:
+            return await gemini_json_cached(system_instruction, handle["name"], delta_prompt, schema)
+        except HTTPException as e:
+            if e.status_code == 429:
+                raise
+            # 期限切れ・削除済みなどで使えなかった場合は本文込みで送り直す
+            print(f"[WARN] Context cache {handle['name']} unusable: {e.detail}")
+            await CONTEXT_CACHE.invalidate(handle)
+            if saved is not None:
+                saved.pop("contextCache", None)
+
+    return await gemini_json(system_instruction, f"{delta_prompt}\n[markdown]\n{text}\n", schema)
 
 
 def pick_finding(report: Dict[str, Any], finding_id: str) -> Optional[Dict[str, Any]]:
@@ -378,15 +827,57 @@ PATCH_GEN_SCHEMA: Dict[str, Any] = {
     "required": ["originalText", "replacement"],
 }
 
-RELEASE_SCHEMA: Dict[str, Any] = {
+# 画像 1 枚ごとの指摘（ハイライトは本文中の画像 URL をあとから付ける）
+IMAGE_FINDINGS_SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "properties": {
+        "findings": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "category": {"type": "STRING"},
+                    "severity": {"type": "STRING", "enum": ["low", "medium", "high", "critical"]},
+                    "title": {"type": "STRING"},
+                    "reason": {"type": "STRING"},
+                    "suggestion": {"type": "STRING"},
+                    "tags": {"type": "ARRAY", "items": {"type": "STRING"}},
+                },
+                "required": ["category", "severity", "title", "reason", "suggestion"],
+            },
+        },
+    },
+    "required": ["findings"],
+}
+
+PATCH_BULK_SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "properties": {
+        "patches": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "findingId": {"type": "STRING"},
+                    "originalText": {"type": "STRING"},
+                    "replacement": {"type": "STRING"},
+                    "note": {"type": "STRING"},
+                },
+                "required": ["findingId", "originalText", "replacement"],
+            },
+        },
+    },
+    "required": ["patches"],
+}
+
+# safeMarkdown はローカルで組み立てるので、モデルには要約とチェックリストだけを出させる
+RELEASE_SUMMARY_SCHEMA: Dict[str, Any] = {
     "type": "OBJECT",
     "properties": {
-        "safeMarkdown": {"type": "STRING"},
         "fixSummary": {"type": "ARRAY", "items": {"type": "STRING"}},
         "checklist": {"type": "ARRAY", "items": {"type": "STRING"}},
-        "publishedScope": {"type": "STRING", "enum": ["public", "unlisted", "private", "internal"]},
     },
-    "required": ["safeMarkdown", "fixSummary", "checklist", "publishedScope"],
+    "required": ["fixSummary", "checklist"],
 }
 
 
@@ -555,10 +1046,28 @@ PATCH_SYSTEM = """
 originalText は入力テキスト内に存在する文字列と完全一致させてください。
 """
 
-RELEASE_SYSTEM = """
-あなたは公開用の最終整形器です。
-入力Markdownと settings を受け取り、安全版Markdown、修正サマリ、公開前チェックリストを作成してください。
-返答は JSON のみです。publishedScope は settings.publishScope に一致させてください。
+IMAGE_SYSTEM = """
+あなたは技術ブログに掲載される画像のレビューアです。
+1 枚の画像を受け取り、その画像だけを見て、公開前に問題になる点を findings に列挙してください（問題が無ければ空の配列）。
+観点: 写り込んだ個人情報（顔・名刺・住所・電話番号）、APIキー・パスワード・社内システムの画面などの機密情報、
+著作権・ライセンスの懸念、倫理的・文化的な問題、画像内のテキストや図表の不適切な表現。
+category は privacy / security / legal / ethics / quality のいずれか、title・reason・suggestion は日本語で書いてください。
+返答は JSON のみです。
+"""
+
+PATCH_BULK_SYSTEM = """
+あなたは文章修正パッチ生成器です。
+入力として Markdown 全文と、複数の指摘（findings）が与えられます。
+返答は JSON のみです。各指摘の highlights それぞれについて patches に 1 件ずつ出力してください。
+findingId は指摘の id、originalText は置換対象の原文、replacement は置換後の新しい文字列です。
+originalText は入力テキスト内に存在する文字列と完全一致させ、他の patch の originalText と重ならないようにしてください。
+"""
+
+RELEASE_SUMMARY_SYSTEM = """
+あなたは公開前の最終確認担当です。
+settings、適用済みの修正（applied: 指摘と修正前後の文字列）、未対応の指摘（remaining）、伏せ字にした種類ごとの件数（redacted）を受け取ります。
+fixSummary には適用した修正を 1 件 1 文で、checklist には公開前に人が確認すべき項目を、日本語で短く列挙してください。
+返答は JSON のみです。本文の書き直しは不要です。
 """
 
 PERSONA_SYSTEM = """
@@ -579,105 +1088,1424 @@ def format_settings(s: CheckSettings) -> str:
     )
 
 
-# =========================
-# FastAPI
-# =========================
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import APIKeyHeader
-from fastapi import Security, Depends, HTTPException, status
+# 進行中の check（同じ本文・設定の check を同時に要求されたら 1 回の処理を共有する）
+_inflight_checks: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+# 共有中のチェックの優先度（バッチで始まったチェックに対話的な要求が相乗りしたら引き上げる）
+_inflight_lanes: Dict[str, SharedLane] = {}
 
-# API Key Auth
-API_KEY_NAME = "x-api-key"
-api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 
-async def get_api_key(api_key_header: str = Security(api_key_header)):
-    expected_api_key = os.getenv("API_KEY")
-    # Only enforce if API_KEY is set in environment (e.g. Cloud Run)
-    if expected_api_key:
-        if not api_key_header or api_key_header != expected_api_key:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Could not validate credentials",
-            )
-    return api_key_header
+def inflight_check_key(text: str, settings: CheckSettings, prompt: str, images: Optional[List[Dict[str, Any]]]) -> str:
+    """進行中の check を共有するためのキー。画像は取得前なので、渡された場合だけダイジェストを含める。"""
+    image_digests = "-" if images is None else ",".join(img["sha256"] for img in images)
+    return content_digest(
+        "check-inflight",
+        json.dumps(settings.model_dump(), sort_keys=True),
+        normalize_text(text),
+        normalize_text(prompt),
+        image_digests,
+    )
 
-app = FastAPI(
-    title="Blog Risk Checker API", 
-    version="0.2.0",
-    dependencies=[Depends(get_api_key)]
-)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["https://blog-risk-checker.web.app", "http://localhost:5173"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def run_check(
+    text: str,
+    settings: CheckSettings,
+    prompt: str,
+    images: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    _run_check の結果を、同じ本文・設定で同時に要求された呼び出し間で共有する。
+    待っている側がキャンセルされても（クライアントの切断など）処理自体は止めない。
+    共有中の処理の優先度は、相乗りした呼び出し元のうち一番高いものに合わせる。
+    返す report は共有されるので、呼び出し側はコピーしてから変更すること（with_offsets はコピーする）。
+    """
+    key = inflight_check_key(text, settings, prompt, images)
+    task = _inflight_checks.get(key)
+    if task is None:
+        lane = SharedLane(current_lane())
+        with priority_lane(lane):
+            task = asyncio.ensure_future(_run_check(text, settings, prompt, images))
+        _inflight_checks[key] = task
+        _inflight_lanes[key] = lane
+
+        def done(_: Any) -> None:
+            _inflight_checks.pop(key, None)
+            _inflight_lanes.pop(key, None)
+
+        task.add_done_callback(done)
+    else:
+        CHECKS_COALESCED.inc()
+        _inflight_lanes[key].raise_to(current_lane())
+    return await asyncio.shield(task)
 
-@app.post("/v1/checks")
-async def create_check(req: CreateCheckRequest):
-    mode = req.config.mock if req.config else "auto"
-    if should_mock(mode):
-        check_id = new_check_id()
-        CHECK_STORE[check_id] = {"text": req.text, "settings": req.settings.model_dump(), "report": MOCK_REPORT}
-        return {"checkId": check_id, "report": MOCK_REPORT}
 
-    prompt = f"[settings]\n{format_settings(req.settings)}\n[markdown]\n{req.text}\n"
+async def _run_check(
+    text: str,
+    settings: CheckSettings,
+    prompt: str,
+    images: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    画像を取得して Gemini で report を生成する。
+    images を渡した場合はそれを使う（取得済みの画像を他の処理と共有するため）。
+    同じ本文・設定・画像の結果が RESULT_CACHE にあればモデルを呼ばずに返す。
+    ローカル検査の findings はモデルの findings とマージする。
+    """
+    with stage("prescan"):
+        local = await offload(CPU_POOL, scan_markdown, text, size=len(text)) if PRESCAN_ENABLED else []
+    if prescan_short_circuits(local):
+        return build_report(local)
 
     # 画像URLを自動検出してダウンロード
-    images = await fetch_images_from_markdown(req.text)
+    if images is None:
+        images = await fetch_images_from_markdown(text)
 
-    if images:
-        # 画像がある場合はマルチモーダルでチェック
-        prompt += f"\n[images]\n{len(images)}枚の画像が含まれています。各画像の内容もチェックしてください。\n"
-        report = await gemini_json_multimodal(CHECK_SYSTEM, prompt, images, REPORT_SCHEMA)
+    cache_key = check_cache_key(text, settings, images)
+    with stage("result_cache"):
+        cached = await RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if len(text) > LONG_DOC_THRESHOLD:
+        report = await run_chunked_check(text, settings, images, prescan_note(local))
     else:
-        # 画像がない場合は従来通り
-        report = await gemini_json(CHECK_SYSTEM, prompt, REPORT_SCHEMA)
+        report = await generate_report(prompt + prescan_note(local), images)
+    if local:
+        report = build_report(merge_findings(local, report.get("findings", [])))
 
-    check_id = new_check_id()
-    CHECK_STORE[check_id] = {"text": req.text, "settings": req.settings.model_dump(), "report": report}
-    return {"checkId": check_id, "report": report}
+    await RESULT_CACHE.set(cache_key, report)
+    return report
 
 
-@app.post("/v1/checks/{checkId}/recheck")
-async def recheck(
-    checkId: str = Path(..., description="checkId from /v1/checks"),
-    req: RecheckRequest = None,
-):
-    mode = req.config.mock if req and req.config else "auto"
-    if should_mock(mode):
-        CHECK_STORE[checkId] = {"text": req.text, "settings": req.settings.model_dump(), "report": MOCK_REPORT}
-        return {"checkId": checkId, "report": MOCK_REPORT}
+# =========================
+# Long documents (map-reduce)
+# =========================
+# 本文がこの文字数を超えたらチャンクに分けて並列にチェックする
+LONG_DOC_THRESHOLD = int(os.getenv("LONG_DOC_THRESHOLD", "20000"))
+LONG_DOC_CHUNK_CHARS = int(os.getenv("LONG_DOC_CHUNK_CHARS", "8000"))
+# 各チャンクの先頭に重ねる直前チャンクのブロック数
+LONG_DOC_OVERLAP_BLOCKS = int(os.getenv("LONG_DOC_OVERLAP_BLOCKS", "1"))
+LONG_DOC_CONCURRENCY = int(os.getenv("LONG_DOC_CONCURRENCY", "4"))
 
-    prompt = (
-        f"[checkId]\n{checkId}\n\n"
-        f"[settings]\n{format_settings(req.settings)}\n"
-        f"[markdown]\n{req.text}\n"
-    )
 
-    # 画像URLを自動検出してダウンロード
-    images = await fetch_images_from_markdown(req.text)
+async def run_chunked_check(
+    text: str,
+    settings: CheckSettings,
+    images: List[Dict[str, Any]],
+    note: str = "",
+) -> Dict[str, Any]:
+    """
+    長い文書を Markdown の構造に沿ってチャンクに分け、並列にチェックしてマージする。
+    画像は自分の担当ブロックに出てくるチャンクにだけ送る。
+    マージでは重複した指摘をまとめ、本文中の位置順に並べてから id・summary・verdict・score を振り直す。
+    """
+    blocks = split_blocks(text)
+    chunks = chunk_blocks(blocks, LONG_DOC_CHUNK_CHARS, LONG_DOC_OVERLAP_BLOCKS)
+    sem = asyncio.Semaphore(LONG_DOC_CONCURRENCY)
+
+    async def check_chunk(n: int, chunk: Dict[str, Any]) -> List[Dict[str, Any]]:
+        own_text = "\n\n".join(blocks[i]["text"] for i in chunk["own"])
+        chunk_urls = {url for _, url in extract_image_urls(own_text)}
+        chunk_images = [img for img in images if img["url"] in chunk_urls]
+        chunk_markdown = "\n\n".join(blocks[i]["text"] for i in chunk["blocks"])
+        prompt = (
+            f"[settings]\n{format_settings(settings)}\n"
+            "[mode]\n"
+            f"長い記事を分割してチェックしています（{n + 1}/{len(chunks)}）。この部分だけを対象に指摘してください。\n\n"
+            f"[markdown]\n{chunk_markdown}\n"
+            f"{note}"
+        )
+        async with sem:
+            partial = await generate_report(prompt, chunk_images)
+        return partial.get("findings", [])
 
-    if images:
-        # 画像がある場合はマルチモーダルでチェック
-        prompt += f"\n[images]\n{len(images)}枚の画像が含まれています。各画像の内容もチェックしてください。\n"
-        report = await gemini_json_multimodal(CHECK_SYSTEM, prompt, images, REPORT_SCHEMA)
-    else:
-        # 画像がない場合は従来通り
-        report = await gemini_json(CHECK_SYSTEM, prompt, REPORT_SCHEMA)
+    results = await asyncio.gather(*(check_chunk(n, c) for n, c in enumerate(chunks)))
 
-    CHECK_STORE[checkId] = {"text": req.text, "settings": req.settings.model_dump(), "report": report}
-    return {"checkId": checkId, "report": report}
+    findings: List[Dict[str, Any]] = []
+    for partial in results:
+        findings = merge_findings(findings, partial)
 
+    spans = resolve_spans(text, (h.get("text", "") for f in findings for h in f.get("highlights", [])))
 
-@app.post("/v1/patches")
-async def create_patch(req: PatchRequest):
-    mode = req.config.mock if req.config else "auto"
-    if should_mock(mode):
-        return {
-            "patchId": new_patch_id(),
+    def position(f: Dict[str, Any]) -> int:
+        starts = [
+            spans[h["text"]]["start"]
+            for h in f.get("highlights", [])
+            if spans.get(h.get("text", ""))
+        ]
+        return min(starts) if starts else len(text)
+
+    findings.sort(key=position)
+    return build_report(findings)
+
+
+# =========================
+# Local pre-scan
+# =========================
+# 鍵・個人情報・内部ホストなどをモデル呼び出し前に正規表現で検出する
+PRESCAN_ENABLED = os.getenv("PRESCAN_ENABLED", "1") in {"1", "true", "True"}
+# critical の検出があればモデルを呼ばずにローカル結果だけで返す
+PRESCAN_SHORT_CIRCUIT = os.getenv("PRESCAN_SHORT_CIRCUIT", "") in {"1", "true", "True"}
+
+
+def prescan_short_circuits(local: List[Dict[str, Any]]) -> bool:
+    return PRESCAN_SHORT_CIRCUIT and any(f["severity"] == "critical" for f in local)
+
+
+def extra_findings(local: List[Dict[str, Any]], findings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """findings のうち、ローカル検査の結果と重複しないもの。"""
+    return [f for f in merge_findings(local, findings) if not any(f is lf for lf in local)]
+
+
+async def generate_report(prompt: str, images: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if images and IMAGE_ANALYSIS == "per-image":
+        # 本文と画像を分け、画像は 1 枚ずつ並行してチェックする（画像ごとの結果はキャッシュされる）
+        text_report, image_findings = await asyncio.gather(
+            gemini_json(CHECK_SYSTEM, prompt, REPORT_SCHEMA),
+            analyze_images(images),
+        )
+        return build_report(merge_findings(text_report.get("findings", []), image_findings))
+    if images:
+        # 画像がある場合はマルチモーダルでチェック
+        prompt += f"\n[images]\n{len(images)}枚の画像が含まれています。各画像の内容もチェックしてください。\n"
+        return await gemini_json_multimodal(CHECK_SYSTEM, prompt, images, REPORT_SCHEMA)
+    # 画像がない場合は従来通り
+    return await gemini_json(CHECK_SYSTEM, prompt, REPORT_SCHEMA)
+
+
+# =========================
+# Image analysis (per image)
+# =========================
+# per-image: 画像を 1 枚ずつ別に調べて結果をキャッシュする | combined: 本文と全画像を 1 回で送る（従来の方式）
+IMAGE_ANALYSIS = os.getenv("IMAGE_ANALYSIS", "per-image")
+IMAGE_ANALYSIS_CONCURRENCY = int(os.getenv("IMAGE_ANALYSIS_CONCURRENCY", "4"))
+# pHash のハミング距離がこれ以下ならほぼ同じ画像とみなして結果を使い回す。
+# 伏せ字を入れた版と元の画像も近くなりうるので、既定（-1）では使わず sha256 が一致する画像だけで使い回す
+IMAGE_PHASH_MAX_DISTANCE = int(os.getenv("IMAGE_PHASH_MAX_DISTANCE", "-1"))
+IMAGE_FINDINGS = ImageFindingCache(
+    max_entries=int(os.getenv("IMAGE_FINDINGS_MAX_ENTRIES", "4096")),
+    max_distance=IMAGE_PHASH_MAX_DISTANCE,
+)
+IMAGE_PROMPT = "[image]\nこの画像をチェックしてください。\n"
+
+# sha256 -> 進行中の画像チェック（同じ画像を同時に要求されたら 1 回の呼び出しを共有する）
+_image_analyses: Dict[str, "asyncio.Task[List[Dict[str, Any]]]"] = {}
+
+
+def image_findings_key(sha256: str) -> str:
+    return content_digest("image-findings", MODEL_ID, IMAGE_SYSTEM, sha256)
+
+
+async def analyze_image(img: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    画像 1 枚の指摘（ハイライト無し）。sha256 か pHash が近い画像の結果があればモデルを呼ばない。
+    待っている側がキャンセルされても処理自体は止めない。
+    """
+    sha = img["sha256"]
+    entry = IMAGE_FINDINGS.get(sha)
+    if entry is not None:
+        IMAGE_FINDINGS.hits += 1
+        return entry["findings"]
+
+    task = _image_analyses.get(sha)
+    if task is None:
+        task = asyncio.ensure_future(_analyze_image(img))
+        _image_analyses[sha] = task
+        task.add_done_callback(lambda _: _image_analyses.pop(sha, None))
+    return await asyncio.shield(task)
+
+
+async def _analyze_image(img: Dict[str, Any]) -> List[Dict[str, Any]]:
+    sha, phash = img["sha256"], img.get("phash")
+    key = image_findings_key(sha)
+    cached = await RESULT_CACHE.get(key)
+    if cached is not None:
+        IMAGE_FINDINGS.hits += 1
+        return IMAGE_FINDINGS.put(sha, phash, cached["findings"])["findings"]
+
+    # 再圧縮・縮小されただけの画像は、pHash が近い画像の結果を使う（pHash の索引はこのプロセス内だけ）
+    similar = IMAGE_FINDINGS.find_similar(phash)
+    if similar is not None:
+        IMAGE_FINDINGS.near_hits += 1
+        return IMAGE_FINDINGS.put(sha, phash, similar["findings"])["findings"]
+
+    IMAGE_FINDINGS.misses += 1
+    # alt や URL は記事ごとに違うので渡さない（画像の内容だけで判断させ、結果を使い回せるようにする）
+    out = await gemini_json_multimodal(IMAGE_SYSTEM, IMAGE_PROMPT, [img], IMAGE_FINDINGS_SCHEMA, labels=False)
+    findings = [
+        {key: f[key] for key in ("category", "severity", "title", "reason", "suggestion", "tags") if key in f}
+        for f in out.get("findings", [])
+    ]
+    IMAGE_FINDINGS.put(sha, phash, findings)
+    await RESULT_CACHE.set(key, {"findings": findings})
+    return findings
+
+
+async def analyze_images(images: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    画像を 1 枚ずつ並行してチェックし、本文の findings と同じ形で返す。
+    同じ内容の画像は 1 回だけ調べ、ハイライトには本文中のその画像の URL を入れる。
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for img in images:
+        groups.setdefault(img["sha256"], []).append(img)
+
+    sem = asyncio.Semaphore(IMAGE_ANALYSIS_CONCURRENCY)
+
+    async def run_one(img: Dict[str, Any]) -> List[Dict[str, Any]]:
+        async with sem:
+            return await analyze_image(img)
+
+    results = await asyncio.gather(*(run_one(group[0]) for group in groups.values()))
+
+    findings: List[Dict[str, Any]] = []
+    for group, image_findings in zip(groups.values(), results):
+        refs = {img["url"]: img["alt"] for img in group}
+        for f in image_findings:
+            findings.append({
+                **f,
+                "id": f"i_{len(findings) + 1:03d}",
+                "highlights": [{"text": url, "context": f"画像: {alt or url}"} for url, alt in refs.items()],
+                "tags": [*f.get("tags", []), "image"],
+            })
+    return findings
+
+
+# =========================
+# Incremental recheck
+# =========================
+# 変更ブロックの割合がこれを超える場合は全文を再チェックする
+INCREMENTAL_RECHECK_MAX_RATIO = float(os.getenv("INCREMENTAL_RECHECK_MAX_RATIO", "0.5"))
+# ブロック数がこれ未満の短い文書は常に全文を再チェックする
+INCREMENTAL_RECHECK_MIN_BLOCKS = int(os.getenv("INCREMENTAL_RECHECK_MIN_BLOCKS", "4"))
+# 変更ブロックの前後に文脈として付けるブロック数
+INCREMENTAL_RECHECK_CONTEXT = int(os.getenv("INCREMENTAL_RECHECK_CONTEXT", "1"))
+
+
+async def with_offsets(report: Dict[str, Any], text: str) -> Dict[str, Any]:
+    """report のコピーを作り、highlights.items に本文中のオフセットを付ける。"""
+    with stage("offsets"):
+        return await offload(CPU_POOL, annotated_copy, report, text, size=len(text))
+
+
+def store_entry(text: str, settings: CheckSettings, report: Dict[str, Any]) -> Dict[str, Any]:
+    """CHECK_STORE に保存するエントリ。ブロックごとのハッシュも持たせて差分再チェックに使う。"""
+    return {
+        "text": text,
+        "settings": settings.model_dump(),
+        "report": report,
+        "blocks": [b["hash"] for b in split_blocks(text)],
+    }
+
+
+def carry_over(saved: Optional[Dict[str, Any]], entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    recheck で作り直したエントリに、前回のエントリの記録済みパッチと（本文が同じなら）cached content を引き継ぐ。
+    finding の id は振り直されるので、パッチには findingId の代わりに元の指摘のタイトルを持たせる。
+    本文が変わっていれば、パッチの位置を新しい本文で探し直す（見つからなければ release 時に探す）。
+    """
+    if not saved:
+        return entry
+    same_text = saved.get("text") == entry["text"]
+    titles = {f.get("id"): f.get("title", "") for f in (saved.get("report") or {}).get("findings", [])}
+    patches: List[Dict[str, Any]] = []
+    for p in saved.get("patches", []):
+        p = dict(p)
+        fid = p.pop("findingId", None)
+        if fid is not None:
+            p.setdefault("findingTitle", titles.get(fid, ""))
+        if not same_text:
+            span = resolve_spans(entry["text"], [p["originalText"]]).get(p["originalText"])
+            p["start"], p["end"] = (span["start"], span["end"]) if span else (None, None)
+        patches.append(p)
+    if patches:
+        entry["patches"] = patches
+    if same_text and saved.get("contextCache"):
+        entry["contextCache"] = saved["contextCache"]
+    return entry
+
+
+def add_patches(
+    records: List[Dict[str, Any]], saved: Dict[str, Any], known: Optional[Dict[str, Any]]
+) -> Callable[[Optional[Dict[str, Any]]], Optional[Dict[str, Any]]]:
+    """
+    CHECK_STORE.update に渡す関数を返す。読み直した最新のエントリにパッチの記録 records を追記する。
+    この処理の間に saved の cached content のハンドルが known から変わっていれば、それも反映する。
+    エントリが消えていた場合と、変更が無い場合は書き込まない。
+    """
+
+    def apply(entry: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        handle = saved.get("contextCache")
+        handle_changed = handle != known and entry is not None and entry.get("text") == saved.get("text")
+        if entry is None or not (records or handle_changed):
+            return None
+        if records:
+            entry.setdefault("patches", []).extend(records)
+        if handle_changed:
+            if handle:
+                entry["contextCache"] = handle
+            else:
+                entry.pop("contextCache", None)
+        return entry
+
+    return apply
+
+
+def retained_findings(
+    report: Dict[str, Any],
+    text: str,
+    blocks: List[Dict[str, Any]],
+    changed: Set[int],
+) -> List[Dict[str, Any]]:
+    """
+    前回の findings のうち、ハイライトがすべて未変更ブロック内に残っているものを返す。
+    ハイライトの無い（文書全体への）指摘はそのまま残す。
+    """
+    unchanged = [(b["start"], b["end"]) for i, b in enumerate(blocks) if i not in changed]
+
+    def in_unchanged_block(needle: str) -> bool:
+        start = text.find(needle)
+        while start >= 0:
+            end = start + len(needle)
+            if any(bs <= start and end <= be for bs, be in unchanged):
+                return True
+            start = text.find(needle, start + 1)
+        return False
+
+    kept: List[Dict[str, Any]] = []
+    for f in report.get("findings", []):
+        needles = [h.get("text", "") for h in f.get("highlights", []) if h.get("text")]
+        if all(in_unchanged_block(n) for n in needles):
+            kept.append(f)
+    return kept
+
+
+async def run_incremental_check(
+    text: str,
+    settings: CheckSettings,
+    saved: Optional[Dict[str, Any]],
+) -> Optional[Dict[str, Any]]:
+    """
+    前回チェック時から変わったブロック（+前後の文脈）だけをモデルに送り、
+    残った findings とマージして report をローカルで組み直す。
+    差分再チェックできない場合は None を返す（呼び出し側で全文チェックする）。
+    """
+    if not saved or "blocks" not in saved or saved.get("settings") != settings.model_dump():
+        return None
+
+    blocks = split_blocks(text)
+    if len(blocks) < INCREMENTAL_RECHECK_MIN_BLOCKS:
+        return None
+    changed = changed_block_indices(saved["blocks"], blocks)
+    if len(changed) > len(blocks) * INCREMENTAL_RECHECK_MAX_RATIO:
+        return None
+
+    changed_set = set(changed)
+    findings = retained_findings(saved.get("report") or {}, text, blocks, changed_set)
+
+    if changed:
+        parts: List[str] = []
+        prev = -1
+        for i in with_context(changed, len(blocks), INCREMENTAL_RECHECK_CONTEXT):
+            if prev >= 0 and i != prev + 1:
+                parts.append("[...]\n")
+            label = "target" if i in changed_set else "context"
+            parts.append(f"[{label}]\n{blocks[i]['text']}\n")
+            prev = i
+
+        prompt = (
+            f"[settings]\n{format_settings(settings)}\n"
+            "[mode]\n"
+            "記事の一部だけを再チェックします。[target] のブロックのみを対象に指摘してください。\n"
+            "[context] は前後の文脈であり、指摘の対象外です。\n\n"
+            f"[markdown]\n{''.join(parts)}"
+        )
+        # 変更ブロックに含まれる画像だけを取得する
+        target_markdown = "\n\n".join(blocks[i]["text"] for i in changed)
+        with stage("prescan"):
+            local = (
+                await offload(CPU_POOL, scan_markdown, target_markdown, size=len(target_markdown))
+                if PRESCAN_ENABLED else []
+            )
+        if prescan_short_circuits(local):
+            findings += local
+        else:
+            images = await fetch_images_from_markdown(target_markdown)
+            partial = await generate_report(prompt + prescan_note(local), images)
+            findings += merge_findings(local, partial.get("findings", []))
+
+    return build_report(dedupe_findings(findings))
+
+
+# =========================
+# Bulk patches
+# =========================
+# 1 回のモデル呼び出しで扱う finding の数と、同時に実行する呼び出しの数
+PATCH_BULK_BATCH_SIZE = int(os.getenv("PATCH_BULK_BATCH_SIZE", "10"))
+PATCH_BULK_CONCURRENCY = int(os.getenv("PATCH_BULK_CONCURRENCY", "4"))
+
+
+def patch_redact_mode(saved: Optional[Dict[str, Any]]) -> str:
+    """
+    指摘をローカルで伏せ字化するときの redactMode。
+    none の場合でも、利用者が修正を求めた指摘なので strict のルールで伏せる。
+    """
+    mode = ((saved or {}).get("settings") or {}).get("redactMode", "none")
+    return "strict" if mode == "none" else mode
+
+
+def local_patch(finding: Dict[str, Any], original_text: str, mode: str) -> Optional[Dict[str, str]]:
+    """
+    伏せ字化で直せる指摘なら、モデルを呼ばずに修正案を作る。
+    ローカル検査の指摘は伏せる箇所があれば、それ以外の指摘はハイライト全体が 1 つの伏せ字の対象になる場合だけ。
+    Returns: {"originalText", "replacement", "note"} | None
+    """
+    replacement, redactions = redact(original_text, mode)
+    if not redactions:
+        return None
+    whole = len(redactions) == 1 and redactions[0]["start"] == 0 and redactions[0]["end"] == len(original_text)
+    if not (whole or "local-scan" in finding.get("tags", [])):
+        return None
+    rules = ", ".join(dict.fromkeys(r["rule"] for r in redactions))
+    return {"originalText": original_text, "replacement": replacement, "note": f"ローカルで伏せ字化: {rules}"}
+
+
+def patch_brief(finding: Dict[str, Any]) -> Dict[str, Any]:
+    """プロンプトに載せる finding の要約（id と修正に必要な項目だけ）。"""
+    return {
+        "id": finding.get("id"),
+        "category": finding.get("category"),
+        "title": finding.get("title"),
+        "suggestion": finding.get("suggestion"),
+        "highlights": [h.get("text", "") for h in finding.get("highlights", [])],
+    }
+
+
+async def generate_bulk_patches(
+    check_id: str,
+    text: str,
+    findings: List[Dict[str, Any]],
+    saved: Optional[Dict[str, Any]] = None,
+) -> Dict[str, List[Dict[str, str]]]:
+    """
+    findings の修正案をまとめて生成する。伏せ字化で直せるもの（local_patch）はモデルを呼ばずに作り、
+    残りを PATCH_BULK_BATCH_SIZE 件ずつ並行して呼び出す。
+    Returns: {findingId: [{"originalText": str, "replacement": str}, ...]}
+    失敗したバッチの finding は含まれない（すべて失敗した場合は例外を送出する）。
+    """
+    # 伏せ字化で直せる finding はモデルに送らない
+    mode = patch_redact_mode(saved)
+    generated: Dict[str, List[Dict[str, str]]] = {}
+    remaining: List[Dict[str, Any]] = []
+    for f in findings:
+        local = [local_patch(f, h.get("text", ""), mode) for h in f.get("highlights", []) if h.get("text")]
+        if local and all(local):
+            generated[f.get("id")] = [{"originalText": p["originalText"], "replacement": p["replacement"]} for p in local]
+        else:
+            remaining.append(f)
+    if not remaining:
+        return generated
+
+    sem = asyncio.Semaphore(PATCH_BULK_CONCURRENCY)
+    batches = [remaining[i:i + PATCH_BULK_BATCH_SIZE] for i in range(0, len(remaining), PATCH_BULK_BATCH_SIZE)]
+
+    async def run_one(batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        prompt = (
+            f"[checkId]\n{check_id}\n\n"
+            f"[findings]\n{json.dumps([patch_brief(f) for f in batch], ensure_ascii=False)}\n"
+        )
+        async with sem:
+            return await gemini_json_for_document(PATCH_BULK_SYSTEM, text, prompt, PATCH_BULK_SCHEMA, saved)
+
+    outs = await asyncio.gather(*(run_one(b) for b in batches), return_exceptions=True)
+    errors = [o for o in outs if isinstance(o, BaseException)]
+    if errors and len(errors) == len(outs) and not generated:
+        raise errors[0]
+
+    wanted = {f.get("id") for f in remaining}
+    for out in outs:
+        if isinstance(out, BaseException):
+            print(f"[WARN] Bulk patch batch failed: {out}")
+            continue
+        for p in out.get("patches", []):
+            fid = p.get("findingId")
+            if fid not in wanted or not p.get("originalText"):
+                continue
+            generated.setdefault(fid, []).append({
+                "originalText": str(p["originalText"]),
+                "replacement": str(p.get("replacement", "")),
+            })
+    return generated
+
+
+def apply_bulk_patches(
+    text: str,
+    findings: List[Dict[str, Any]],
+    generated: Dict[str, List[Dict[str, str]]],
+    report: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    生成した修正案を本文中の範囲に解決し、重ならないものを 1 回で適用する。
+    重なる場合は severity の高い finding を優先する（同じなら report の順）。
+    Returns: {"text", "applied", "conflicts", "results", "highlights", "edits"}
+    edits は適用した編集（start / end は元の本文でのオフセット）。
+    """
+    rank = {sev: i for i, sev in enumerate(SEVERITIES)}
+    ordered = sorted(findings, key=lambda f: -rank.get(f.get("severity", "low"), 0))
+    spans = resolve_spans(text, (g["originalText"] for gs in generated.values() for g in gs))
+
+    edits: List[Dict[str, Any]] = []
+    unresolved: Dict[str, List[Dict[str, Any]]] = {}
+    for f in ordered:
+        fid = f.get("id")
+        for g in generated.get(fid, []):
+            span = spans.get(g["originalText"])
+            # あいまい一致の範囲は置換しない（create_patch と同じ扱い）
+            if span is None or span["match"] == "fuzzy":
+                unresolved.setdefault(fid, []).append({
+                    "patchId": new_patch_id(),
+                    "before": g["originalText"],
+                    "after": g["replacement"],
+                    "apply": {"mode": "replaceText", "originalText": g["originalText"], "replacement": g["replacement"]},
+                    "applied": False,
+                })
+                continue
+            edits.append({
+                "patchId": new_patch_id(),
+                "findingId": fid,
+                "start": span["start"],
+                "end": span["end"],
+                "originalText": text[span["start"]:span["end"]],
+                "replacement": g["replacement"],
+            })
+
+    patched, applied, rejected = apply_edits(text, edits)
+    applied_ids = {e["patchId"] for e in applied}
+
+    results: List[Dict[str, Any]] = []
+    fixed: Set[str] = set()
+    for f in findings:
+        fid = f.get("id")
+        patches = [
+            {
+                "patchId": e["patchId"],
+                "before": e["originalText"],
+                "after": e["replacement"],
+                "apply": {
+                    "mode": "replaceText",
+                    "originalText": e["originalText"],
+                    "replacement": e["replacement"],
+                    "start": e["start"],
+                    "end": e["end"],
+                },
+                "applied": e["patchId"] in applied_ids,
+            }
+            for e in edits
+            if e["findingId"] == fid
+        ] + unresolved.get(fid, [])
+
+        n_applied = sum(1 for p in patches if p["applied"])
+        if not patches:
+            status = "failed"
+        elif n_applied == len(patches):
+            status = "applied"
+            fixed.add(fid)
+        elif n_applied:
+            status = "partial"
+        elif any(e["findingId"] == fid for e in rejected):
+            status = "conflict"
+        else:
+            status = "unresolved"
+        results.append({"findingId": fid, "status": status, "patches": patches})
+
+    # 修正し終えた finding を除いた残りのハイライトを、適用後の本文の位置に合わせる
+    items = [i for i in report["highlights"]["items"] if i.get("findingId") not in fixed]
+    return {
+        "text": patched,
+        "applied": len(applied),
+        "conflicts": len(rejected),
+        "results": results,
+        "highlights": remap_items(items, patched, applied),
+        "edits": applied,
+    }
+
+
+# =========================
+# Release assembly
+# =========================
+# fixSummary / checklist の作り方: model（短い要約だけをモデルに頼む）| template（モデルを呼ばない）
+RELEASE_SUMMARY = os.getenv("RELEASE_SUMMARY", "model")
+# プロンプトに載せる修正前後の文字列の最大長
+RELEASE_SNIPPET_CHARS = 80
+
+
+def place_patch(text: str, patch: Dict[str, Any]) -> Tuple[str, Optional[Tuple[int, int]]]:
+    """
+    記録済みのパッチが text のどこに当たるかを調べる。
+    Returns: ("pending", (start, end)) | ("applied", None) | ("stale", None)
+    originalText が残っていれば未適用。ただし、その位置が replacement の一部（replacement が original を含む）なら適用済み。
+    originalText がどこにも無く replacement があれば適用済み（クライアントが反映したもの）、どちらも無ければ stale。
+    """
+    start, end = patch.get("start"), patch.get("end")
+    original, replacement = patch["originalText"], patch["replacement"]
+
+    def applied_around(at: int) -> bool:
+        # at にある original が、適用済みの replacement の中の original かどうか
+        k = replacement.find(original) if replacement else -1
+        while k >= 0:
+            if k <= at and text[at - k:at - k + len(replacement)] == replacement:
+                return True
+            k = replacement.find(original, k + 1)
+        return False
+
+    if start is not None and text[start:end] == original:
+        return ("applied", None) if applied_around(start) else ("pending", (start, end))
+    span = resolve_spans(text, [original]).get(original)
+    if span and span["match"] != "fuzzy":
+        if applied_around(span["start"]):
+            return "applied", None
+        return "pending", (span["start"], span["end"])
+    if replacement and replacement in text:
+        return "applied", None
+    return "stale", None
+
+
+def assemble_release(
+    text: str,
+    patches: List[Dict[str, Any]],
+    redactions: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    text に記録済みのパッチとリダクション（text 基準の編集）を 1 回のオフセット計算で適用し、公開用の本文を作る。
+    範囲が重なるものはパッチを優先し、パッチ同士では先に記録されたものを優先する（apply_edits と同じ）。
+    Returns: {"safeMarkdown", "applied": [...], "alreadyApplied": [...], "stale": [...], "conflicts": [...], "redacted": [...]}
+    applied / conflicts にはパッチだけを、redacted には適用したリダクションを入れる。
+    """
+    edits: List[Dict[str, Any]] = []
+    already: List[Dict[str, Any]] = []
+    stale: List[Dict[str, Any]] = []
+    for patch in patches:
+        status, span = place_patch(text, patch)
+        if status == "pending":
+            edits.append({**patch, "start": span[0], "end": span[1], "originalText": text[span[0]:span[1]]})
+        elif status == "applied":
+            already.append(patch)
+        else:
+            stale.append(patch)
+
+    safe, accepted, rejected = apply_edits(text, edits + (redactions or []))
+    return {
+        "safeMarkdown": safe,
+        "applied": [e for e in accepted if "rule" not in e],
+        "alreadyApplied": already,
+        "stale": stale,
+        "conflicts": [e for e in rejected if "rule" not in e],
+        "redacted": [e for e in accepted if "rule" in e],
+    }
+
+
+def snippet(value: str, limit: int = RELEASE_SNIPPET_CHARS) -> str:
+    return value if len(value) <= limit else value[:limit] + "…"
+
+
+def release_brief(
+    report: Optional[Dict[str, Any]],
+    patches: List[Dict[str, Any]],
+    redacted: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """fixSummary / checklist の材料。本文は含めないので、大きさは指摘と修正の数で決まる。"""
+    findings = {f.get("id"): f for f in (report or {}).get("findings", [])}
+    fixed = {p.get("findingId") for p in patches}
+    applied = [
+        {
+            "finding": (findings.get(p.get("findingId")) or {}).get("title") or p.get("findingTitle", ""),
+            "before": snippet(p["originalText"]),
+            "after": snippet(p["replacement"]),
+        }
+        for p in patches
+    ]
+    remaining = [
+        {"severity": f.get("severity"), "title": f.get("title")}
+        for fid, f in findings.items()
+        if fid not in fixed
+    ]
+    # 伏せ字化は種類ごとの件数だけ（伏せた値そのものはプロンプトに載せない）
+    counts: Dict[str, int] = {}
+    for r in redacted or []:
+        counts[r["rule"]] = counts.get(r["rule"], 0) + 1
+    return {"applied": applied, "remaining": remaining, "redacted": counts}
+
+
+def template_release_summary(brief: Dict[str, Any], settings: CheckSettings) -> Dict[str, Any]:
+    """モデルを呼ばずに fixSummary / checklist を作る。"""
+    fix_summary = [
+        f"{a['finding'] or '指摘'}: 「{a['before']}」を「{a['after']}」に修正した。"
+        for a in brief["applied"]
+    ]
+    fix_summary += [f"{rule} を {n} 件伏せ字にした。" for rule, n in brief["redacted"].items()]
+    checklist = [f"未対応の指摘を確認する（{r['severity']}）: {r['title']}" for r in brief["remaining"]]
+    checklist += [
+        "社外秘情報・個人情報・鍵情報が含まれていない。",
+        f"公開範囲（{settings.publishScope}）が意図どおりである。",
+    ]
+    return {"fixSummary": fix_summary, "checklist": checklist}
+
+
+async def release_summary(brief: Dict[str, Any], settings: CheckSettings) -> Dict[str, Any]:
+    if RELEASE_SUMMARY == "template":
+        return template_release_summary(brief, settings)
+    prompt = (
+        f"[settings]\n{format_settings(settings)}\n"
+        f"[applied]\n{json.dumps(brief['applied'], ensure_ascii=False)}\n\n"
+        f"[remaining]\n{json.dumps(brief['remaining'], ensure_ascii=False)}\n\n"
+        f"[redacted]\n{json.dumps(brief['redacted'], ensure_ascii=False)}\n"
+    )
+    out = await gemini_json(RELEASE_SUMMARY_SYSTEM, prompt, RELEASE_SUMMARY_SCHEMA)
+    return {"fixSummary": list(out.get("fixSummary", [])), "checklist": list(out.get("checklist", []))}
+
+
+# =========================
+# Persona review
+# =========================
+ALL_AUDIENCES: List[str] = list(get_args(Audience))
+# 複数 audience のレビューを同時に実行する数
+PERSONA_CONCURRENCY = int(os.getenv("PERSONA_CONCURRENCY", "4"))
+
+
+def persona_cache_key(text: str, settings: CheckSettings, images: Optional[List[Dict[str, Any]]] = None) -> str:
+    image_digests = ",".join(img["sha256"] for img in images or [])
+    return content_digest(
+        "persona",
+        MODEL_ID,
+        PERSONA_SYSTEM,
+        json.dumps(settings.model_dump(), sort_keys=True),
+        normalize_text(text),
+        image_digests,
+    )
+
+
+async def run_persona_review(
+    text: str,
+    settings: CheckSettings,
+    images: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    1 つの audience のペルソナレビュー。本文・設定・画像が同じなら RESULT_CACHE の結果を返す。
+    画像が無ければ文書本体は audience 間で同じ cached content を使う。
+    """
+    cache_key = persona_cache_key(text, settings, images)
+    cached = await RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    prompt = f"[settings]\n{format_settings(settings)}\n"
+    if images:
+        # cached content は本文だけなので、画像がある場合は本文ごと送る
+        prompt += f"[markdown]\n{text}\n\n[images]\n{len(images)}枚の画像が含まれています。画像の内容も読者の観点で確認してください。\n"
+        out = await gemini_json_multimodal(PERSONA_SYSTEM, prompt, images, PERSONA_SCHEMA)
+    else:
+        out = await gemini_json_for_document(PERSONA_SYSTEM, text, prompt, PERSONA_SCHEMA)
+
+    # audience は入力に揃える（念のため）
+    out["audience"] = settings.audience
+    await RESULT_CACHE.set(cache_key, out)
+    return out
+
+
+def persona_task(
+    text: str,
+    settings: CheckSettings,
+    audience: str,
+    sem: asyncio.Semaphore,
+    images: Optional[List[Dict[str, Any]]] = None,
+) -> "asyncio.Task[Tuple[str, Any]]":
+    """audience のレビューを開始する。結果は (audience, review | HTTPException)。"""
+
+    async def run() -> Tuple[str, Any]:
+        async with sem:
+            try:
+                return audience, await run_persona_review(
+                    text, settings.model_copy(update={"audience": audience}), images
+                )
+            except HTTPException as e:
+                return audience, e
+
+    return asyncio.ensure_future(run())
+
+
+async def iter_completed(tasks: List["asyncio.Task[Any]"]) -> AsyncIterator[Any]:
+    """tasks の結果を終わった順に返す。途中で打ち切られた場合は残りをキャンセルする。"""
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def iter_persona_reviews(
+    text: str,
+    settings: CheckSettings,
+    audiences: List[str],
+    images: Optional[List[Dict[str, Any]]] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    audiences のレビューを並行して実行し、終わった順に (audience, review | HTTPException) を返す。
+    """
+    sem = asyncio.Semaphore(PERSONA_CONCURRENCY)
+    tasks = [persona_task(text, settings, a, sem, images) for a in audiences]
+    async for result in iter_completed(tasks):
+        yield result
+
+
+# =========================
+# Full review (check + persona)
+# =========================
+async def iter_full_review(
+    text: str,
+    settings: CheckSettings,
+    audiences: List[str],
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    画像を 1 回だけ取得し、check と各 audience のペルソナレビューを同時に実行する。
+    終わった順に ("check", report | HTTPException) / (audience, review | HTTPException) を返す。
+    """
+    images = await fetch_images_from_markdown(text)
+    prompt = f"[settings]\n{format_settings(settings)}\n[markdown]\n{text}\n"
+
+    async def check() -> Tuple[str, Any]:
+        try:
+            return "check", await run_check(text, settings, prompt, images)
+        except HTTPException as e:
+            return "check", e
+
+    sem = asyncio.Semaphore(PERSONA_CONCURRENCY)
+    tasks = [asyncio.ensure_future(check())]
+    tasks += [persona_task(text, settings, a, sem, images) for a in audiences]
+    async for result in iter_completed(tasks):
+        yield result
+
+
+# =========================
+# Batch checks
+# =========================
+# 同時に実行する check の数
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# /v1/checks:batch（同期）で受け付ける最大件数。超える場合はジョブを使う
+BATCH_SYNC_MAX_DOCUMENTS = int(os.getenv("BATCH_SYNC_MAX_DOCUMENTS", "50"))
+# ジョブの文書はそれぞれ CHECK_STORE のエントリになる。ストアの容量に近いと、ジョブが自分の結果を
+# 追い出して results が report: null になるので、件数・本文の合計サイズともストアの容量の 1/4 までにする
+BATCH_JOB_STORE_SHARE = 4
+BATCH_JOB_MAX_DOCUMENTS = int(os.getenv("BATCH_JOB_MAX_DOCUMENTS", "500"))
+if CHECK_STORE.max_entries is not None:
+    BATCH_JOB_MAX_DOCUMENTS = min(BATCH_JOB_MAX_DOCUMENTS, CHECK_STORE.max_entries // BATCH_JOB_STORE_SHARE)
+# ジョブ状態を CHECK_STORE に書き戻す最小間隔（秒）
+BATCH_JOB_SAVE_INTERVAL = float(os.getenv("BATCH_JOB_SAVE_INTERVAL", "1.0"))
+
+# 実行中のバックグラウンドタスク（GC で消えないよう参照を保持する）
+_background_tasks: Set["asyncio.Task[Any]"] = set()
+
+
+def spawn(coro: Any) -> "asyncio.Task[Any]":
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def run_batch(
+    documents: List[BatchDocument],
+    settings: CheckSettings,
+    mock: bool,
+    on_result: Any,
+) -> None:
+    """
+    documents を BATCH_CONCURRENCY 件ずつ並列にチェックする。
+    本文が同じ文書は 1 回だけチェックし、結果をそれぞれ別の checkId で保存する。
+    画像は IMAGE_CACHE と進行中ダウンロードの共有によりバッチ全体で 1 回だけ取得される。
+    on_result(index, item) は文書ごとに 1 回呼ばれる。
+    """
+    groups: Dict[str, List[int]] = {}
+    for i, doc in enumerate(documents):
+        groups.setdefault(normalize_text(doc.text), []).append(i)
+
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_group(indices: List[int]) -> None:
+        text = documents[indices[0]].text
+        async with sem:
+            try:
+                if mock:
+                    report: Dict[str, Any] = MOCK_REPORT
+                else:
+                    prompt = f"[settings]\n{format_settings(settings)}\n[markdown]\n{text}\n"
+                    report = await run_check(text, settings, prompt)
+            except HTTPException as e:
+                detail = e.detail if isinstance(e.detail, dict) else {"error": "ERROR", "message": str(e.detail)}
+                for i in indices:
+                    await on_result(i, {"id": documents[i].id, "status": "error", "error": detail})
+                return
+
+        for i in indices:
+            check_id = new_check_id()
+            doc_report = await with_offsets(report, documents[i].text)
+            await CHECK_STORE.put(check_id, store_entry(documents[i].text, settings, doc_report))
+            await on_result(i, {"id": documents[i].id, "status": "ok", "checkId": check_id, "report": doc_report})
+
+    with priority_lane("batch"):
+        await asyncio.gather(*(run_group(indices) for indices in groups.values()))
+
+
+async def run_batch_job(job: Dict[str, Any], req: BatchCheckRequest) -> None:
+    """
+    バッチジョブを実行し、進捗を CHECK_STORE（キー: jobId）に書き戻す。
+    レポート本体は各 checkId のエントリにあり、ジョブには checkId と状態だけを持たせる。
+    """
+    loop = asyncio.get_running_loop()
+    last_saved = 0.0
+
+    async def on_result(index: int, item: Dict[str, Any]) -> None:
+        nonlocal last_saved
+        item = {k: v for k, v in item.items() if k != "report"}
+        job["items"][index] = {"index": index, **item}
+        job["completed" if item["status"] == "ok" else "failed"] += 1
+        if loop.time() - last_saved >= BATCH_JOB_SAVE_INTERVAL:
+            last_saved = loop.time()
+            await CHECK_STORE.put(job["jobId"], job)
+
+    job["status"] = "running"
+    await CHECK_STORE.put(job["jobId"], job)
+    mode = req.config.mock if req.config else "auto"
+    try:
+        await run_batch(req.documents, req.settings, should_mock(mode), on_result)
+        job["status"] = "done"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = {"error": "INTERNAL_ERROR", "message": str(e)}
+    await CHECK_STORE.put(job["jobId"], job)
+
+
+# =========================
+# FastAPI
+# =========================
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.security import APIKeyHeader
+from fastapi import Security, Depends, HTTPException, status
+
+# API Key Auth
+API_KEY_NAME = "x-api-key"
+api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
+
+async def get_api_key(api_key_header: str = Security(api_key_header)):
+    expected_api_key = os.getenv("API_KEY")
+    # Only enforce if API_KEY is set in environment (e.g. Cloud Run)
+    if expected_api_key:
+        if not api_key_header or api_key_header != expected_api_key:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Could not validate credentials",
+            )
+    return api_key_header
+
+# =========================
+# Metrics
+# =========================
+# /metrics（Prometheus 形式）を公開する
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") in {"1", "true", "True"}
+# デバッグ用: レスポンスに Server-Timing ヘッダ（段階ごとの時間）を付ける
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "") in {"1", "true", "True"}
+
+CACHE_LOOKUPS = REGISTRY.counter("brc_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+CACHE_HIT_RATIO = REGISTRY.gauge("brc_cache_hit_ratio", "Cache hit ratio since start", ["cache"])
+MODEL_SCHEDULER_STATE = REGISTRY.gauge("brc_model_scheduler", "Model scheduler state (inFlight, limit, queued)", ["field"])
+MODEL_SCHEDULER_EVENTS = REGISTRY.counter("brc_model_scheduler_events_total", "Model scheduler events (throttled = 429, retries, timeouts)", ["event"])
+BACKGROUND_TASKS = REGISTRY.gauge("brc_background_tasks", "Running background tasks (batch jobs)")
+CHECKS_COALESCED = REGISTRY.counter("brc_checks_coalesced_total", "Checks that joined an identical in-flight check instead of running their own")
+INFLIGHT_CHECKS = REGISTRY.gauge("brc_inflight_checks", "Distinct checks being processed")
+
+
+@REGISTRY.collector
+def collect_stats() -> None:
+    result = RESULT_CACHE.stats()
+    image = IMAGE_CACHE.stats()
+    context = CONTEXT_CACHE.stats()
+    for cache, stats, keys in (
+        ("result", result, ("hits", "misses", "errors")),
+        ("image", image, ("hits", "revalidated", "misses")),
+        ("context", context, ("reused", "created", "failed")),
+        ("image_findings", IMAGE_FINDINGS.stats(), ("hits", "nearHits", "misses")),
+    ):
+        for key in keys:
+            CACHE_LOOKUPS.set(cache, key, value=stats[key])
+        total = sum(stats[k] for k in keys)
+        CACHE_HIT_RATIO.set(cache, value=(stats[keys[0]] / total) if total else 0.0)
+
+    scheduler = MODEL_SCHEDULER.stats()
+    for field in ("inFlight", "limit", "queued"):
+        MODEL_SCHEDULER_STATE.set(field, value=scheduler[field])
+    for event in ("throttled", "retries", "timeouts"):
+        MODEL_SCHEDULER_EVENTS.set(event, value=scheduler[event])
+    BACKGROUND_TASKS.set(value=len(_background_tasks))
+    INFLIGHT_CHECKS.set(value=len(_inflight_checks))
+
+
+# レスポンス圧縮（COMPRESSION_MIN_SIZE バイト未満は圧縮しない）
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") in {"1", "true", "True"}
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# これ以上のレスポンスは CPU_POOL で圧縮する（数 MB の report の圧縮はループを数十 ms 止める）
+COMPRESSION_OFFLOAD_MIN_SIZE = int(os.getenv("COMPRESSION_OFFLOAD_MIN_SIZE", str(64 * 1024)))
+
+
+async def warm_up() -> None:
+    """
+    genai の import とクライアントの作成を起動時に済ませ、最初のリクエストが待たないようにする。
+    uvicorn は lifespan の完了後にポートを開くので、Cloud Run ではこの時間はリクエストにかからない。
+    """
+    if not (GENAI_WARMUP and PROJECT) or should_mock("auto"):
+        return
+    try:
+        await asyncio.to_thread(get_client)
+    except Exception as e:
+        print(f"[WARN] genai warmup failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    image_http_client()
+    if LOOP_LAG_MONITOR:
+        LOOP_LAG.start()
+    await warm_up()
+    yield
+    for task in [*_background_tasks, *_inflight_checks.values()]:
+        task.cancel()
+    LOOP_LAG.stop()
+    CPU_POOL.shutdown()
+    IMAGE_POOL.shutdown()
+    await close_image_http_client()
+    await RESULT_CACHE.close()
+    await CHECK_STORE.close()
+
+
+app = FastAPI(
+    title="Blog Risk Checker API", 
+    version="0.2.0",
+    dependencies=[Depends(get_api_key)],
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
+# リクエストボディも orjson でデコードする（ルートを追加する前に設定すること）
+app.router.route_class = FastJSONRoute
+
+# 大きなレスポンス（report など）を brotli / gzip で圧縮する
+if COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_MIN_SIZE,
+        offloader=CPU_POOL,
+        offload_min_size=COMPRESSION_OFFLOAD_MIN_SIZE,
+    )
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["https://blog-risk-checker.web.app", "http://localhost:5173"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# 最も外側で計測する（CORS・圧縮も含めた時間）
+app.add_middleware(MetricsMiddleware, server_timing=SERVER_TIMING_ENABLED)
+
+
+if METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics() -> Response:
+        return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def compact_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """payload 中の report（トップレベルと results[].report）を compact 形式にする。"""
+    out = dict(payload)
+    if isinstance(out.get("report"), dict):
+        out["report"] = compact_report(out["report"])
+    if isinstance(out.get("results"), list):
+        out["results"] = [
+            {**r, "report": compact_report(r["report"])} if r and isinstance(r.get("report"), dict) else r
+            for r in out["results"]
+        ]
+    return out
+
+
+def respond(payload: Dict[str, Any], fmt: str = "full") -> FastJSONResponse:
+    """
+    payload をそのまま orjson でエンコードして返す（dict を返すと jsonable_encoder を通るため）。
+    fmt="compact" なら report を compact 形式にする。
+    """
+    if fmt == "compact":
+        payload = compact_payload(payload)
+    return FastJSONResponse(payload)
+
+
+@app.post("/v1/checks")
+async def create_check(req: CreateCheckRequest, fmt: ResponseFormat = Query("full", alias="format")):
+    mode = req.config.mock if req.config else "auto"
+    if should_mock(mode):
+        check_id = new_check_id()
+        report = await with_offsets(MOCK_REPORT, req.text)
+        await CHECK_STORE.put(check_id, store_entry(req.text, req.settings, report))
+        return respond({"checkId": check_id, "report": report}, fmt)
+
+    prompt = f"[settings]\n{format_settings(req.settings)}\n[markdown]\n{req.text}\n"
+    report = await with_offsets(await run_check(req.text, req.settings, prompt), req.text)
+
+    check_id = new_check_id()
+    await CHECK_STORE.put(check_id, store_entry(req.text, req.settings, report))
+    return respond({"checkId": check_id, "report": report}, fmt)
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {fastjson.dumps(data)}\n\n"
+
+
+def finding_event(finding: Dict[str, Any]) -> str:
+    highlights = [
+        {"findingId": finding.get("id"), "text": h.get("text", "")}
+        for h in finding.get("highlights", [])
+    ]
+    return sse_event("finding", {"finding": finding, "highlights": highlights})
+
+
+@app.post("/v1/checks:stream")
+async def create_check_stream(req: CreateCheckRequest):
+    """
+    /v1/checks の Server-Sent Events 版。
+    finding が 1 件生成されるたびに `event: finding` を送り、
+    最後に verdict / score / summary を含む `event: report` を送る。
+    finding の id は送った順に f_001 から振り、最後の report の id と一致させる（パッチはこの id で指定できる）。
+    エラー時は `event: error` を送って終了する。
+    """
+    mode = req.config.mock if req.config else "auto"
+
+    async def events() -> AsyncIterator[str]:
+        check_id = new_check_id()
+
+        if should_mock(mode):
+            for f in MOCK_REPORT["findings"]:
+                yield finding_event(f)
+            report = await with_offsets(MOCK_REPORT, req.text)
+            await CHECK_STORE.put(check_id, store_entry(req.text, req.settings, report))
+            yield sse_event("report", {"checkId": check_id, "report": report})
+            return
+
+        # 送った findings（id は最終的な report と同じ）
+        emitted: List[Dict[str, Any]] = []
+
+        def unsent(findings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            """送った findings と重複しないものに、送る順の id を振って返す。"""
+            out: List[Dict[str, Any]] = []
+            for f in extra_findings(emitted, findings):
+                f = {**f, "id": f"f_{len(emitted) + 1:03d}"}
+                emitted.append(f)
+                out.append(f)
+            return out
+
+        try:
+            # ローカル検査の結果はモデルを待たずにすぐ送る
+            with stage("prescan"):
+                local = await offload(CPU_POOL, scan_markdown, req.text, size=len(req.text)) if PRESCAN_ENABLED else []
+            for f in unsent(local):
+                yield finding_event(f)
+
+            cached = None
+            if not prescan_short_circuits(local):
+                images = await fetch_images_from_markdown(req.text)
+                cache_key = check_cache_key(req.text, req.settings, images)
+                cached = await RESULT_CACHE.get(cache_key)
+
+            if prescan_short_circuits(local):
+                report = build_report(emitted)
+            elif cached is not None:
+                # キャッシュの report もローカル検査の結果が先頭なので、残りを送れば id は一致する
+                for f in unsent(cached.get("findings", [])):
+                    yield finding_event(f)
+                report = build_report(emitted)
+            else:
+                prompt = f"[settings]\n{format_settings(req.settings)}\n[markdown]\n{req.text}\n"
+                prompt += prescan_note(local)
+                image_task: Optional["asyncio.Future[List[Dict[str, Any]]]"] = None
+                if images and IMAGE_ANALYSIS == "per-image":
+                    # 画像は本文のストリームと並行して 1 枚ずつチェックし、本文の後に送る
+                    image_task = asyncio.ensure_future(analyze_images(images))
+                    contents: Any = prompt
+                elif images:
+                    prompt += f"\n[images]\n{len(images)}枚の画像が含まれています。各画像の内容もチェックしてください。\n"
+                    contents = multimodal_contents(prompt, images)
+                else:
+                    contents = prompt
+
+                try:
+                    parser = ArrayItemStream("findings")
+                    async for chunk in gemini_json_stream(CHECK_SYSTEM, contents, REPORT_SCHEMA):
+                        for f in unsent(parser.feed(chunk)):
+                            yield finding_event(f)
+
+                    try:
+                        model_report = await offload(CPU_POOL, fastjson.loads, parser.text, size=len(parser.text))
+                    except json.JSONDecodeError:
+                        raise http_error(502, "BAD_MODEL_OUTPUT", "Model returned non-JSON output")
+                    # ストリームの途中で取りこぼしたものがあれば送る
+                    for f in unsent(model_report.get("findings", [])):
+                        yield finding_event(f)
+
+                    image_findings = await image_task if image_task is not None else []
+                finally:
+                    if image_task is not None and not image_task.done():
+                        image_task.cancel()
+                for f in unsent(image_findings):
+                    yield finding_event(f)
+                # id・summary・verdict・score は送った findings から組み立てる（build_report は送った順に振り直す）
+                report = build_report(emitted)
+                await RESULT_CACHE.set(cache_key, report)
+
+            report = await with_offsets(report, req.text)
+            await CHECK_STORE.put(check_id, store_entry(req.text, req.settings, report))
+            yield sse_event("report", {"checkId": check_id, "report": report})
+
+        except HTTPException as e:
+            detail = e.detail if isinstance(e.detail, dict) else {"error": "ERROR", "message": str(e.detail)}
+            yield sse_event("error", {"status": e.status_code, **detail})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/v1/checks:batch")
+async def create_check_batch(req: BatchCheckRequest, fmt: ResponseFormat = Query("full", alias="format")):
+    """
+    複数文書を同じ settings でまとめてチェックする（同期）。
+    件数が多い場合は /v1/batch-jobs を使う。
+    """
+    if len(req.documents) > BATCH_SYNC_MAX_DOCUMENTS:
+        raise http_error(
+            413,
+            "TOO_MANY_DOCUMENTS",
+            f"use /v1/batch-jobs for more than {BATCH_SYNC_MAX_DOCUMENTS} documents",
+        )
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(req.documents)
+
+    async def on_result(index: int, item: Dict[str, Any]) -> None:
+        results[index] = {"index": index, **item}
+
+    mode = req.config.mock if req.config else "auto"
+    await run_batch(req.documents, req.settings, should_mock(mode), on_result)
+    return respond({"results": results}, fmt)
+
+
+@app.post("/v1/batch-jobs", status_code=202)
+async def create_batch_job(req: BatchCheckRequest):
+    if len(req.documents) > BATCH_JOB_MAX_DOCUMENTS:
+        raise http_error(413, "TOO_MANY_DOCUMENTS", f"at most {BATCH_JOB_MAX_DOCUMENTS} documents per job")
+    max_bytes = CHECK_STORE.max_bytes
+    if max_bytes is not None:
+        total = sum(len(d.text.encode("utf-8")) for d in req.documents)
+        if total > max_bytes // BATCH_JOB_STORE_SHARE:
+            raise http_error(413, "JOB_TOO_LARGE", "documents of this job do not fit in the check store; split the job")
+
+    job = {
+        "jobId": new_job_id(),
+        "status": "queued",
+        "total": len(req.documents),
+        "completed": 0,
+        "failed": 0,
+        "items": [None] * len(req.documents),
+    }
+    await CHECK_STORE.put(job["jobId"], job)
+    spawn(run_batch_job(job, req))
+    return {key: job[key] for key in ("jobId", "status", "total")}
+
+
+@app.get("/v1/batch-jobs/{jobId}")
+async def get_batch_job(jobId: str = Path(..., description="jobId from /v1/batch-jobs")):
+    job = await CHECK_STORE.get(jobId)
+    if not job or "jobId" not in job:
+        raise http_error(404, "NOT_FOUND", "jobId not found")
+    return {key: job[key] for key in ("jobId", "status", "total", "completed", "failed") if key in job}
+
+
+@app.get("/v1/batch-jobs/{jobId}/results")
+async def get_batch_job_results(
+    jobId: str = Path(..., description="jobId from /v1/batch-jobs"),
+    offset: int = 0,
+    limit: int = 50,
+    fmt: ResponseFormat = Query("full", alias="format"),
+):
+    """完了した文書の report を index 順にページングして返す。"""
+    job = await CHECK_STORE.get(jobId)
+    if not job or "jobId" not in job:
+        raise http_error(404, "NOT_FOUND", "jobId not found")
+
+    limit = max(1, min(limit, BATCH_SYNC_MAX_DOCUMENTS))
+    results: List[Dict[str, Any]] = []
+    for item in job["items"][offset:offset + limit]:
+        if item and item.get("checkId"):
+            saved = await CHECK_STORE.get(item["checkId"])
+            if saved:
+                item = {**item, "report": saved.get("report")}
+            else:
+                # TTL 切れや追い出しで消えた結果は report: null ではなく期限切れとして返す
+                item = {
+                    **item,
+                    "status": "expired",
+                    "error": {"error": "EXPIRED", "message": "the result of this document is no longer stored"},
+                }
+        results.append(item)
+    return respond({"jobId": jobId, "status": job["status"], "offset": offset, "results": results}, fmt)
+
+
+@app.post("/v1/checks/{checkId}/recheck")
+async def recheck(
+    checkId: str = Path(..., description="checkId from /v1/checks"),
+    req: RecheckRequest = None,
+    fmt: ResponseFormat = Query("full", alias="format"),
+):
+    mode = req.config.mock if req and req.config else "auto"
+    if should_mock(mode):
+        report = await with_offsets(MOCK_REPORT, req.text)
+        entry = store_entry(req.text, req.settings, report)
+        await CHECK_STORE.update(checkId, lambda saved: carry_over(saved, entry))
+        return respond({"checkId": checkId, "report": report}, fmt)
+
+    # 文書が新しい版になっても古い cached content は消さない。同じ本文の他のチェックが使っている
+    # ことがあるので、CONTEXT_CACHE_TTL で切れるのに任せる（carry_over は本文が変われば引き継がない）
+    saved = await CHECK_STORE.get(checkId)
+
+    # 前回から変わったブロックだけを再チェックできる場合はそちらを使う
+    report = await run_incremental_check(req.text, req.settings, saved)
+    if report is None:
+        prompt = (
+            f"[checkId]\n{checkId}\n\n"
+            f"[settings]\n{format_settings(req.settings)}\n"
+            f"[markdown]\n{req.text}\n"
+        )
+        report = await run_check(req.text, req.settings, prompt)
+
+    report = await with_offsets(report, req.text)
+    # 記録済みのパッチ（と cached content）は release のために引き継ぐ。
+    # チェック中に記録されたパッチも落とさないよう、保存直前のエントリから引き継ぐ
+    entry = store_entry(req.text, req.settings, report)
+    await CHECK_STORE.update(checkId, lambda latest: carry_over(latest, entry))
+    return respond({"checkId": checkId, "report": report}, fmt)
+
+
+@app.post("/v1/patches")
+async def create_patch(req: PatchRequest):
+    mode = req.config.mock if req.config else "auto"
+    if should_mock(mode):
+        return {
+            "patchId": new_patch_id(),
             "findingId": req.findingId,
             "before": "Before ...",
             "after": "After ...",
@@ -685,7 +2513,7 @@ async def create_patch(req: PatchRequest):
         }
 
     # 優先: 保存済み report から finding を取る
-    saved = CHECK_STORE.get(req.checkId)
+    saved = await CHECK_STORE.get(req.checkId)
     finding = None
     report = None
     if saved:
@@ -703,23 +2531,96 @@ async def create_patch(req: PatchRequest):
     patch_prompt = (
         f"[checkId]\n{req.checkId}\n\n"
         f"[finding]\n{json.dumps(finding, ensure_ascii=False)}\n\n"
-        f"[originalText]\n{original_text}\n\n"
-        f"[full_markdown]\n{req.text}\n"
+        f"[originalText]\n{original_text}\n"
     )
 
-    gen = await gemini_json(PATCH_SYSTEM, patch_prompt, PATCH_GEN_SCHEMA)
+    # 伏せ字化で直せる指摘はモデルを呼ばない。それ以外は、文書本体は cached content があればそちらを使う
+    known = saved.get("contextCache")
+    records: List[Dict[str, Any]] = []
+    gen = local_patch(finding, original_text, patch_redact_mode(saved))
+    if gen is None:
+        gen = await gemini_json_for_document(PATCH_SYSTEM, req.text, patch_prompt, PATCH_GEN_SCHEMA, saved)
 
     original = str(gen["originalText"])
     replacement = str(gen["replacement"])
 
-    return {
-        "patchId": new_patch_id(),
+    patch_id = new_patch_id()
+    apply: Dict[str, Any] = {"mode": "replaceText", "originalText": original, "replacement": replacement}
+    result: Dict[str, Any] = {
+        "patchId": patch_id,
         "findingId": req.findingId,
         "before": original,
         "after": replacement,
-        "apply": {"mode": "replaceText", "originalText": original, "replacement": replacement},
+        "apply": apply,
     }
 
+    span = resolve_spans(req.text, [original]).get(original)
+    if span and span["match"] != "fuzzy":
+        start, end = span["start"], span["end"]
+        # 空白の違いだけなら本文中の実際の文字列で置換させる
+        original = req.text[start:end]
+        apply.update({"originalText": original, "start": start, "end": end})
+
+        # 残りの指摘のハイライト位置を、パッチ適用後の本文に合わせてずらす
+        base = report if saved.get("text") == req.text else await with_offsets(report, req.text)
+        items = [i for i in base["highlights"]["items"] if i.get("findingId") != req.findingId]
+        patched = req.text[:start] + replacement + req.text[end:]
+        result["highlights"] = shift_items(items, patched, start, end, len(replacement) - len(original))
+
+        # release で適用できるようにパッチを記録しておく
+        records.append({
+            "patchId": patch_id,
+            "findingId": req.findingId,
+            "start": start,
+            "end": end,
+            "originalText": original,
+            "replacement": replacement,
+        })
+    # 同じ checkId への他のパッチと交差しても記録が消えないよう、最新のエントリに追記する
+    await CHECK_STORE.update(req.checkId, add_patches(records, saved, known))
+
+    return result
+
+
+@app.post("/v1/patches:bulk")
+async def create_bulk_patch(req: BulkPatchRequest):
+    """
+    複数の finding の修正案をまとめて生成し、重ならないものを本文に一括適用する。
+    Returns: {"checkId", "text", "applied", "conflicts", "results": [...], "highlights": [...]}
+    """
+    mode = req.config.mock if req.config else "auto"
+    if should_mock(mode):
+        report = await with_offsets(MOCK_REPORT, req.text)
+        findings = [f for f in report["findings"] if req.findingIds is None or f["id"] in req.findingIds]
+        generated = {f["id"]: [{"originalText": "Before ...", "replacement": "After ..."}] for f in findings}
+        out = apply_bulk_patches(req.text, findings, generated, report)
+        out.pop("edits")
+        return {"checkId": req.checkId, **out}
+
+    saved = await CHECK_STORE.get(req.checkId)
+    report = saved.get("report") if saved else None
+    if not report:
+        raise http_error(404, "NOT_FOUND", "checkId not found")
+
+    if req.findingIds is None:
+        findings = list(report.get("findings", []))
+    else:
+        picked = (pick_finding(report, fid) for fid in dict.fromkeys(req.findingIds))
+        findings = [f for f in picked if f]
+    if not findings:
+        raise http_error(404, "NOT_FOUND", "findingId not found for this checkId")
+
+    known = saved.get("contextCache")
+    generated = await generate_bulk_patches(req.checkId, req.text, findings, saved)
+
+    base = report if saved.get("text") == req.text else await with_offsets(report, req.text)
+    out = apply_bulk_patches(req.text, findings, generated, base)
+
+    # release で適用できるようにパッチを記録しておく（オフセットは req.text 基準）
+    await CHECK_STORE.update(req.checkId, add_patches(out.pop("edits"), saved, known))
+
+    return {"checkId": req.checkId, **out}
+
 
 @app.post("/v1/release")
 async def release(req: ReleaseRequest):
@@ -732,7 +2633,7 @@ async def release(req: ReleaseRequest):
             "publishedScope": req.settings.publishScope,
         }
 
-    saved = CHECK_STORE.get(req.checkId)
+    saved = await CHECK_STORE.get(req.checkId)
     if not saved:
         raise http_error(404, "NOT_FOUND", "checkId not found")
 
@@ -741,17 +2642,78 @@ async def release(req: ReleaseRequest):
     if score < 70:
         raise http_error(409, "LOW_SCORE", "release requires report.score >= 70")
 
-    prompt = (
-        f"[checkId]\n{req.checkId}\n\n"
-        f"[settings]\n{format_settings(req.settings)}\n"
-        f"[markdown]\n{req.text}\n"
-    )
-    out = await gemini_json(RELEASE_SYSTEM, prompt, RELEASE_SCHEMA)
+    # 本文はモデルに書き直させず、記録済みのパッチをローカルで適用する
+    # （req.text はクライアントが反映済みのパッチや手直しを含むので、保存時の本文ではなくこちらを基準にする）
+    # redactMode に応じた伏せ字化も同じ 1 回の適用に含める
+    patches = saved.get("patches", [])
+    _, redactions = await offload(CPU_POOL, redact, req.text, req.settings.redactMode, size=len(req.text))
+    assembled = assemble_release(req.text, patches, redactions)
 
-    # publishedScope は settings に揃える（念のため）
-    out["publishedScope"] = req.settings.publishScope
+    # release は対話的なチェックより後回しにしてよい
+    brief = release_brief(report, assembled["applied"] + assembled["alreadyApplied"], assembled["redacted"])
+    with priority_lane("background"):
+        summary = await release_summary(brief, req.settings)
 
-    return {"releaseId": new_release_id(), "verdict": "ok", **out}
+    return {
+        "releaseId": new_release_id(),
+        "verdict": "ok",
+        "safeMarkdown": assembled["safeMarkdown"],
+        **summary,
+        "publishedScope": req.settings.publishScope,
+        "patches": {
+            "applied": len(assembled["applied"]),
+            "alreadyApplied": len(assembled["alreadyApplied"]),
+            "stale": [p.get("patchId") for p in assembled["stale"]],
+            "conflicts": [p.get("patchId") for p in assembled["conflicts"]],
+        },
+        "redactions": len(assembled["redacted"]),
+    }
+
+
+@app.post("/v1/redactions")
+async def create_redactions(req: RedactRequest):
+    """
+    redactMode に応じて本文をローカルで伏せ字にする（モデルは呼ばない）。
+    Returns: {"text", "redactions": [{"start", "end", "originalText", "replacement", "rule"}, ...]}
+    """
+    text, redactions = await offload(CPU_POOL, redact, req.text, req.mode, size=len(req.text))
+    # 伏せ字が多いと jsonable_encoder だけでループが止まるので直接エンコードする
+    return FastJSONResponse({"text": text, "redactions": redactions})
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    リクエストボディを読みながら応答を書き出すレスポンス。
+    StreamingResponse は送信中に receive() で切断を待つため、ASGI spec 2.4 未満のサーバー（uvicorn の HTTP など）では
+    ボディの読み込みと receive() を取り合ってしまう。body_iterator 側でボディを読み切ることを前提に、切断の監視はしない。
+    """
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        async for chunk in self.body_iterator:
+            body = chunk.encode(self.charset) if isinstance(chunk, str) else chunk
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+@app.post("/v1/redactions:stream")
+async def stream_redactions(request: Request, mode: RedactMode = Query("light")):
+    """
+    大きな入力用。リクエストボディの Markdown（UTF-8 のテキスト）を読みながら、伏せ字にした本文を返していく。
+    """
+    if mode == "none":
+        raise http_error(400, "BAD_REQUEST", "mode must be light or strict")
+    redactor = Redactor(mode)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    async def gen() -> AsyncIterator[str]:
+        async for chunk in request.stream():
+            out = redactor.feed(decoder.decode(chunk))
+            if out:
+                yield out
+        yield redactor.feed(decoder.decode(b"", final=True)) + redactor.close()
+
+    return DuplexStreamingResponse(gen(), media_type="text/markdown; charset=utf-8")
 
 
 @app.post("/v1/persona-review")
@@ -763,12 +2725,153 @@ async def persona_review(req: PersonaReviewRequest):
         mock["audience"] = req.settings.audience
         return mock
 
-    prompt = (
-        f"[settings]\n{format_settings(req.settings)}\n"
-        f"[markdown]\n{req.text}\n"
+    return await run_persona_review(req.text, req.settings)
+
+
+def persona_mock(audience: str) -> Dict[str, Any]:
+    mock = dict(MOCK_PERSONA)
+    mock["audience"] = audience
+    return mock
+
+
+def error_detail(e: HTTPException) -> Dict[str, Any]:
+    detail = e.detail if isinstance(e.detail, dict) else {"error": "ERROR", "message": str(e.detail)}
+    return {"status": e.status_code, **detail}
+
+
+@app.post("/v1/persona-reviews")
+async def persona_reviews(req: PersonaReviewsRequest):
+    """
+    複数の audience のペルソナレビューを並行して実行する。
+    Returns: {"reviews": {audience: review}, "errors": {audience: {"status", "error", "message"}}}
+    """
+    audiences = list(dict.fromkeys(req.audiences or ALL_AUDIENCES))
+    mode = req.config.mock if req.config else "auto"
+    if should_mock(mode):
+        return {"reviews": {a: persona_mock(a) for a in audiences}, "errors": {}}
+
+    reviews: Dict[str, Any] = {}
+    errors: Dict[str, Any] = {}
+    async for audience, out in iter_persona_reviews(req.text, req.settings, audiences):
+        if isinstance(out, HTTPException):
+            errors[audience] = error_detail(out)
+        else:
+            reviews[audience] = out
+    # 結果はリクエストの audience 順に並べる
+    return {
+        "reviews": {a: reviews[a] for a in audiences if a in reviews},
+        "errors": errors,
+    }
+
+
+@app.post("/v1/persona-reviews:stream")
+async def persona_reviews_stream(req: PersonaReviewsRequest):
+    """
+    /v1/persona-reviews の Server-Sent Events 版。
+    audience ごとに終わった順で `event: review`（失敗時は `event: error`）を送り、
+    最後に `event: done` を送る。
+    """
+    audiences = list(dict.fromkeys(req.audiences or ALL_AUDIENCES))
+    mode = req.config.mock if req.config else "auto"
+
+    async def events() -> AsyncIterator[str]:
+        if should_mock(mode):
+            for a in audiences:
+                yield sse_event("review", {"audience": a, "review": persona_mock(a)})
+        else:
+            async for audience, out in iter_persona_reviews(req.text, req.settings, audiences):
+                if isinstance(out, HTTPException):
+                    yield sse_event("error", {"audience": audience, **error_detail(out)})
+                else:
+                    yield sse_event("review", {"audience": audience, "review": out})
+        yield sse_event("done", {"audiences": audiences})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    out = await gemini_json(PERSONA_SYSTEM, prompt, PERSONA_SCHEMA)
 
-    # audience は入力に揃える（念のため）
-    out["audience"] = req.settings.audience
-    return out
+
+@app.post("/v1/reviews")
+async def full_review(req: FullReviewRequest, fmt: ResponseFormat = Query("full", alias="format")):
+    """
+    check とペルソナレビューを 1 リクエストで行う。画像の取得は 1 回だけで、両方を同時に実行する。
+    Returns: {"checkId", "report", "persona": {"reviews": {...}, "errors": {...}}}
+    check が失敗した場合はエラーを返す。ペルソナレビューの失敗は persona.errors に入れる。
+    """
+    audiences = list(dict.fromkeys(req.audiences or [req.settings.audience]))
+    mode = req.config.mock if req.config else "auto"
+    check_id = new_check_id()
+    if should_mock(mode):
+        report = await with_offsets(MOCK_REPORT, req.text)
+        await CHECK_STORE.put(check_id, store_entry(req.text, req.settings, report))
+        return respond({
+            "checkId": check_id,
+            "report": report,
+            "persona": {"reviews": {a: persona_mock(a) for a in audiences}, "errors": {}},
+        }, fmt)
+
+    report: Optional[Dict[str, Any]] = None
+    reviews: Dict[str, Any] = {}
+    errors: Dict[str, Any] = {}
+    # check が失敗したら残りのペルソナレビューもキャンセルする
+    async with aclosing(iter_full_review(req.text, req.settings, audiences)) as results:
+        async for key, out in results:
+            if key == "check":
+                if isinstance(out, HTTPException):
+                    raise out
+                report = await with_offsets(out, req.text)
+                await CHECK_STORE.put(check_id, store_entry(req.text, req.settings, report))
+            elif isinstance(out, HTTPException):
+                errors[key] = error_detail(out)
+            else:
+                reviews[key] = out
+
+    return respond({
+        "checkId": check_id,
+        "report": report,
+        "persona": {"reviews": {a: reviews[a] for a in audiences if a in reviews}, "errors": errors},
+    }, fmt)
+
+
+@app.post("/v1/reviews:stream")
+async def full_review_stream(req: FullReviewRequest):
+    """
+    /v1/reviews の Server-Sent Events 版。終わった順に
+    `event: report`（checkId と report）、audience ごとの `event: review` を送り、最後に `event: done` を送る。
+    失敗時は `event: error` を送る（check の失敗は audience が "check"）。
+    """
+    audiences = list(dict.fromkeys(req.audiences or [req.settings.audience]))
+    mode = req.config.mock if req.config else "auto"
+
+    async def events() -> AsyncIterator[str]:
+        check_id = new_check_id()
+        if should_mock(mode):
+            report = await with_offsets(MOCK_REPORT, req.text)
+            await CHECK_STORE.put(check_id, store_entry(req.text, req.settings, report))
+            yield sse_event("report", {"checkId": check_id, "report": report})
+            for a in audiences:
+                yield sse_event("review", {"audience": a, "review": persona_mock(a)})
+            yield sse_event("done", {"checkId": check_id})
+            return
+
+        try:
+            async for key, out in iter_full_review(req.text, req.settings, audiences):
+                if isinstance(out, HTTPException):
+                    yield sse_event("error", {"audience": key, **error_detail(out)})
+                elif key == "check":
+                    report = await with_offsets(out, req.text)
+                    await CHECK_STORE.put(check_id, store_entry(req.text, req.settings, report))
+                    yield sse_event("report", {"checkId": check_id, "report": report})
+                else:
+                    yield sse_event("review", {"audience": key, "review": out})
+        except HTTPException as e:
+            yield sse_event("error", {"audience": "check", **error_detail(e)})
+        yield sse_event("done", {"checkId": check_id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
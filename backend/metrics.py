@@ -0,0 +1,271 @@
+import sys
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # OpenTelemetry が無い環境ではスパンを作らない
+    otel_trace = None
+
+
+# =========================
+# Metric types
+# =========================
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def set(self, *labels: str, value: float) -> None:
+        # collector から他モジュールの累計値を写すときに使う
+        with self._lock:
+            self._values[labels] = value
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    kind = "histogram"
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., +Inf count], sum
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sums[labels] = self._sums.get(labels, 0.0) + value
+
+    def samples(self) -> List[str]:
+        lines: List[str] = []
+        for labels, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels(self.label_names, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {self._sums[labels]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Prometheus のテキスト形式で出力するメトリクスの集まり。
+    collectors はスクレイプ時に呼ばれ、他モジュールの stats() を Gauge に写すのに使う。
+    """
+
+    def __init__(self) -> None:
+        self.metrics: List[Any] = []
+        self.collectors: List[Callable[[], None]] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def _add(self, metric: Any) -> Any:
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], None]) -> Callable[[], None]:
+        self.collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        for fn in self.collectors:
+            try:
+                fn()
+            except Exception as e:
+                print(f"[WARN] metrics collector failed: {e}")
+        lines: List[str] = []
+        for m in self.metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter("brc_http_requests_total", "HTTP requests by endpoint and status", ["endpoint", "method", "status"])
+HTTP_DURATION = REGISTRY.histogram("brc_http_request_duration_seconds", "HTTP request duration", ["endpoint", "method"])
+HTTP_IN_FLIGHT = REGISTRY.gauge("brc_http_requests_in_flight", "HTTP requests being processed", ["endpoint"])
+STAGE_DURATION = REGISTRY.histogram("brc_stage_duration_seconds", "Duration of processing stages", ["endpoint", "stage"])
+MODEL_TOKENS = REGISTRY.counter("brc_model_tokens_total", "Model tokens by endpoint, model and kind", ["endpoint", "model", "kind"])
+MODEL_CALLS = REGISTRY.counter("brc_model_calls_total", "Model calls by endpoint, model and outcome", ["endpoint", "model", "outcome"])
+
+
+# =========================
+# Request context / stages
+# =========================
+# 現在のリクエストのエンドポイント（ルートのパス）と、Server-Timing 用の段階ごとの時間
+current_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar("current_endpoint", default="background")
+_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("timings", default=None)
+
+
+def _tracer() -> Any:
+    return otel_trace.get_tracer("blog-risk-checker") if otel_trace is not None else None
+
+
+@contextmanager
+def stage(name: str, **attributes: Any) -> Iterator[None]:
+    """
+    処理の段階（image_fetch / model / parse など）の時間を計る。
+    ヒストグラムに記録し、リクエスト中なら Server-Timing に載せ、OpenTelemetry があればスパンを作る。
+    """
+    tracer = _tracer()
+    span_cm = tracer.start_as_current_span(f"brc.{name}", attributes=attributes) if tracer else None
+    if span_cm is not None:
+        span_cm.__enter__()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, current_endpoint.get(), name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+        if span_cm is not None:
+            span_cm.__exit__(*sys.exc_info())
+
+
+def record_model_call(model: str, outcome: str, usage: Any = None) -> None:
+    """モデル呼び出しの結果と usage_metadata のトークン数を記録する。"""
+    endpoint = current_endpoint.get()
+    MODEL_CALLS.inc(endpoint, model, outcome)
+    if usage is None:
+        return
+    for kind, attr in (
+        ("prompt", "prompt_token_count"),
+        ("output", "candidates_token_count"),
+        ("cached", "cached_content_token_count"),
+        ("thoughts", "thoughts_token_count"),
+    ):
+        n = getattr(usage, attr, None)
+        if n:
+            MODEL_TOKENS.inc(endpoint, model, kind, amount=float(n))
+
+
+def server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    """Server-Timing ヘッダの値。同じ段階が複数回あれば合計する。"""
+    merged: Dict[str, float] = {}
+    for name, seconds in timings:
+        merged[name] = merged.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in merged.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# =========================
+# ASGI middleware
+# =========================
+class MetricsMiddleware:
+    """
+    リクエストごとの件数・時間・処理中の数を記録する。
+    server_timing=True ならレスポンスに Server-Timing ヘッダを付ける
+    （ヘッダ送信までに終わった段階だけ。ストリーミングでは途中までになる）。
+    """
+
+    def __init__(self, app: ASGIApp, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    @staticmethod
+    def _endpoint(scope: Scope) -> str:
+        # パスパラメータで系列が増えないよう、ルートのパステンプレートを使う
+        app = scope.get("app")
+        if app is not None:
+            for route in app.router.routes:
+                match, _ = route.matches(scope)
+                if match.name == "FULL":
+                    return route.path
+        return "unmatched"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._endpoint(scope)
+        method = scope["method"]
+        endpoint_token = current_endpoint.set(endpoint)
+        timings: List[Tuple[str, float]] = []
+        timings_token = _timings.set(timings)
+        status = "500"
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(endpoint)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                if self.server_timing:
+                    headers = MutableHeaders(raw=message["headers"])
+                    headers.append("Server-Timing", server_timing(timings, time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec(endpoint)
+            HTTP_REQUESTS.inc(endpoint, method, status)
+            HTTP_DURATION.observe(time.perf_counter() - start, endpoint, method)
+            current_endpoint.reset(endpoint_token)
+            _timings.reset(timings_token)
@@ -0,0 +1,206 @@
+import sys
+import time
+import asyncio
+import functools
+import threading
+import traceback
+import contextvars
+import multiprocessing
+import concurrent.futures
+from typing import Any, Callable, Dict, Optional
+
+from metrics import REGISTRY
+
+
+OFFLOAD_TASKS = REGISTRY.gauge("brc_offload_tasks", "Offloaded tasks waiting for or running on a worker pool", ["pool"])
+OFFLOAD_REJECTED = REGISTRY.counter("brc_offload_rejected_total", "Offloaded tasks rejected because the pool queue was full", ["pool"])
+OFFLOAD_DURATION = REGISTRY.histogram("brc_offload_duration_seconds", "Time from submit to result of offloaded tasks", ["pool"])
+LOOP_LAG = REGISTRY.histogram(
+    "brc_event_loop_lag_seconds", "How late the event loop woke up from a scheduled sleep",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_BLOCKED = REGISTRY.counter("brc_event_loop_blocked_total", "Times the event loop was blocked longer than the threshold")
+
+
+# =========================
+# Worker pools
+# =========================
+class OffloadBusy(Exception):
+    """プールの待ち行列が埋まったまま queue_timeout を過ぎた。"""
+
+    def __init__(self, pool: str):
+        super().__init__(f"{pool} worker pool is busy")
+        self.pool = pool
+
+
+class Offloader:
+    """
+    CPU を使う処理（正規表現の走査・大きな JSON の読み込み・画像のデコードなど）をイベントループの外で実行する。
+    kind: thread（同じプロセスのスレッド）| process（別プロセス。GIL を避けられるが引数と戻り値を pickle する）
+          | inline（ループ上でそのまま実行する）
+    送り込めるのは max_pending 件まで（実行中を含む）。空きを queue_timeout 秒待っても無ければ OffloadBusy。
+    size が min_size 未満の小さな入力は受け渡しのほうが高くつくので、その場で実行する。
+    process では fn と引数を別プロセスへ送るので、fn はモジュールの最上位で定義された関数にすること。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: str = "thread",
+        max_workers: int = 4,
+        max_pending: int = 64,
+        queue_timeout: float = 10.0,
+        min_size: int = 0,
+    ):
+        if kind not in ("thread", "process", "inline"):
+            raise ValueError(f"unknown executor kind: {kind}")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.min_size = min_size
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.submitted = 0
+        self.inline = 0
+        self.rejected = 0
+
+    def _pool(self) -> concurrent.futures.Executor:
+        # 使われるまで作らない（process の起動は数百 ms かかる）
+        if self._executor is None:
+            if self.kind == "process":
+                # fork するとイベントループや HTTP クライアントの状態まで複製されるので spawn を使う
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix=f"brc-{self.name}"
+                )
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any, size: Optional[int] = None) -> Any:
+        if self.kind == "inline" or (size is not None and size < self.min_size):
+            self.inline += 1
+            return fn(*args)
+
+        loop = asyncio.get_running_loop()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            OFFLOAD_REJECTED.inc(self.name)
+            raise OffloadBusy(self.name) from None
+
+        if self.kind == "thread":
+            # stage() の計測がリクエストに紐づくよう contextvars を引き継ぐ
+            call = functools.partial(contextvars.copy_context().run, fn, *args)
+        else:
+            call = functools.partial(fn, *args)
+        self.submitted += 1
+        OFFLOAD_TASKS.inc(self.name)
+        start = time.perf_counter()
+        try:
+            future = self._pool().submit(call)
+        except BaseException:
+            self._release()
+            raise
+
+        def done(_: Any) -> None:
+            OFFLOAD_DURATION.observe(time.perf_counter() - start, self.name)
+            loop.call_soon_threadsafe(self._release)
+
+        # 呼び出し側がキャンセルされても、走り出した処理が終わるまで枠は空けない
+        future.add_done_callback(done)
+        return await asyncio.wrap_future(future)
+
+    def _release(self) -> None:
+        OFFLOAD_TASKS.dec(self.name)
+        if self._slots is not None:
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.max_workers,
+            "pending": OFFLOAD_TASKS.value(self.name),
+            "submitted": self.submitted,
+            "inline": self.inline,
+            "rejected": self.rejected,
+        }
+
+
+# =========================
+# Event loop lag monitor
+# =========================
+class LoopLagMonitor:
+    """
+    イベントループが interval ごとの sleep から何秒遅れて戻ったかを計り、ヒストグラムに記録する。
+    別スレッドの見張りが、ループが threshold 秒以上止まっている間にループのスレッドのスタックを 1 回ログに出す
+    （どの処理がループを止めているかが分かる）。ループが戻ったら止まっていた時間をログに出す。
+    """
+
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1, stack_depth: int = 12):
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_depth = stack_depth
+        self.blocked = 0
+        self.max_lag = 0.0
+        self._beat = time.perf_counter()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        threading.Thread(target=self._watch, name="brc-loop-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self._beat = now
+            lag = max(0.0, now - start - self.interval)
+            LOOP_LAG.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self.blocked += 1
+                LOOP_BLOCKED.inc()
+                print(f"[WARN] event loop was blocked for {lag * 1000:.0f}ms")
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._beat
+            # 次の beat は interval 後なので、それを超えて threshold 以上遅れたら止まっているとみなす
+            if time.perf_counter() - beat < self.interval + self.threshold or reported == beat:
+                continue
+            reported = beat
+            frame = sys._current_frames().get(self._loop_thread) if self._loop_thread is not None else None
+            stack = "".join(traceback.format_stack(frame)[-self.stack_depth:]) if frame is not None else ""
+            print(f"[WARN] event loop blocked for over {self.threshold * 1000:.0f}ms, currently at:\n{stack}", end="")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "thresholdMs": self.threshold * 1000,
+            "blocked": self.blocked,
+            "maxLagMs": round(self.max_lag * 1000, 1),
+        }
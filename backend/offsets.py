@@ -0,0 +1,300 @@
+import re
+import copy
+import bisect
+import difflib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# =========================
+# Line / column index
+# =========================
+class LineIndex:
+    """文字オフセット -> (line, col) の変換。line は 1 始まり、col は 0 始まり。"""
+
+    def __init__(self, text: str):
+        self.starts = [0]
+        for m in re.finditer("\n", text):
+            self.starts.append(m.end())
+
+    def position(self, offset: int) -> Tuple[int, int]:
+        line = bisect.bisect_right(self.starts, offset) - 1
+        return line + 1, offset - self.starts[line]
+
+
+# =========================
+# Span search
+# =========================
+def first_occurrences(text: str, needles: Iterable[str]) -> Dict[str, int]:
+    """
+    複数の文字列の最初の出現位置を 1 回の走査で求める。
+    長いものを優先する先読みの選択肢で全位置を走査するので、重なった出現も拾える。
+    同じ位置から始まる短い文字列は拾えないことがあるため、呼び出し側で str.find で補う。
+    """
+    unique = sorted({n for n in needles if n}, key=len, reverse=True)
+    if not unique:
+        return {}
+    pattern = re.compile("(?=(" + "|".join(re.escape(n) for n in unique) + "))")
+    found: Dict[str, int] = {}
+    for m in pattern.finditer(text):
+        found.setdefault(m.group(1), m.start())
+        if len(found) == len(unique):
+            break
+    return found
+
+
+def _collapse_whitespace(text: str) -> Tuple[str, List[int]]:
+    """連続する空白を 1 つの空白にまとめ、まとめた後の各文字の元オフセットも返す。"""
+    out: List[str] = []
+    index: List[int] = []
+    prev_space = False
+    for i, c in enumerate(text):
+        if c.isspace():
+            if prev_space:
+                continue
+            out.append(" ")
+            prev_space = True
+        else:
+            out.append(c)
+            prev_space = False
+        index.append(i)
+    return "".join(out), index
+
+
+def normalized_find(text: str, needle: str, collapsed: Optional[Tuple[str, List[int]]] = None) -> Optional[Tuple[int, int]]:
+    """空白の違い（改行・連続スペース）を無視して探す。"""
+    norm_text, index = collapsed or _collapse_whitespace(text)
+    norm_needle = " ".join(needle.split())
+    if not norm_needle:
+        return None
+    pos = norm_text.find(norm_needle)
+    if pos < 0:
+        return None
+    start = index[pos]
+    end = index[pos + len(norm_needle) - 1] + 1
+    return start, end
+
+
+# これより長いハイライトや文書ではあいまい検索をしない（コストが大きいため）
+FUZZY_MAX_NEEDLE = 300
+FUZZY_MAX_TEXT = 200_000
+FUZZY_MIN_RATIO = 0.6
+
+
+def fuzzy_find(text: str, needle: str) -> Optional[Tuple[int, int]]:
+    """
+    モデルが原文を少し言い換えた場合のためのあいまい検索。
+    最長一致部分がハイライトの FUZZY_MIN_RATIO 以上を占めれば、その周辺を範囲とする。
+    """
+    if not needle or len(needle) > FUZZY_MAX_NEEDLE or len(text) > FUZZY_MAX_TEXT:
+        return None
+    matcher = difflib.SequenceMatcher(None, text, needle, autojunk=False)
+    m = matcher.find_longest_match(0, len(text), 0, len(needle))
+    if m.size < max(4, len(needle) * FUZZY_MIN_RATIO):
+        return None
+    start = max(0, m.a - m.b)
+    end = min(len(text), start + len(needle))
+    return start, end
+
+
+# 1 つのハイライトについて返す出現位置の上限（短い語が何千回も出る文書で応答が膨らまないように）
+MAX_OCCURRENCES = 50
+
+
+def all_occurrences(text: str, needle: str, first: int, limit: int = MAX_OCCURRENCES) -> List[List[int]]:
+    """first から始まる needle の出現をすべて（重なりも含め limit 件まで）[start, end] で返す。"""
+    out: List[List[int]] = []
+    pos = first
+    while pos >= 0 and len(out) < limit:
+        out.append([pos, pos + len(needle)])
+        pos = text.find(needle, pos + 1)
+    return out
+
+
+# =========================
+# Report annotation
+# =========================
+# 位置として item に付けるキー（位置を外すときはまとめて消す）
+SPAN_KEYS = ("start", "end", "line", "col", "match", "occurrences")
+
+
+def resolve_spans(text: str, needles: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    各文字列を本文中の範囲に解決する。start / end は最初の出現。
+    完全一致で 2 回以上出てくる場合は、すべての出現を occurrences（[[start, end], ...]）にも入れる。
+    Returns: {needle: {"start", "end", "line", "col", "match": "exact"|"normalized"|"fuzzy", "occurrences"?} | None}
+    """
+    needles = [n for n in dict.fromkeys(needles) if n]
+    found = first_occurrences(text, needles)
+    lines = LineIndex(text)
+    collapsed: Optional[Tuple[str, List[int]]] = None
+
+    spans: Dict[str, Optional[Dict[str, Any]]] = {}
+    for n in needles:
+        match = "exact"
+        start = found.get(n)
+        if start is None:
+            start = text.find(n)
+        span: Optional[Tuple[int, int]] = (start, start + len(n)) if start >= 0 else None
+        if span is None:
+            if collapsed is None:
+                collapsed = _collapse_whitespace(text)
+            span, match = normalized_find(text, n, collapsed), "normalized"
+        if span is None:
+            span, match = fuzzy_find(text, n), "fuzzy"
+        if span is None:
+            spans[n] = None
+            continue
+        line, col = lines.position(span[0])
+        spans[n] = {"start": span[0], "end": span[1], "line": line, "col": col, "match": match}
+        if match == "exact":
+            occurrences = all_occurrences(text, n, span[0])
+            if len(occurrences) > 1:
+                spans[n]["occurrences"] = occurrences
+    return spans
+
+
+def annotate_highlights(report: Dict[str, Any], text: str) -> Dict[str, Any]:
+    """
+    report.highlights.items の各要素に start / end / line / col / match を付ける。
+    本文中に見つからなかったものは highlights.unresolved に入れる。report をそのまま更新して返す。
+    """
+    highlights = report.get("highlights")
+    if not isinstance(highlights, dict):
+        return report
+    items = highlights.get("items", [])
+    spans = resolve_spans(text, (item.get("text", "") for item in items))
+
+    unresolved: List[Dict[str, Any]] = []
+    for item in items:
+        for key in SPAN_KEYS:
+            item.pop(key, None)
+        span = spans.get(item.get("text", ""))
+        if span is None:
+            unresolved.append({"findingId": item.get("findingId"), "text": item.get("text", "")})
+        else:
+            item.update(span)
+            if "occurrences" in span:
+                # 同じ本文のハイライト同士で list を共有しない（後で個別にずらすため）
+                item["occurrences"] = [list(o) for o in span["occurrences"]]
+    highlights["unresolved"] = unresolved
+    return report
+
+
+def annotated_copy(report: Dict[str, Any], text: str) -> Dict[str, Any]:
+    """report のコピーに annotate_highlights をかけて返す（元の report は変えない）。"""
+    return annotate_highlights(copy.deepcopy(report), text)
+
+
+# =========================
+# Offset shifting
+# =========================
+def _move(item: Dict[str, Any], move: Callable[[int, int], Optional[List[int]]], lines: LineIndex) -> None:
+    """
+    item の位置（start / end と occurrences）を move(start, end) -> [start, end] | None で動かす。
+    None になった出現は外す。最初の出現が外れたら、残った出現の先頭を start / end にする。
+    """
+    ranges = item.pop("occurrences", None) or [[item["start"], item["end"]]]
+    moved = [r for r in (move(s, e) for s, e in ranges) if r is not None]
+    if not moved:
+        for key in SPAN_KEYS:
+            item.pop(key, None)
+        return
+    item["start"], item["end"] = moved[0]
+    item["line"], item["col"] = lines.position(item["start"])
+    if len(moved) > 1:
+        item["occurrences"] = moved
+
+
+def shift_items(
+    items: List[Dict[str, Any]],
+    text_after: str,
+    edit_start: int,
+    edit_end: int,
+    delta: int,
+) -> List[Dict[str, Any]]:
+    """
+    [edit_start, edit_end) を置換して長さが delta 変わった後のハイライト位置を返す。
+    編集より後ろは delta だけずらし、編集範囲と重なるものは位置を外す（原文が変わったため）。
+    """
+
+    def shift(start: int, end: int) -> Optional[List[int]]:
+        if end <= edit_start:
+            return [start, end]
+        if start >= edit_end:
+            return [start + delta, end + delta]
+        return None
+
+    lines = LineIndex(text_after)
+    shifted: List[Dict[str, Any]] = []
+    for item in items:
+        item = dict(item)
+        if item.get("start") is not None and item.get("end") is not None:
+            _move(item, shift, lines)
+        shifted.append(item)
+    return shifted
+
+
+# =========================
+# Bulk edits
+# =========================
+def apply_edits(
+    text: str,
+    edits: List[Dict[str, Any]],
+) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    edits（各要素に "start" / "end" / "replacement"）を 1 回で適用する。
+    範囲が重なる編集は、リストの先にあるものを優先し、後のものは適用しない。
+    Returns: (適用後の本文, 適用した編集（start 昇順）, 重なりで外した編集)
+    """
+    accepted: List[Dict[str, Any]] = []
+    rejected: List[Dict[str, Any]] = []
+    for edit in edits:
+        start, end = edit["start"], edit["end"]
+        if any((start < a["end"] and a["start"] < end) or start == end == a["start"] for a in accepted):
+            rejected.append(edit)
+        else:
+            accepted.append(edit)
+    accepted.sort(key=lambda e: e["start"])
+
+    parts: List[str] = []
+    pos = 0
+    for edit in accepted:
+        parts.append(text[pos:edit["start"]])
+        parts.append(edit["replacement"])
+        pos = edit["end"]
+    parts.append(text[pos:])
+    return "".join(parts), accepted, rejected
+
+
+def remap_items(
+    items: List[Dict[str, Any]],
+    text_after: str,
+    edits: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """
+    apply_edits で適用した編集（start 昇順）の後のハイライト位置を返す。
+    shift_items の複数編集版。編集範囲と重なるものは位置を外す。
+    """
+    starts = [e["start"] for e in edits]
+    # i 番目の編集より前の編集による長さの変化の累計
+    deltas = [0]
+    for e in edits:
+        deltas.append(deltas[-1] + len(e["replacement"]) - (e["end"] - e["start"]))
+
+    def remap(start: int, end: int) -> Optional[List[int]]:
+        # start 以前に始まる編集の数
+        n = bisect.bisect_right(starts, start)
+        prev = edits[n - 1] if n else None
+        nxt = edits[n] if n < len(edits) else None
+        if (prev and start < prev["end"]) or (nxt and nxt["start"] < end):
+            return None
+        return [start + deltas[n], end + deltas[n]]
+
+    lines = LineIndex(text_after)
+    remapped: List[Dict[str, Any]] = []
+    for item in items:
+        item = dict(item)
+        if item.get("start") is not None and item.get("end") is not None:
+            _move(item, remap, lines)
+        remapped.append(item)
+    return remapped
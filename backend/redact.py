@@ -0,0 +1,288 @@
+import os
+import re
+import functools
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from blocks import FENCE_PATTERN
+from scanner import RULES as SCAN_RULES
+
+
+# =========================
+# Rules
+# =========================
+LIGHT_AND_STRICT = frozenset({"light", "strict"})
+STRICT = frozenset({"strict"})
+
+
+class RedactRule(NamedTuple):
+    name: str
+    pattern: str
+    # どの redactMode で伏せるか
+    modes: FrozenSet[str]
+    # 伏せ字の作り方（Redactor が同じ値に同じ伏せ字を割り当てるための連番を受け取る）
+    mask: Callable[[str, Callable[[str], int]], str]
+    # マッチ文字列を受け取り、伏せる対象なら True（誤検出の除外用）
+    accept: Optional[Callable[[str], bool]] = None
+    # コードブロック内でも伏せるか（鍵情報は常に伏せる）
+    in_code: bool = False
+
+
+SCAN = {r.name: r for r in SCAN_RULES}
+
+# 文書用のアドレス・ループバックは伏せない
+DOC_IP_PATTERN = re.compile(r"^(?:192\.0\.2\.|198\.51\.100\.|203\.0\.113\.|127\.|0\.0\.0\.0$)")
+
+
+def _constant(value: str) -> Callable[[str, Callable[[str], int]], str]:
+    return lambda matched, seq: value
+
+
+def _mask_secret_value(matched: str, seq: Callable[[str], int]) -> str:
+    # 変数名・区切り・引用符は残し、値だけを置き換える
+    m = re.match(r"(?s)(.*?[=:]\s*['\"]?)(.*?)(['\"]?)$", matched)
+    return f"{m.group(1)}YOUR_VALUE{m.group(3)}" if m else "YOUR_VALUE"
+
+
+def _mask_phone(matched: str, seq: Callable[[str], int]) -> str:
+    # 桁数と区切りの形は残す
+    return re.sub(r"\d", "0", matched)
+
+
+def _real_ipv4(matched: str) -> bool:
+    return all(int(p) <= 255 for p in matched.split(".")) and not DOC_IP_PATTERN.match(matched)
+
+
+RULES: List[RedactRule] = [
+    RedactRule("aws_access_key", SCAN["aws_access_key"].pattern, LIGHT_AND_STRICT, _constant("YOUR_ACCESS_KEY_ID"), in_code=True),
+    RedactRule("google_api_key", SCAN["google_api_key"].pattern, LIGHT_AND_STRICT, _constant("YOUR_API_KEY"), in_code=True),
+    RedactRule("github_token", SCAN["github_token"].pattern, LIGHT_AND_STRICT, _constant("YOUR_GITHUB_TOKEN"), in_code=True),
+    RedactRule("slack_token", SCAN["slack_token"].pattern, LIGHT_AND_STRICT, _constant("YOUR_SLACK_TOKEN"), in_code=True),
+    RedactRule(
+        "secret_assignment", SCAN["secret_assignment"].pattern, LIGHT_AND_STRICT, _mask_secret_value,
+        SCAN["secret_assignment"].accept, in_code=True,
+    ),
+    RedactRule(
+        "email", SCAN["email"].pattern, LIGHT_AND_STRICT,
+        lambda matched, seq: f"user{seq(matched)}@example.com",
+        SCAN["email"].accept, in_code=True,
+    ),
+    RedactRule("phone_number", SCAN["phone_number"].pattern, LIGHT_AND_STRICT, _mask_phone, in_code=True),
+    RedactRule(
+        "internal_host", SCAN["internal_host"].pattern, LIGHT_AND_STRICT,
+        lambda matched, seq: f"host{seq(matched.lower())}.example.com",
+        SCAN["internal_host"].accept,
+    ),
+    RedactRule(
+        "ip_address", r"(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?!\.?\d)", STRICT,
+        lambda matched, seq: f"192.0.2.{seq(matched)}",
+        _real_ipv4,
+    ),
+    RedactRule(
+        "high_entropy_token", SCAN["high_entropy_token"].pattern, STRICT, _constant("YOUR_TOKEN"),
+        SCAN["high_entropy_token"].accept, in_code=True,
+    ),
+]
+
+PRIVATE_KEY_BEGIN = re.compile(r"-----BEGIN (?:[A-Z]+ )?PRIVATE KEY-----")
+PRIVATE_KEY_END = re.compile(r"-----END (?:[A-Z]+ )?PRIVATE KEY-----")
+PRIVATE_KEY_MASK = "(秘密鍵は削除しました)\n"
+
+
+def load_names() -> Tuple[str, ...]:
+    """
+    伏せる人名の辞書。REDACT_NAMES（カンマ区切り）と REDACT_NAMES_FILE（1 行 1 名）から読む。
+    Redactor を作るたびに呼ばれるので、環境変数の値とファイルの mtime が変わらない限り読み直さない。
+    """
+    path = os.getenv("REDACT_NAMES_FILE")
+    mtime = None
+    if path:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError as e:
+            print(f"[WARN] Failed to read REDACT_NAMES_FILE: {e}")
+            path = None
+    return _read_names(os.getenv("REDACT_NAMES", ""), path, mtime)
+
+
+@functools.lru_cache(maxsize=8)
+def _read_names(env: str, path: Optional[str], mtime: Optional[int]) -> Tuple[str, ...]:
+    names = [n.strip() for n in env.split(",")]
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                names += [line.strip() for line in f]
+        except OSError as e:
+            print(f"[WARN] Failed to read REDACT_NAMES_FILE: {e}")
+    return tuple(n for n in dict.fromkeys(names) if n)
+
+
+def compile_rules(rules: List[RedactRule]) -> Optional["re.Pattern[str]"]:
+    # 全ルールを 1 本の正規表現にまとめ、1 行を 1 回走査するだけで済ませる（scanner と同じ）
+    if not rules:
+        return None
+    return re.compile("|".join(f"(?P<r{i}>{r.pattern})" for i, r in enumerate(rules)))
+
+
+@functools.lru_cache(maxsize=32)
+def _build_rules(
+    mode: str, code: str, names: Tuple[str, ...]
+) -> Tuple[List[RedactRule], Optional["re.Pattern[str]"], List[RedactRule], Optional["re.Pattern[str]"]]:
+    """(prose のルール, その正規表現, コードブロック用のルール, その正規表現)。同じ組み合わせでは作り直さない。"""
+    rules = [r for r in RULES if mode in r.modes]
+    names = tuple(sorted(names, key=len, reverse=True))
+    if names:
+        pattern = "|".join(re.escape(n) for n in names)
+        rules.append(RedactRule("person_name", pattern, LIGHT_AND_STRICT, lambda matched, seq: f"人物{_letter(seq(matched))}"))
+    code_rules = [r for r in rules if r.in_code] if code == "secrets" else rules
+    return rules, compile_rules(rules), code_rules, None if code == "skip" else compile_rules(code_rules)
+
+
+# =========================
+# Redactor
+# =========================
+# code: コードブロックの扱い。skip（伏せない）| secrets（in_code のルールだけ）| all
+CODE_POLICY_DEFAULTS = {"light": "secrets", "strict": "all"}
+
+
+class Redactor:
+    """
+    redactMode（light / strict）に応じて Markdown の機密情報を伏せ字にする。モデルは呼ばない。
+    本文を行単位で 1 回だけ走査し、フェンスの内外と秘密鍵ブロックの状態を持ち回る。
+    redact() は全文を一度に、feed() / close() は大きな入力をチャンクごとに処理する。
+    同じ値には文書内で同じ伏せ字（user1@example.com, host2.example.com など）を割り当てる。
+    """
+
+    def __init__(self, mode: str, names: Optional[Iterable[str]] = None, code: Optional[str] = None):
+        if mode not in CODE_POLICY_DEFAULTS:
+            raise ValueError(f"unknown redact mode: {mode}")
+        self.mode = mode
+        self.code = code or CODE_POLICY_DEFAULTS[mode]
+
+        names = load_names() if names is None else tuple(dict.fromkeys(n for n in names if n))
+        self.rules, self._prose, self._code_rules, self._code = _build_rules(mode, self.code, names)
+
+        # 走査の状態
+        self._pos = 0
+        self._pending = ""
+        self._fence: Optional[str] = None
+        self._in_key = False
+        self._key_masked = False
+        self._seq: Dict[Tuple[str, str], int] = {}
+        self._seq_counts: Dict[str, int] = {}
+        self.redactions: List[Dict[str, Any]] = []
+
+    def _number(self, rule: str) -> Callable[[str], int]:
+        def seq(value: str) -> int:
+            key = (rule, value)
+            if key not in self._seq:
+                self._seq_counts[rule] = self._seq_counts.get(rule, 0) + 1
+                self._seq[key] = self._seq_counts[rule]
+            return self._seq[key]
+        return seq
+
+    def _record(self, start: int, end: int, original: str, replacement: str, rule: str) -> None:
+        self.redactions.append({
+            "start": start,
+            "end": end,
+            "originalText": original,
+            "replacement": replacement,
+            "rule": rule,
+        })
+
+    def _line(self, line: str) -> str:
+        """1 行（改行を含む）を伏せ字にして返す。"""
+        pos = self._pos
+        self._pos += len(line)
+        body = line.rstrip("\r\n")
+
+        # 秘密鍵ブロックは BEGIN / END の行を残し、中身を 1 行の注記に置き換える
+        if self._in_key:
+            if PRIVATE_KEY_END.search(body):
+                self._in_key = False
+                return line
+            replacement = "" if self._key_masked else PRIVATE_KEY_MASK
+            self._key_masked = True
+            self._record(pos, pos + len(line), line, replacement, "private_key")
+            return replacement
+        if PRIVATE_KEY_BEGIN.search(body) and not PRIVATE_KEY_END.search(body):
+            self._in_key, self._key_masked = True, False
+            return line
+
+        fence = FENCE_PATTERN.match(body)
+        if fence:
+            marker = fence.group(1)
+            if self._fence is None:
+                self._fence = marker
+            elif marker[0] == self._fence[0] and len(marker) >= len(self._fence) and not body.strip().strip(marker[0]):
+                self._fence = None
+            return line
+
+        in_code = self._fence is not None
+        pattern = self._code if in_code else self._prose
+        if pattern is None:
+            return line
+        rules = self._code_rules if in_code else self.rules
+
+        parts: List[str] = []
+        last = 0
+        for m in pattern.finditer(line):
+            rule = rules[int(m.lastgroup[1:])]
+            matched = m.group()
+            if rule.accept is not None and not rule.accept(matched):
+                continue
+            replacement = rule.mask(matched, self._number(rule.name))
+            if replacement == matched:
+                continue
+            parts.append(line[last:m.start()])
+            parts.append(replacement)
+            last = m.end()
+            self._record(pos + m.start(), pos + m.end(), matched, replacement, rule.name)
+        if not parts:
+            return line
+        parts.append(line[last:])
+        return "".join(parts)
+
+    def feed(self, chunk: str) -> str:
+        """チャンクを受け取り、行として確定した部分を伏せ字にして返す（行の途中は次回に持ち越す）。"""
+        data = self._pending + chunk
+        cut = data.rfind("\n") + 1
+        self._pending = data[cut:]
+        return "".join(self._line(line) for line in data[:cut].splitlines(keepends=True))
+
+    def close(self) -> str:
+        """持ち越した最後の行を処理して返す。"""
+        rest, self._pending = self._pending, ""
+        return self._line(rest) if rest else ""
+
+    def stream(self, chunks: Iterable[str]) -> Iterator[str]:
+        for chunk in chunks:
+            out = self.feed(chunk)
+            if out:
+                yield out
+        out = self.close()
+        if out:
+            yield out
+
+    def redact(self, text: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Returns: (伏せ字にした本文, [{"start", "end", "originalText", "replacement", "rule"}, ...])
+        start / end は元の本文のオフセット（start 昇順）で、apply_edits にそのまま渡せる。
+        """
+        out = self.feed(text) + self.close()
+        return out, self.redactions
+
+
+def _letter(n: int) -> str:
+    """1 -> A, 26 -> Z, 27 -> AA"""
+    s = ""
+    while n > 0:
+        n, r = divmod(n - 1, 26)
+        s = chr(ord("A") + r) + s
+    return s
+
+
+def redact(text: str, mode: str, names: Optional[Iterable[str]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """mode が none なら何もしない。それ以外は Redactor(mode).redact(text)。"""
+    if mode == "none":
+        return text, []
+    return Redactor(mode, names).redact(text)
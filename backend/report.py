@@ -0,0 +1,143 @@
+from typing import Any, Dict, List, Tuple
+
+
+# =========================
+# Local report assembly
+# =========================
+SEVERITIES = ("low", "medium", "high", "critical")
+
+# 1件あたりの減点。MOCK_REPORT (high 1 + medium 1) が 72 点になる重み
+SEVERITY_PENALTY: Dict[str, int] = {"low": 2, "medium": 8, "high": 20, "critical": 40}
+
+
+def compute_score(findings: List[Dict[str, Any]]) -> int:
+    penalty = sum(SEVERITY_PENALTY.get(f.get("severity", "low"), 0) for f in findings)
+    return max(0, 100 - penalty)
+
+
+def compute_verdict(score: int, by_severity: Dict[str, int]) -> str:
+    if by_severity.get("critical", 0) > 0 or score < 50:
+        return "bad"
+    if by_severity.get("high", 0) > 0 or score < 90:
+        return "warn"
+    return "ok"
+
+
+def summarize(findings: List[Dict[str, Any]]) -> Dict[str, Any]:
+    by_severity = {s: 0 for s in SEVERITIES}
+    by_category: Dict[str, int] = {}
+    for f in findings:
+        sev = f.get("severity", "low")
+        by_severity[sev] = by_severity.get(sev, 0) + 1
+        cat = f.get("category", "other")
+        by_category[cat] = by_category.get(cat, 0) + 1
+    return {"totalFindings": len(findings), "bySeverity": by_severity, "byCategory": by_category}
+
+
+def finding_key(f: Dict[str, Any]) -> Tuple[str, Tuple[str, ...]]:
+    """重複判定用のキー（カテゴリ + 空白を詰めたハイライト文字列）。"""
+    texts = tuple(sorted(" ".join(h.get("text", "").split()) for h in f.get("highlights", [])))
+    return f.get("category", ""), texts
+
+
+def dedupe_findings(findings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """同じカテゴリ・同じ箇所の指摘は先勝ちで 1 件にまとめる。"""
+    seen = set()
+    out: List[Dict[str, Any]] = []
+    for f in findings:
+        key = finding_key(f)
+        if key in seen:
+            continue
+        seen.add(key)
+        out.append(f)
+    return out
+
+
+def merge_findings(
+    primary: List[Dict[str, Any]],
+    secondary: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """
+    primary を優先して secondary を足す。
+    secondary のうち、同じカテゴリで、すべてのハイライトが primary のハイライトと重なる
+    （一方が他方を含む）ものは重複として落とす。
+    """
+    primary_texts = [
+        (f.get("category"), h.get("text", ""))
+        for f in primary
+        for h in f.get("highlights", [])
+        if h.get("text")
+    ]
+
+    def covered(category: Any, text: str) -> bool:
+        return any(c == category and (text in p or p in text) for c, p in primary_texts)
+
+    merged = list(primary)
+    for f in secondary:
+        texts = [h.get("text", "") for h in f.get("highlights", []) if h.get("text")]
+        if texts and all(covered(f.get("category"), t) for t in texts):
+            continue
+        merged.append(f)
+    return dedupe_findings(merged)
+
+
+def build_report(findings: List[Dict[str, Any]], id_prefix: str = "f_") -> Dict[str, Any]:
+    """
+    findings から REPORT_SCHEMA 形式の report を組み立てる。
+    id は f_001 から振り直し、summary / verdict / score / highlights.items はローカルで再計算する。
+    """
+    renumbered: List[Dict[str, Any]] = []
+    for i, f in enumerate(findings, start=1):
+        renumbered.append({**f, "id": f"{id_prefix}{i:03d}"})
+
+    summary = summarize(renumbered)
+    score = compute_score(renumbered)
+    items = [
+        {"findingId": f["id"], "text": h["text"]}
+        for f in renumbered
+        for h in f.get("highlights", [])
+    ]
+    return {
+        "verdict": compute_verdict(score, summary["bySeverity"]),
+        "score": score,
+        "summary": summary,
+        "findings": renumbered,
+        "highlights": {"mode": "text", "items": items},
+    }
+
+
+# =========================
+# Compact format
+# =========================
+OFFSET_KEYS = ("start", "end", "line", "col", "match", "occurrences")
+
+
+def compact_report(report: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    highlights.items を落とした report を返す（items は findings から組み立て直せる）。
+    items に付いていた位置（start / end / line / col / match / occurrences）は findings[].highlights[] に移す。
+    """
+    highlights = report.get("highlights")
+    if not isinstance(highlights, dict) or "items" not in highlights:
+        return report
+
+    by_finding: Dict[Any, List[Dict[str, Any]]] = {}
+    for item in highlights["items"]:
+        by_finding.setdefault(item.get("findingId"), []).append(item)
+
+    findings: List[Dict[str, Any]] = []
+    for f in report.get("findings", []):
+        items = by_finding.get(f.get("id"), [])
+        moved: List[Dict[str, Any]] = []
+        for n, h in enumerate(f.get("highlights", [])):
+            item = items[n] if n < len(items) else None
+            if item is not None and item.get("text") == h.get("text"):
+                h = {**h, **{k: item[k] for k in OFFSET_KEYS if k in item}}
+            moved.append(h)
+        findings.append({**f, "highlights": moved})
+
+    return {
+        **report,
+        "findings": findings,
+        "highlights": {k: v for k, v in highlights.items() if k != "items"},
+    }
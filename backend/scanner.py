@@ -0,0 +1,258 @@
+import re
+import math
+from collections import Counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+
+# =========================
+# Rules
+# =========================
+class Rule(NamedTuple):
+    name: str
+    pattern: str
+    category: str
+    severity: str
+    title: str
+    reason: str
+    suggestion: str
+    # マッチ文字列を受け取り、指摘対象なら True（誤検出の除外用）
+    accept: Optional[Callable[[str], bool]] = None
+
+
+PLACEHOLDER_PATTERN = re.compile(
+    r"^(?:x+|\*+|\.+|<[^>]*>|\$\{[^}]*\}|\{\{[^}]*\}\}|your[-_\s].*|changeme|dummy.*|example.*|sample.*|hoge|fuga|null|none|true|false)$",
+    re.IGNORECASE,
+)
+
+INTERNAL_LABELS = {"internal", "corp", "intra", "intranet", "lan", "local", "localdomain"}
+
+# 2 文字の TLD（国別）はすべて認め、3 文字以上はよく使われるものだけを認める
+GENERIC_TLDS = {
+    "com", "net", "org", "edu", "gov", "mil", "int", "info", "biz", "name", "pro", "mobi",
+    "io", "dev", "app", "cloud", "tech", "xyz", "site", "online", "page", "tokyo", "nagoya", "osaka",
+}
+# 2 文字でもファイルの拡張子として使われるもの（icon@2x.md などをメールアドレス・ホスト名とみなさない）
+FILE_EXTENSIONS = {"md", "js", "ts", "py", "rb", "go", "rs", "sh", "cc", "hh", "mk"}
+
+# ホスト名の 1 ラベルと、内部向けのラベル
+_LABEL = r"[a-z0-9](?:[a-z0-9\-]*[a-z0-9])?"
+_INTERNAL = r"(?:internal|corp|intra|intranet|lan|local|localdomain)"
+_HOST = rf"(?:{_LABEL}\.)*{_INTERNAL}(?:\.{_LABEL})*"
+_HOST_START = r"(?<![\w.\-])"
+_HOST_END = r"(?![\w\-]|\.\w)"
+
+
+def shannon_entropy(s: str) -> float:
+    counts = Counter(s)
+    n = len(s)
+    return -sum(c / n * math.log2(c / n) for c in counts.values())
+
+
+def _real_tld(label: str) -> bool:
+    return label.isalpha() and label.islower() and (
+        label in GENERIC_TLDS or (len(label) == 2 and label not in FILE_EXTENSIONS)
+    )
+
+
+def _real_secret_value(match: str) -> bool:
+    value = re.split(r"[=:]", match, maxsplit=1)[-1].strip().strip("'\"")
+    return bool(value) and not PLACEHOLDER_PATTERN.match(value)
+
+
+def _high_entropy_token(match: str) -> bool:
+    return (
+        any(c.isupper() for c in match)
+        and any(c.islower() for c in match)
+        and any(c.isdigit() for c in match)
+        and shannon_entropy(match) >= 4.0
+    )
+
+
+def _internal_host(match: str) -> bool:
+    # com.example.internal.Foo のようなパッケージ名・クラス名は、最後のラベルが TLD でも内部向けのラベルでもない
+    labels = match.split(".")
+    last = labels[-1]
+    return (
+        len(labels) >= 2
+        and any(label.lower() in INTERNAL_LABELS for label in labels)
+        and (last in INTERNAL_LABELS or _real_tld(last))
+    )
+
+
+def _not_example_email(match: str) -> bool:
+    local, domain = match.rsplit("@", 1)
+    domain = domain.lower()
+    # git@github.com は SSH のユーザー名で、個人のアドレスではない
+    if local.lower() == "git":
+        return False
+    last = domain.rsplit(".", 1)[-1]
+    if not (_real_tld(last) or last in INTERNAL_LABELS):
+        return False
+    return not re.match(r"^(?:[a-z0-9-]+\.)*example\.(?:com|net|org)$", domain)
+
+
+RULES: List[Rule] = [
+    Rule(
+        "private_key",
+        r"-----BEGIN (?:[A-Z]+ )?PRIVATE KEY-----",
+        "security", "critical",
+        "秘密鍵が含まれている",
+        "秘密鍵のヘッダが含まれており、鍵本体が公開される可能性がある。",
+        "秘密鍵を削除し、該当の鍵を失効・再発行する。",
+    ),
+    Rule(
+        "aws_access_key",
+        r"\b(?:AKIA|ASIA)[0-9A-Z]{16}\b",
+        "security", "critical",
+        "AWS アクセスキーが含まれている",
+        "AWS のアクセスキー ID の形式に一致する文字列がある。",
+        "キーを削除して失効させ、記事中はダミー値に置き換える。",
+    ),
+    Rule(
+        "google_api_key",
+        r"\bAIza[0-9A-Za-z_\-]{35}\b",
+        "security", "critical",
+        "Google API キーが含まれている",
+        "Google API キーの形式に一致する文字列がある。",
+        "キーを削除して再発行し、記事中はダミー値に置き換える。",
+    ),
+    Rule(
+        "github_token",
+        r"\b(?:gh[pousr]_[A-Za-z0-9]{36,}|github_pat_[A-Za-z0-9_]{40,})\b",
+        "security", "critical",
+        "GitHub トークンが含まれている",
+        "GitHub のアクセストークンの形式に一致する文字列がある。",
+        "トークンを失効させ、記事中はダミー値に置き換える。",
+    ),
+    Rule(
+        "slack_token",
+        r"\bxox[abposr]-[A-Za-z0-9-]{10,}\b",
+        "security", "critical",
+        "Slack トークンが含まれている",
+        "Slack トークンの形式に一致する文字列がある。",
+        "トークンを失効させ、記事中はダミー値に置き換える。",
+    ),
+    Rule(
+        "secret_assignment",
+        # 値は <...> のプレースホルダ・引用符で囲んだ値・空白までの値のいずれか（プレースホルダは丸ごと取ってから除外する）
+        r"(?i:\b[A-Z0-9_]*(?:API_?KEY|SECRET|TOKEN|PASSWORD|PASSWD)[A-Z0-9_]*\s*[=:]\s*"
+        r"(?:<[^>\n]*>|'[^'\n]{4,}'|\"[^\"\n]{4,}\"|[^\s'\"<]{4,}))",
+        "security", "high",
+        "鍵情報の値が記載されている",
+        "API キー・パスワード等の変数に具体的な値が代入されている。",
+        "値を削除するか、YOUR_API_KEY のようなプレースホルダに置き換える。",
+        _real_secret_value,
+    ),
+    Rule(
+        "email",
+        # git@github.com:org/repo.git のような SCP 形式は除く
+        r"(?<![\w.%+\-])[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}\b(?!:[\w~/])",
+        "privacy", "medium",
+        "メールアドレスが含まれている",
+        "個人や組織に連絡できるメールアドレスが公開される。",
+        "メールアドレスを削除するか user@example.com などに置き換える。",
+        _not_example_email,
+    ),
+    Rule(
+        "phone_number",
+        r"(?<![\d\-])(?:0\d{1,4}-\d{1,4}-\d{3,4}|\+\d{1,3}[\s\-]\d{1,4}[\s\-]\d{2,4}[\s\-]\d{3,4})(?![\d\-])",
+        "privacy", "medium",
+        "電話番号が含まれている",
+        "個人や組織の電話番号が公開される。",
+        "電話番号を削除するか 000-0000-0000 のようなダミーに置き換える。",
+    ),
+    Rule(
+        "private_ip",
+        # v10.0.0.1 や version 10.0.0.1 のようなバージョン番号は除く
+        r"(?<![\d.])(?i:(?<!v)(?<!version )(?<!version: )(?<!ver\. ))(?<!バージョン)(?<!バージョン )"
+        r"(?:10\.\d{1,3}\.\d{1,3}\.\d{1,3}|192\.168\.\d{1,3}\.\d{1,3}|172\.(?:1[6-9]|2\d|3[01])\.\d{1,3}\.\d{1,3})(?!\.?\d)",
+        "security", "low",
+        "プライベート IP アドレスが含まれている",
+        "社内ネットワーク構成の推測につながる。",
+        "IP アドレスを 192.0.2.0/24 などの文書用アドレスに置き換える。",
+    ),
+    Rule(
+        "internal_host",
+        # URL（://）・アドレス（@）の後ろやポート番号の前にあるホスト名か、ラベルが 3 つ以上あるホスト名だけを見る
+        # （api.internal のような 2 ラベルの語はパッケージ名などと区別できない）
+        rf"(?i:(?:(?<=://)|(?<=@)){_HOST}{_HOST_END}"
+        rf"|{_HOST_START}{_HOST}(?=:\d{{2,5}}\b)"
+        rf"|{_HOST_START}(?:(?:{_LABEL}\.){{2,}}{_INTERNAL}(?:\.{_LABEL})*|{_LABEL}\.{_INTERNAL}(?:\.{_LABEL})+"
+        rf"|{_INTERNAL}(?:\.{_LABEL}){{2,}}){_HOST_END})",
+        "security", "medium",
+        "内部ホスト名が含まれている",
+        "社内ホスト名が含まれている。",
+        "ドメインを example.com に置換する。",
+        _internal_host,
+    ),
+    Rule(
+        "high_entropy_token",
+        r"(?<![A-Za-z0-9_\-/.])[A-Za-z0-9_\-]{32,}(?![A-Za-z0-9_\-/])",
+        "security", "medium",
+        "トークンらしき文字列が含まれている",
+        "ランダム性の高い長い文字列があり、API キーやトークンの可能性がある。",
+        "実際の鍵であれば削除して失効させ、ダミー値に置き換える。",
+        _high_entropy_token,
+    ),
+]
+
+# 全ルールを 1 本の正規表現にまとめ、本文を 1 回走査するだけで済ませる
+COMBINED_PATTERN = re.compile("|".join(f"(?P<r{i}>{r.pattern})" for i, r in enumerate(RULES)))
+
+# 1 本の正規表現では重なったマッチは左端のルールしか取れない（API_KEY=AKIA... は secret_assignment になる）。
+# 他のルールのマッチの中は、形式の決まった critical のルールでもう一度探し、見つかればそちらを採る
+TOKEN_RULES = [r for r in RULES if r.severity == "critical"]
+TOKEN_PATTERN = re.compile("|".join(f"(?P<r{i}>{r.pattern})" for i, r in enumerate(TOKEN_RULES)))
+
+
+# =========================
+# Scanner
+# =========================
+def scan_markdown(text: str) -> List[Dict[str, Any]]:
+    """
+    本文をローカルルールで走査し、REPORT_SCHEMA の findings 形式で返す。
+    highlights.text は本文中の文字列そのもの。同じ文字列・同じルールは 1 件にまとめる。
+    """
+    findings: List[Dict[str, Any]] = []
+    seen = set()
+    for m in COMBINED_PATTERN.finditer(text):
+        rule = RULES[int(m.lastgroup[1:])]
+        matched = m.group()
+        hits = []
+        if rule.severity != "critical":
+            hits = [(TOKEN_RULES[int(t.lastgroup[1:])], t.group()) for t in TOKEN_PATTERN.finditer(matched)]
+        if not hits:
+            if rule.accept is not None and not rule.accept(matched):
+                continue
+            hits = [(rule, matched)]
+        for rule, matched in hits:
+            if (rule.name, matched) in seen:
+                continue
+            seen.add((rule.name, matched))
+            findings.append(_finding(len(findings) + 1, rule, matched))
+    return findings
+
+
+def _finding(n: int, rule: Rule, matched: str) -> Dict[str, Any]:
+    return {
+        "id": f"s_{n:03d}",
+        "category": rule.category,
+        "severity": rule.severity,
+        "title": rule.title,
+        "reason": rule.reason,
+        "suggestion": rule.suggestion,
+        "highlights": [{"text": matched, "context": f"ローカル検出: {rule.name}"}],
+        "tags": ["local-scan", rule.name],
+    }
+
+
+def prescan_note(findings: List[Dict[str, Any]]) -> str:
+    """検出済みの箇所をモデルに伝え、同じ指摘を出力させないためのプロンプト断片。"""
+    if not findings:
+        return ""
+    lines = [f"- {f['highlights'][0]['text']} ({f['title']})" for f in findings]
+    return (
+        "\n[prescan]\n以下はローカル検査で検出済みです。これらと同じ指摘は出力しないでください。\n"
+        + "\n".join(lines)
+        + "\n"
+    )
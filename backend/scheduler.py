@@ -0,0 +1,320 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar, Union
+
+T = TypeVar("T")
+
+
+# =========================
+# Priority lanes
+# =========================
+# 値が小さいほど優先（対話的なチェックが release やバッチより先に通る）
+PRIORITIES: Dict[str, int] = {"interactive": 0, "background": 1, "batch": 2}
+
+
+class SharedLane:
+    """
+    複数の呼び出し元で共有する処理（同じチェックの相乗りなど）の優先度。
+    後から優先度の高い呼び出し元が加わったら raise_to で引き上げる（待ち行列の中の呼び出しにも効く）。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def raise_to(self, name: str) -> None:
+        if PRIORITIES.get(name, PRIORITIES["interactive"]) < PRIORITIES.get(self.name, PRIORITIES["interactive"]):
+            self.name = name
+
+
+model_priority: contextvars.ContextVar[Union[str, SharedLane]] = contextvars.ContextVar(
+    "model_priority", default="interactive"
+)
+
+
+def current_lane() -> str:
+    value = model_priority.get()
+    return value.name if isinstance(value, SharedLane) else value
+
+
+@contextmanager
+def priority_lane(name: Union[str, SharedLane]) -> Iterator[None]:
+    """with 内（とそこから起動したタスク）のモデル呼び出しの優先度を切り替える。"""
+    token = model_priority.set(name)
+    try:
+        yield
+    finally:
+        model_priority.reset(token)
+
+
+# =========================
+# Error classification
+# =========================
+class SchedulerTimeout(Exception):
+    """期限内に実行枠を確保できなかった。"""
+
+
+def is_rate_limited(e: BaseException) -> bool:
+    if getattr(e, "status_code", None) is not None:
+        return False
+    if getattr(e, "code", None) == 429:
+        return True
+    msg = str(e)
+    return "429" in msg and "RESOURCE_EXHAUSTED" in msg
+
+
+def is_retryable(e: BaseException) -> bool:
+    # status_code を持つのはアプリ自身が投げた HTTP エラー（設定の不備など）なので再試行しない
+    if getattr(e, "status_code", None) is not None:
+        return False
+    if is_rate_limited(e) or isinstance(e, asyncio.TimeoutError):
+        return True
+    if getattr(e, "code", None) in {500, 502, 503, 504}:
+        return True
+    # メッセージ中の数字（"503" など）は偶然含まれうるので、gRPC のステータス名だけを見る
+    msg = str(e)
+    return any(s in msg for s in ("UNAVAILABLE", "DEADLINE_EXCEEDED"))
+
+
+def estimate_tokens(contents: Any) -> int:
+    """プロンプトの入力トークン数をざっくり見積もる（文字列は 1 文字 ≒ 0.5 トークン、画像は 258）。"""
+    if isinstance(contents, str):
+        return len(contents) // 2 + 1
+    if isinstance(contents, list):
+        return sum(estimate_tokens(c) for c in contents)
+    return 258
+
+
+# =========================
+# Token bucket
+# =========================
+class TokenBucket:
+    """1 分あたり rate_per_minute を上限とするトークンバケット（0 なら無制限）。"""
+
+    def __init__(self, rate_per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.clock = clock
+        self.updated = clock()
+
+    def reserve(self, amount: float) -> float:
+        """amount を予約し、使えるようになるまでの待ち秒数を返す。"""
+        if self.rate <= 0:
+            return 0.0
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+# =========================
+# Scheduler
+# =========================
+class ModelScheduler:
+    """
+    すべてのモデル呼び出しを通す中央スケジューラ。
+
+    - 同時実行数の上限（429 を受けると半減し、成功ごとに少しずつ戻す AIMD）
+    - リクエスト数 / 推定トークン数のトークンバケット
+    - 優先度レーン（interactive > background > batch）
+    - 429 / 5xx に対するジッター付き指数バックオフ（deadline まで）
+
+    call は引数なしで awaitable を返す関数なので、偽クライアントでもテストできる。
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        min_in_flight: int = 1,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        deadline: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ):
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min_in_flight
+        self.limit = float(max_in_flight)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.clock = clock
+        self.sleep = sleep
+        self.request_bucket = TokenBucket(requests_per_minute, clock)
+        self.token_bucket = TokenBucket(tokens_per_minute, clock)
+
+        self.in_flight = 0
+        self._waiters: List[List[Any]] = []
+        self._seq = itertools.count()
+        self._cond: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_decrease = float("-inf")
+
+        self.throttled = 0
+        self.retries = 0
+        self.timeouts = 0
+
+    def _condition(self) -> asyncio.Condition:
+        # イベントループ上で初めて使うときに作る（import 時にはループが無い）。
+        # Condition は作ったループでしか使えないので、別のループ（テストやベンチの asyncio.run）で
+        # 使われたら作り直す。前のループの待ち行列と実行中の枠はもう進まないので数え直す
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+            self._waiters = []
+            self.in_flight = 0
+        return self._cond
+
+    # ---- AIMD ----
+    def on_success(self) -> None:
+        self.limit = min(float(self.max_in_flight), self.limit + 1.0 / max(self.limit, 1.0))
+
+    def on_throttle(self) -> None:
+        self.throttled += 1
+        now = self.clock()
+        # 同時に返ってきた 429 で何度も半減しないよう、1 秒に 1 回だけ下げる
+        if now - self._last_decrease >= 1.0:
+            self.limit = max(float(self.min_in_flight), self.limit / 2)
+            self._last_decrease = now
+
+    def _reprioritize(self) -> None:
+        # 待っている間に SharedLane の優先度が上がった呼び出しを並び順に反映する
+        changed = False
+        for w in self._waiters:
+            if w[2] is not None:
+                lane = PRIORITIES.get(w[2].name, PRIORITIES["interactive"])
+                if lane < w[0]:
+                    w[0] = lane
+                    changed = True
+        if changed:
+            heapq.heapify(self._waiters)
+
+    # ---- admission ----
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: Optional[str] = None,
+        tokens: int = 0,
+        deadline_at: Optional[float] = None,
+    ) -> AsyncIterator[None]:
+        """
+        実行枠を 1 つ確保する。priority が None なら model_priority の値（SharedLane なら今の優先度）を使う。
+        deadline_at までに確保できなければ SchedulerTimeout。
+        """
+        shared = model_priority.get() if priority is None else None
+        lane = PRIORITIES.get(priority or current_lane(), PRIORITIES["interactive"])
+        if deadline_at is None:
+            deadline_at = self.clock() + self.deadline
+        cond = self._condition()
+        # [優先度, 到着順, SharedLane | None]（到着順は重ならないので 3 つ目は比べられない）
+        entry = [lane, next(self._seq), shared if isinstance(shared, SharedLane) else None]
+        acquired = False
+
+        async with cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    self._reprioritize()
+                    if self._waiters[0] is entry and self.in_flight < int(self.limit):
+                        break
+                    remaining = deadline_at - self.clock()
+                    if remaining <= 0:
+                        # キャンセル（クライアントの切断など）は timeouts に数えない
+                        self.timeouts += 1
+                        raise SchedulerTimeout("model call queue deadline exceeded")
+                    try:
+                        await asyncio.wait_for(cond.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                heapq.heappop(self._waiters)
+                self.in_flight += 1
+                acquired = True
+            finally:
+                if not acquired and entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                cond.notify_all()
+
+        try:
+            wait = max(self.request_bucket.reserve(1), self.token_bucket.reserve(tokens))
+            if wait > 0:
+                if self.clock() + wait > deadline_at:
+                    self.timeouts += 1
+                    raise SchedulerTimeout("rate limit wait exceeds deadline")
+                await self.sleep(wait)
+            yield
+        finally:
+            async with cond:
+                # 待っている間にループが変わって数え直していたら、この枠はもう数えられていない
+                if cond is self._cond:
+                    self.in_flight -= 1
+                cond.notify_all()
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        priority: Optional[str] = None,
+        tokens: int = 0,
+        deadline: Optional[float] = None,
+    ) -> T:
+        """call を実行枠の中で実行し、再試行可能なエラーはバックオフして再実行する。"""
+        deadline_at = self.clock() + (deadline if deadline is not None else self.deadline)
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(priority, tokens, deadline_at):
+                    result = await call()
+            except SchedulerTimeout:
+                raise
+            except Exception as e:
+                if is_rate_limited(e):
+                    self.on_throttle()
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                # full jitter
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                if self.clock() + delay >= deadline_at:
+                    raise
+                self.retries += 1
+                attempt += 1
+                await self.sleep(delay)
+                continue
+            self.on_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inFlight": self.in_flight,
+            "limit": int(self.limit),
+            "queued": len(self._waiters),
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+        }
+
+
+def scheduler_from_env() -> ModelScheduler:
+    return ModelScheduler(
+        max_in_flight=int(os.getenv("MODEL_MAX_IN_FLIGHT", "8")),
+        min_in_flight=int(os.getenv("MODEL_MIN_IN_FLIGHT", "1")),
+        requests_per_minute=float(os.getenv("MODEL_RPM", "0")),
+        tokens_per_minute=float(os.getenv("MODEL_TPM", "0")),
+        max_retries=int(os.getenv("MODEL_MAX_RETRIES", "4")),
+        base_delay=float(os.getenv("MODEL_RETRY_BASE_DELAY", "0.5")),
+        max_delay=float(os.getenv("MODEL_RETRY_MAX_DELAY", "8")),
+        deadline=float(os.getenv("MODEL_DEADLINE", "60")),
+    )
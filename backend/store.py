@@ -0,0 +1,73 @@
+import os
+from typing import Any, Callable, Dict, Optional
+
+import fastjson
+from cache import CacheBackend, cache_backend_from_env
+
+
+# =========================
+# Check store
+# =========================
+class CheckStore:
+    """
+    checkId -> {"text", "settings", "report", "blocks"} を保存するストア。
+    値はコンパクトな JSON にして CacheBackend（memory / sqlite / redis など）に置く。
+    memory 以外のバックエンドなら再起動後も残り、ワーカー / インスタンス間で共有できる。
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float = 86400.0):
+        self.backend = backend
+        self.ttl = ttl
+
+    @property
+    def max_entries(self) -> Optional[int]:
+        """LRU で追い出す件数の上限（redis のようにサーバー側で追い出す場合は None）。"""
+        return getattr(self.backend, "max_entries", None)
+
+    @property
+    def max_bytes(self) -> Optional[int]:
+        """値の合計サイズの上限（memory のみ）。"""
+        return getattr(self.backend, "max_bytes", None)
+
+    async def get(self, check_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self.backend.get(check_id)
+        if raw is None:
+            return None
+        return fastjson.loads(raw)
+
+    async def put(self, check_id: str, entry: Dict[str, Any]) -> None:
+        raw = fastjson.dumps(entry)
+        await self.backend.set(check_id, raw, self.ttl)
+
+    async def update(
+        self, check_id: str, fn: Callable[[Optional[Dict[str, Any]]], Optional[Dict[str, Any]]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        保存済みのエントリ（無ければ None）を fn に渡し、戻り値で置き換える。fn が None を返したら書き込まない。
+        同じ checkId の update は直列化されるので、get → 変更 → put と違って他の更新を上書きしない。
+        """
+
+        def apply(raw: Optional[str]) -> Optional[str]:
+            entry = fn(None if raw is None else fastjson.loads(raw))
+            return None if entry is None else fastjson.dumps(entry)
+
+        raw = await self.backend.update(check_id, apply, self.ttl)
+        return None if raw is None else fastjson.loads(raw)
+
+    async def delete(self, check_id: str) -> None:
+        await self.backend.delete(check_id)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+def check_store_from_env() -> CheckStore:
+    """
+    CHECK_STORE_BACKEND=memory|sqlite|redis|disk で保存先を選ぶ。
+    CHECK_STORE_TTL（秒）を過ぎたエントリと CHECK_STORE_MAX_ENTRIES を超えた古いエントリは消える。
+    """
+    backend = cache_backend_from_env("CHECK_STORE", default="memory", default_max_entries=10000)
+    if backend is None:
+        raise RuntimeError("CHECK_STORE_BACKEND must not be none")
+    ttl = float(os.getenv("CHECK_STORE_TTL", "86400"))
+    return CheckStore(backend, ttl=ttl)
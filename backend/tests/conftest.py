@@ -0,0 +1,17 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from bench.fake_genai import FakeConfig, FakeGenaiClient
+
+
+SETTINGS = {"publishScope": "public", "tone": "neutral", "audience": "engineers", "redactMode": "light"}
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    """Vertex AI の代わりに bench の偽クライアントを使う TestClient。"""
+    monkeypatch.setattr(main, "client", FakeGenaiClient(FakeConfig(latency="fixed:1", seed=3)))
+    monkeypatch.setattr(main, "RESULT_CACHE", main.json_cache_from_env("TEST_RESULT_CACHE"))
+    with TestClient(main.app) as c:
+        yield c
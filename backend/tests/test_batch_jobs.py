@@ -0,0 +1,32 @@
+import time
+
+import main
+from conftest import SETTINGS
+
+
+def wait_done(client, job_id):
+    for _ in range(100):
+        job = client.get(f"/v1/batch-jobs/{job_id}").json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError("batch job did not finish")
+
+
+def test_job_limit_is_below_store_capacity():
+    assert main.BATCH_JOB_MAX_DOCUMENTS <= main.CHECK_STORE.max_entries // main.BATCH_JOB_STORE_SHARE
+
+
+def test_evicted_results_are_reported_as_expired(fake_client):
+    docs = [{"id": "a", "text": "hello"}, {"id": "b", "text": "world"}]
+    body = {"documents": docs, "settings": SETTINGS, "config": {"mock": "on"}}
+    job_id = fake_client.post("/v1/batch-jobs", json=body).json()["jobId"]
+    assert wait_done(fake_client, job_id)["completed"] == 2
+
+    results = fake_client.get(f"/v1/batch-jobs/{job_id}/results").json()["results"]
+    assert all(r["status"] == "ok" and r["report"] for r in results)
+
+    fake_client.portal.call(main.CHECK_STORE.delete, results[0]["checkId"])
+    results = fake_client.get(f"/v1/batch-jobs/{job_id}/results").json()["results"]
+    assert results[0]["status"] == "expired" and "report" not in results[0]
+    assert results[1]["status"] == "ok"
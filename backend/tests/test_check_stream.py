@@ -0,0 +1,26 @@
+import json
+
+from conftest import SETTINGS
+
+
+TEXT = "# t\n\n連絡は test@corp.co.jp まで。\n\n本文です。\n"
+
+
+def events(body):
+    out = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((fields["event"], json.loads(fields["data"])))
+    return out
+
+
+def test_streamed_ids_match_final_report(fake_client):
+    # 2 回目は RESULT_CACHE から返る
+    for _ in range(2):
+        resp = fake_client.post("/v1/checks:stream", json={"text": TEXT, "settings": SETTINGS})
+        evs = events(resp.text)
+        assert evs[-1][0] == "report"
+        sent = [(d["finding"]["id"], d["finding"]["title"]) for e, d in evs if e == "finding"]
+        final = [(f["id"], f["title"]) for f in evs[-1][1]["report"]["findings"]]
+        assert sent == final
+        assert sent[0][0] == "f_001" and "local-scan" in evs[0][1]["finding"]["tags"]
@@ -0,0 +1,42 @@
+import time
+
+import main
+from conftest import SETTINGS
+from report import compute_score, compute_verdict, summarize
+
+
+def test_plain_model_report_keeps_the_model_score(fake_client, monkeypatch):
+    async def generate_report(prompt, images):
+        return {"verdict": "ok", "score": 97, "summary": {}, "findings": [], "highlights": {"mode": "text", "items": []}}
+
+    monkeypatch.setattr(main, "generate_report", generate_report)
+    resp = fake_client.post("/v1/checks", json={"text": "# t\n\n本文です。\n", "settings": SETTINGS})
+    assert resp.status_code == 200
+    assert resp.json()["report"]["score"] == 97
+
+
+def test_prescan_hits_are_merged_into_the_report(fake_client):
+    resp = fake_client.post("/v1/checks", json={"text": "# t\n\n連絡は test@corp.co.jp まで。\n", "settings": SETTINGS})
+    report = resp.json()["report"]
+    findings = report["findings"]
+    assert any(h["text"] == "test@corp.co.jp" for f in findings for h in f["highlights"])
+    assert report["score"] == compute_score(findings)
+    assert report["verdict"] == compute_verdict(report["score"], summarize(findings)["bySeverity"])
+
+
+def test_recheck_leaves_shared_context_cache_alive(fake_client, monkeypatch):
+    deleted = []
+
+    async def delete(name):
+        deleted.append(name)
+
+    monkeypatch.setattr(main.client.caches, "delete", delete)
+    text = "# t\n\n本文です。\n"
+    check_id = fake_client.post("/v1/checks", json={"text": text, "settings": SETTINGS}).json()["checkId"]
+    handle = {"name": "cachedContents/shared", "expiresAt": time.time() + 600, "digest": "d"}
+    fake_client.portal.call(main.CHECK_STORE.update, check_id, lambda entry: {**entry, "contextCache": handle})
+
+    resp = fake_client.post(f"/v1/checks/{check_id}/recheck", json={"text": text + "追記。\n", "settings": SETTINGS})
+    assert resp.status_code == 200
+    assert deleted == []
+    assert "contextCache" not in fake_client.portal.call(main.CHECK_STORE.get, check_id)
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from conftest import SETTINGS
+
+
+class FakeGenai:
+    """google.genai.Client の代わり。作られた回数を数える。"""
+
+    created = 0
+
+    def __init__(self, **kwargs):
+        FakeGenai.created += 1
+        self.kwargs = kwargs
+        self.aio = object()
+
+
+@pytest.fixture
+def fake_genai(monkeypatch):
+    from google import genai
+
+    FakeGenai.created = 0
+    monkeypatch.setattr(genai, "Client", FakeGenai)
+    monkeypatch.setattr(main, "client", None)
+    return FakeGenai
+
+
+def test_importing_main_does_not_import_genai():
+    out = subprocess.run(
+        [sys.executable, "-c", "import sys, main; print('google.genai' in sys.modules)"],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(main.__file__),
+    )
+    assert out.stdout.strip() == "False"
+
+
+def test_client_is_created_once_on_first_use(fake_genai, monkeypatch):
+    monkeypatch.setattr(main, "PROJECT", "demo-project")
+    first = main.get_client()
+    assert main.get_client() is first
+    assert fake_genai.created == 1
+
+
+def test_missing_project_is_a_503_and_creates_nothing(fake_genai, monkeypatch):
+    monkeypatch.setattr(main, "PROJECT", "")
+    with pytest.raises(HTTPException) as e:
+        main.get_client()
+    assert e.value.status_code == 503
+    assert e.value.detail["error"] == "MODEL_NOT_CONFIGURED"
+    assert fake_genai.created == 0 and main.client is None
+
+
+def test_mock_mode_runs_without_a_client(fake_genai, monkeypatch):
+    monkeypatch.setattr(main, "PROJECT", "")
+    with TestClient(main.app) as c:
+        resp = c.post("/v1/checks", json={"text": "# t\n", "settings": SETTINGS, "config": {"mock": "on"}})
+    assert resp.status_code == 200
+    assert fake_genai.created == 0
+
+
+def test_warm_up_creates_the_client_when_configured(fake_genai, monkeypatch):
+    monkeypatch.setattr(main, "PROJECT", "demo-project")
+    monkeypatch.setattr(main, "GENAI_WARMUP", True)
+    monkeypatch.delenv("MOCK", raising=False)
+    asyncio.run(main.warm_up())
+    assert fake_genai.created == 1
+
+    monkeypatch.setattr(main, "client", None)
+    monkeypatch.setattr(main, "GENAI_WARMUP", False)
+    asyncio.run(main.warm_up())
+    assert fake_genai.created == 1
@@ -0,0 +1,86 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+from conftest import SETTINGS
+from scheduler import priority_lane
+
+TEXT = "# t\n\n本文です。\n"
+
+
+def gated_generate_report(calls, gate):
+    async def generate_report(prompt, images):
+        calls.append(prompt)
+        await gate()
+        return {"verdict": "ok", "score": 90, "summary": {}, "findings": [], "highlights": {"mode": "text", "items": []}}
+
+    return generate_report
+
+
+def test_concurrent_identical_checks_share_one_model_call(fake_client, monkeypatch):
+    calls = []
+    before = main.CHECKS_COALESCED.value()
+
+    async def second_request_joined():
+        # 2 つ目の要求が相乗りするまでモデル呼び出しを終わらせない
+        for _ in range(500):
+            if main.CHECKS_COALESCED.value() > before:
+                return
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(main, "generate_report", gated_generate_report(calls, second_request_joined))
+    with ThreadPoolExecutor(2) as pool:
+        responses = list(pool.map(lambda _: fake_client.post("/v1/checks", json={"text": TEXT, "settings": SETTINGS}), range(2)))
+
+    assert [r.status_code for r in responses] == [200, 200]
+    assert len(calls) == 1
+    first, second = (r.json() for r in responses)
+    assert first["checkId"] != second["checkId"]
+    assert first["report"] == second["report"]
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_check(fake_client, monkeypatch):
+    calls = []
+    released = asyncio.Event()
+    monkeypatch.setattr(main, "generate_report", gated_generate_report(calls, released.wait))
+    settings = main.CheckSettings(**SETTINGS)
+
+    async def run():
+        first = asyncio.ensure_future(main.run_check(TEXT, settings, "prompt"))
+        while not main._inflight_checks:
+            await asyncio.sleep(0)
+        second = asyncio.ensure_future(main.run_check(TEXT, settings, "prompt"))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        released.set()
+        report = await second
+        return first.cancelled(), report
+
+    cancelled, report = fake_client.portal.call(run)
+    assert cancelled
+    assert report["score"] == 90
+    assert len(calls) == 1
+    assert main._inflight_checks == {}
+
+
+def test_interactive_caller_raises_a_shared_batch_check(fake_client, monkeypatch):
+    released = asyncio.Event()
+    monkeypatch.setattr(main, "generate_report", gated_generate_report([], released.wait))
+    settings = main.CheckSettings(**SETTINGS)
+
+    async def run():
+        with priority_lane("batch"):
+            batch = asyncio.ensure_future(main.run_check(TEXT, settings, "prompt"))
+        while not main._inflight_lanes:
+            await asyncio.sleep(0)
+        (lane,) = main._inflight_lanes.values()
+        before = lane.name
+        interactive = asyncio.ensure_future(main.run_check(TEXT, settings, "prompt"))
+        await asyncio.sleep(0)
+        after = lane.name
+        released.set()
+        await asyncio.gather(batch, interactive)
+        return before, after
+
+    assert fake_client.portal.call(run) == ("batch", "interactive")
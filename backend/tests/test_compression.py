@@ -0,0 +1,40 @@
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware
+from offload import OffloadBusy, Offloader
+
+
+BODY = "本文" * 50_000
+
+
+def client_with(offloader):
+    app = FastAPI()
+
+    @app.get("/big")
+    async def big():
+        return PlainTextResponse(BODY)
+
+    app.add_middleware(CompressionMiddleware, minimum_size=1024, offloader=offloader, offload_min_size=64 * 1024)
+    return TestClient(app)
+
+
+def test_large_bodies_are_compressed_on_the_pool():
+    pool = Offloader("test", "thread", max_workers=1)
+    resp = client_with(pool).get("/big", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.text == BODY
+    assert pool.submitted == 1
+    pool.shutdown()
+
+
+def test_busy_pool_sends_uncompressed():
+    class Busy(Offloader):
+        async def run(self, fn, *args, size=None):
+            raise OffloadBusy(self.name)
+
+    resp = client_with(Busy("busy")).get("/big", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in resp.headers
+    assert resp.text == BODY
+    assert resp.headers["content-length"] == str(len(BODY.encode()))
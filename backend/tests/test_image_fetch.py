@@ -0,0 +1,134 @@
+import asyncio
+import io
+
+import httpx
+import pytest
+from PIL import Image
+
+import main
+from image_cache import ImageCache
+
+URL = "https://img.example.com/a.png"
+
+
+def png(width=8, height=8):
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(out, format="PNG")
+    return out.getvalue()
+
+
+@pytest.fixture
+def image_server(monkeypatch):
+    """画像の取得先を httpx.MockTransport に差し替える。handler を入れ替えて応答を変える。"""
+    server = {"requests": [], "handler": lambda request: httpx.Response(404)}
+
+    def handle(request):
+        server["requests"].append(request)
+        return server["handler"](request)
+
+    monkeypatch.setattr(main, "_image_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handle)))
+    monkeypatch.setattr(main, "_host_semaphores", {})
+    monkeypatch.setattr(main, "IMAGE_CACHE", ImageCache(fresh_seconds=0))
+    return server
+
+
+def test_stale_image_is_revalidated_with_etag(image_server):
+    body = png()
+    image_server["handler"] = lambda request: httpx.Response(200, content=body, headers={"ETag": '"v1"'})
+    first = asyncio.run(main.download_image(URL))
+
+    image_server["handler"] = lambda request: httpx.Response(304)
+    second = asyncio.run(main.download_image(URL))
+
+    assert image_server["requests"][1].headers["If-None-Match"] == '"v1"'
+    assert second is first
+    assert main.IMAGE_CACHE.stats()["revalidated"] == 1
+
+
+def test_not_modified_after_eviction_keeps_the_image(image_server):
+    body = png()
+    image_server["handler"] = lambda request: httpx.Response(200, content=body, headers={"Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+    first = asyncio.run(main.download_image(URL))
+
+    def evicted_then_not_modified(request):
+        # 条件付き GET の最中に他の画像に押し出された
+        main.IMAGE_CACHE._remove(URL)
+        return httpx.Response(304)
+
+    image_server["handler"] = evicted_then_not_modified
+    second = asyncio.run(main.download_image(URL))
+
+    assert image_server["requests"][1].headers["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+    assert second is not None and second["data"] == first["data"]
+    assert main.IMAGE_CACHE.get(URL) is second
+
+
+def test_image_client_is_shared_until_closed(monkeypatch):
+    monkeypatch.setattr(main, "_image_http_client", None)
+
+    async def run():
+        client = main.image_http_client()
+        assert main.image_http_client() is client
+        await main.close_image_http_client()
+        assert client.is_closed
+        reopened = main.image_http_client()
+        await main.close_image_http_client()
+        return client, reopened
+
+    client, reopened = asyncio.run(run())
+    assert reopened is not client
+
+
+def test_downloads_are_limited_per_host(image_server, monkeypatch):
+    monkeypatch.setattr(main, "IMAGE_HTTP_PER_HOST", 2)
+    body = png()
+    active = {}
+    peak = {}
+
+    async def slow(request):
+        host = request.url.host
+        active[host] = active.get(host, 0) + 1
+        peak[host] = max(peak.get(host, 0), active[host])
+        await asyncio.sleep(0.01)
+        active[host] -= 1
+        return httpx.Response(200, content=body)
+
+    image_server["handler"] = slow
+    urls = [f"https://a.example.com/{i}.png" for i in range(5)] + [f"https://b.example.com/{i}.png" for i in range(3)]
+
+    async def run():
+        return await asyncio.gather(*(main.download_image(u) for u in urls))
+
+    assert all(asyncio.run(run()))
+    assert peak == {"a.example.com": 2, "b.example.com": 2}
+
+
+def test_images_over_the_size_cap_are_skipped(image_server, monkeypatch):
+    monkeypatch.setattr(main, "IMAGE_MAX_BYTES", 1024)
+    sent = []
+
+    def chunks():
+        for _ in range(64):
+            sent.append(1)
+            yield b"\x89PNG\r\n\x1a\n" + b"\x00" * 248
+
+    image_server["handler"] = lambda request: httpx.Response(200, content=chunks())
+    assert asyncio.run(main.download_image("https://img.example.com/stream.png")) is None
+    # Content-Length が無くても上限を超えた時点で読むのをやめる
+    assert len(sent) < 64
+
+    image_server["handler"] = lambda request: httpx.Response(200, content=b"\x00" * 2048)
+    assert asyncio.run(main.download_image("https://img.example.com/big.png")) is None
+
+
+def test_non_image_bodies_are_skipped_and_large_images_downscaled(image_server, monkeypatch):
+    monkeypatch.setattr(main, "IMAGE_MAX_DIMENSION", 64)
+    image_server["handler"] = lambda request: httpx.Response(200, content=b"<html>not found</html>", headers={"Content-Type": "image/png"})
+    assert asyncio.run(main.download_image("https://img.example.com/html.png")) is None
+
+    body = png(256, 128)
+    image_server["handler"] = lambda request: httpx.Response(200, content=body)
+    image = asyncio.run(main.download_image(URL))
+    assert image["mime_type"] == "image/jpeg"
+    with Image.open(io.BytesIO(image["data"])) as img:
+        assert img.size == (64, 32)
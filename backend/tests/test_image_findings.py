@@ -0,0 +1,15 @@
+from image_findings import ImageFindingCache
+
+
+def test_near_duplicates_are_opt_in():
+    cache = ImageFindingCache()
+    cache.put("a", 0b1011, [{"title": "t"}])
+    assert cache.find_similar(0b1011) is None
+    assert cache.get("a")["findings"] == [{"title": "t"}]
+
+
+def test_near_duplicate_within_distance():
+    cache = ImageFindingCache(max_distance=2)
+    cache.put("a", 0b1011, [{"title": "t"}])
+    assert cache.find_similar(0b1000)["sha256"] == "a"
+    assert cache.find_similar(0b0100) is None
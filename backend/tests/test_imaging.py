@@ -0,0 +1,43 @@
+import io
+
+from PIL import Image
+
+from imaging import downscale_image, sniff_mime
+
+
+def encode(img, fmt):
+    out = io.BytesIO()
+    img.save(out, format=fmt)
+    return out.getvalue()
+
+
+def test_sniff_mime_uses_magic_bytes():
+    assert sniff_mime(encode(Image.new("RGB", (4, 4)), "PNG")) == "image/png"
+    assert sniff_mime(encode(Image.new("RGB", (4, 4)), "JPEG")) == "image/jpeg"
+    assert sniff_mime(encode(Image.new("RGB", (4, 4)), "GIF")) == "image/gif"
+    assert sniff_mime(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert sniff_mime(b"\x00\x00\x00\x18ftypheic") == "image/heic"
+    # content-type が image/png でも中身が HTML のエラーページなら画像ではない
+    assert sniff_mime(b"<!doctype html><html>404</html>") is None
+    assert sniff_mime(b"") is None
+
+
+def test_downscale_shrinks_the_long_side():
+    data, mime = downscale_image(encode(Image.new("RGB", (400, 100)), "PNG"), "image/png", 200)
+    assert mime == "image/jpeg"
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.size == (200, 50)
+
+
+def test_downscale_keeps_transparency_as_png():
+    data, mime = downscale_image(encode(Image.new("RGBA", (300, 300)), "PNG"), "image/png", 100)
+    assert mime == "image/png"
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.size == (100, 100)
+
+
+def test_small_or_undecodable_images_are_left_alone():
+    small = encode(Image.new("RGB", (50, 50)), "PNG")
+    assert downscale_image(small, "image/png", 200) == (small, "image/png")
+    assert downscale_image(b"\x89PNG\r\n\x1a\nbroken", "image/png", 200) == (b"\x89PNG\r\n\x1a\nbroken", "image/png")
+    assert downscale_image(small, "image/png", 0) == (small, "image/png")
@@ -0,0 +1,65 @@
+import asyncio
+
+import main
+from blocks import split_blocks
+from conftest import SETTINGS
+from report import build_report
+
+
+PARAS = [f"段落{i}の本文です。" for i in range(8)]
+
+
+def finding(title, *texts):
+    return {
+        "category": "privacy",
+        "severity": "medium",
+        "title": title,
+        "reason": "r",
+        "suggestion": "s",
+        "highlights": [{"text": t} for t in texts],
+    }
+
+
+def saved_entry(text, findings):
+    settings = main.CheckSettings(**SETTINGS)
+    return main.store_entry(text, settings, build_report(findings))
+
+
+def test_retained_findings_keep_only_unchanged_blocks():
+    old = "\n\n".join(PARAS)
+    report = build_report([finding("kept", "段落1"), finding("dropped", "段落5"), finding("whole document")])
+    new = old.replace("段落5の本文です。", "段落5を書き換えました。")
+    blocks = split_blocks(new)
+    changed = {i for i, b in enumerate(blocks) if "書き換え" in b["text"]}
+    kept = main.retained_findings(report, new, blocks, changed)
+    assert [f["title"] for f in kept] == ["kept", "whole document"]
+
+
+def test_incremental_recheck_merges_retained_and_new_findings(monkeypatch):
+    old = "\n\n".join(PARAS)
+    saved = saved_entry(old, [finding("old 1", "段落1"), finding("old 5", "段落5の本文")])
+    new = old.replace("段落5の本文です。", "段落5に test@corp.co.jp を追記。")
+
+    prompts = []
+
+    async def generate_report(prompt, images):
+        prompts.append(prompt)
+        return {"findings": [finding("new 5", "段落5に")]}
+
+    monkeypatch.setattr(main, "generate_report", generate_report)
+    report = asyncio.run(main.run_incremental_check(new, main.CheckSettings(**SETTINGS), saved))
+
+    titles = [f["title"] for f in report["findings"]]
+    assert "old 1" in titles and "new 5" in titles and "old 5" not in titles
+    # ローカルの pre-scan の検出もマージされる
+    assert any("test@corp.co.jp" in h["text"] for f in report["findings"] for h in f["highlights"])
+    assert [f["id"] for f in report["findings"]] == [f"f_{i:03d}" for i in range(1, len(titles) + 1)]
+    # モデルには変わったブロックと前後の文脈だけを送る
+    assert "[target]\n段落5に" in prompts[0] and "段落0" not in prompts[0]
+
+
+def test_settings_change_falls_back_to_full_check():
+    text = "\n\n".join(PARAS)
+    saved = saved_entry(text, [])
+    other = main.CheckSettings(**{**SETTINGS, "tone": "casual"})
+    assert asyncio.run(main.run_incremental_check(text, other, saved)) is None
@@ -0,0 +1,64 @@
+import asyncio
+import re
+
+import main
+from conftest import SETTINGS
+
+IMAGE = "https://img.example.com/fig.png"
+
+
+def long_doc(sections=8):
+    parts = []
+    for i in range(sections):
+        parts.append(f"## 節 {i}\n\n本文 {i} では KEY{i} について説明します。" + "補足です。" * 10)
+        if i == 5:
+            parts.append(f"![図]({IMAGE})")
+    return "\n\n".join(parts) + "\n"
+
+
+def chunk_model(calls):
+    async def generate_report(prompt, images):
+        markdown = prompt.split("[markdown]\n", 1)[1]
+        calls.append({"markdown": markdown, "images": [img["url"] for img in images]})
+        keys = re.findall(r"KEY\d+", markdown)
+        # 本文中の順とは逆に返す（マージ後に位置順へ並べ直されること）
+        findings = [
+            {"id": "x", "category": "wording", "severity": "low", "title": k, "reason": "", "suggestion": "",
+             "highlights": [{"text": k, "context": ""}]}
+            for k in reversed(keys)
+        ]
+        return {"findings": findings}
+
+    return generate_report
+
+
+def test_chunks_are_merged_in_document_order(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, "generate_report", chunk_model(calls))
+    monkeypatch.setattr(main, "LONG_DOC_CHUNK_CHARS", 200)
+    text = long_doc()
+    settings = main.CheckSettings(**SETTINGS)
+
+    report = asyncio.run(main.run_chunked_check(text, settings, [{"url": IMAGE, "data": b"", "mime_type": "image/png"}]))
+
+    assert len(calls) > 2
+    # 重ねたブロックの指摘は 1 件にまとめられ、本文の順に f_001 から振り直される
+    assert [f["title"] for f in report["findings"]] == [f"KEY{i}" for i in range(8)]
+    assert [f["id"] for f in report["findings"]] == [f"f_{i:03d}" for i in range(1, 9)]
+    # 画像は自分の担当ブロックに画像があるチャンクにだけ送る
+    assert sum(1 for c in calls if c["images"] == [IMAGE]) == 1
+    assert all(IMAGE in c["markdown"] for c in calls if c["images"])
+
+
+def test_long_checks_take_the_chunked_path(fake_client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, "generate_report", chunk_model(calls))
+    monkeypatch.setattr(main, "LONG_DOC_CHUNK_CHARS", 200)
+    monkeypatch.setattr(main, "LONG_DOC_THRESHOLD", 200)
+    text = long_doc(sections=4).replace(f"![図]({IMAGE})", "")
+
+    resp = fake_client.post("/v1/checks", json={"text": text, "settings": SETTINGS})
+
+    assert resp.status_code == 200
+    assert len(calls) > 1
+    assert [f["title"] for f in resp.json()["report"]["findings"]] == [f"KEY{i}" for i in range(4)]
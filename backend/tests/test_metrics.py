@@ -0,0 +1,54 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+from conftest import SETTINGS
+from metrics import HTTP_REQUESTS, MetricsMiddleware, server_timing, stage
+
+
+def test_metrics_count_requests_stages_and_model_calls(fake_client):
+    check_id = fake_client.post("/v1/checks", json={"text": "# t\n\n本文です。\n", "settings": SETTINGS}).json()["checkId"]
+    fake_client.post(f"/v1/checks/{check_id}/recheck", json={"text": "# t\n\n本文です。\n", "settings": SETTINGS})
+
+    resp = fake_client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = resp.text
+    assert 'brc_http_requests_total{endpoint="/v1/checks",method="POST",status="200"}' in body
+    # パスパラメータではなくルートのテンプレートで集計する
+    assert 'endpoint="/v1/checks/{checkId}/recheck"' in body
+    assert check_id not in body
+    assert 'brc_stage_duration_seconds_count{endpoint="/v1/checks",stage="prescan"}' in body
+    assert f'brc_model_calls_total{{endpoint="/v1/checks",model="{main.MODEL_ID}",outcome="ok"}}' in body
+    assert 'brc_cache_lookups_total{cache="result",result="misses"}' in body
+
+
+def test_server_timing_header_lists_finished_stages():
+    app = FastAPI()
+
+    @app.get("/work/{item}")
+    async def work(item: str):
+        with stage("parse"):
+            pass
+        with stage("parse"):
+            pass
+        with stage("model"):
+            pass
+        return {"item": item}
+
+    app.add_middleware(MetricsMiddleware, server_timing=True)
+    before = HTTP_REQUESTS.value("/work/{item}", "GET", "200")
+    resp = TestClient(app).get("/work/1")
+
+    names = [part.split(";")[0] for part in resp.headers["server-timing"].split(", ")]
+    assert names == ["parse", "model", "total"]
+    assert HTTP_REQUESTS.value("/work/{item}", "GET", "200") == before + 1
+
+
+def test_server_timing_is_off_by_default(fake_client):
+    resp = fake_client.post("/v1/checks", json={"text": "# t\n\n本文です。\n", "settings": SETTINGS})
+    assert "server-timing" not in resp.headers
+
+
+def test_server_timing_sums_repeated_stages():
+    assert server_timing([("a", 0.001), ("b", 0.002), ("a", 0.003)], 0.01) == "a;dur=4.0, b;dur=2.0, total;dur=10.0"
@@ -0,0 +1,82 @@
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+import main
+from conftest import SETTINGS
+from offload import OffloadBusy, Offloader
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def where():
+    return threading.get_ident(), request_id.get()
+
+
+def test_thread_pool_runs_off_the_loop_with_context():
+    pool = Offloader("test", "thread", max_workers=2)
+
+    async def run():
+        request_id.set("r1")
+        return await pool.run(where), threading.get_ident()
+
+    (worker, seen), loop_thread = asyncio.run(run())
+    pool.shutdown()
+    assert worker != loop_thread
+    # stage() の計測が呼び出し元のリクエストに紐づくよう contextvars を引き継ぐ
+    assert seen == "r1"
+    assert (pool.stats()["submitted"], pool.stats()["inline"]) == (1, 0)
+
+
+def test_inline_mode_and_small_inputs_run_on_the_loop():
+    inline = Offloader("test", "inline")
+    small = Offloader("test", "thread", min_size=100)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        return loop_thread, (await inline.run(where))[0], (await small.run(where, size=10))[0]
+
+    loop_thread, inline_thread, small_thread = asyncio.run(run())
+    small.shutdown()
+    assert inline_thread == small_thread == loop_thread
+    assert inline.stats()["inline"] == small.stats()["inline"] == 1
+    assert small.stats()["submitted"] == 0
+
+
+def test_full_pool_raises_offload_busy_and_keeps_slot_until_work_ends():
+    pool = Offloader("test", "thread", max_workers=1, max_pending=1, queue_timeout=0.05)
+    release = threading.Event()
+
+    async def run():
+        first = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.01)
+        with pytest.raises(OffloadBusy):
+            await pool.run(where)
+        # 待っている側がキャンセルされても、走り出した処理が終わるまで枠は空かない
+        first.cancel()
+        with pytest.raises(OffloadBusy):
+            await pool.run(where)
+        release.set()
+        await asyncio.sleep(0.05)
+        return await pool.run(where)
+
+    assert asyncio.run(run())[1] is None
+    pool.shutdown()
+    assert pool.stats()["rejected"] == 2
+
+
+def test_unknown_executor_kind_is_rejected():
+    with pytest.raises(ValueError):
+        Offloader("test", "fiber")
+
+
+def test_busy_pool_is_a_503(fake_client, monkeypatch):
+    async def busy(fn, *args, size=None):
+        raise OffloadBusy("cpu")
+
+    monkeypatch.setattr(main.CPU_POOL, "run", busy)
+    resp = fake_client.post("/v1/checks", json={"text": "# t\n\n本文です。\n", "settings": SETTINGS})
+    assert resp.status_code == 503
+    assert resp.json()["detail"] == {"error": "SERVER_BUSY", "message": "cpu worker pool is busy"}
@@ -0,0 +1,66 @@
+from offsets import annotated_copy, apply_edits, remap_items, resolve_spans, shift_items
+
+
+def test_resolve_exact_normalized_and_missing():
+    text = "line one\nthe  quick\nbrown fox\n"
+    spans = resolve_spans(text, ["one", "the quick brown", "absent-zzzz"])
+    assert spans["one"]["start"] == 5 and spans["one"]["match"] == "exact"
+    assert (spans["one"]["line"], spans["one"]["col"]) == (1, 5)
+    assert spans["the quick brown"]["match"] == "normalized"
+    assert text[spans["the quick brown"]["start"]:spans["the quick brown"]["end"]] == "the  quick\nbrown"
+    assert spans["absent-zzzz"] is None
+
+
+def test_every_occurrence_is_returned():
+    text = "token abc, again abc and abcabc"
+    span = resolve_spans(text, ["abc"])["abc"]
+    assert span["start"] == 6
+    assert span["occurrences"] == [[6, 9], [17, 20], [25, 28], [28, 31]]
+    assert "occurrences" not in resolve_spans(text, ["token"])["token"]
+
+
+def report_with(*texts):
+    return {"highlights": {"mode": "text", "items": [{"findingId": "f_001", "text": t} for t in texts]}}
+
+
+def test_shift_moves_every_occurrence_and_drops_the_edited_one():
+    text = "abc x abc y abc"
+    item = annotated_copy(report_with("abc"), text)["highlights"]["items"][0]
+    # 2 つ目の abc を置き換える
+    after = text[:6] + "ABCDE" + text[9:]
+    [shifted] = shift_items([item], after, 6, 9, 2)
+    assert shifted["occurrences"] == [[0, 3], [14, 17]]
+    assert shifted["start"] == 0
+
+    # 最初の出現が消えたら残りの先頭が start になる
+    [shifted] = shift_items([item], "XYZ" + text[3:], 0, 3, 0)
+    assert (shifted["start"], shifted["end"]) == (6, 9)
+    assert shifted["occurrences"] == [[6, 9], [12, 15]]
+
+
+def test_remap_after_bulk_edits():
+    text = "abc x abc y abc"
+    item = annotated_copy(report_with("abc"), text)["highlights"]["items"][0]
+    after, applied, rejected = apply_edits(text, [{"start": 4, "end": 5, "replacement": "xx"}, {"start": 12, "end": 15, "replacement": "Z"}])
+    assert after == "abc xx abc y Z" and rejected == []
+    [remapped] = remap_items([item], after, applied)
+    assert remapped["occurrences"] == [[0, 3], [7, 10]]
+    assert after[7:10] == "abc"
+
+
+def test_unresolved_highlights_are_listed():
+    report = annotated_copy(report_with("missing-text-zzzz"), "short")
+    assert report["highlights"]["unresolved"] == [{"findingId": "f_001", "text": "missing-text-zzzz"}]
+    assert "start" not in report["highlights"]["items"][0]
+
+
+def test_normalized_highlight_keeps_its_span_for_the_client():
+    # モデルが改行を空白 1 つにして返したハイライト。クライアントは h.text と一致しない範囲を
+    # 空白を無視した比較（またはチェックした本文と同じであること）で確かめて使う
+    text = "# t\n\nsecret  host is\ndb.corp.example.net here\n"
+    item = annotated_copy(report_with("host is db.corp.example.net"), text)["highlights"]["items"][0]
+    assert item["match"] == "normalized"
+    span = text[item["start"]:item["end"]]
+    assert span != item["text"]
+    assert " ".join(span.split()) == " ".join(item["text"].split())
+    assert (item["line"], item["col"]) == (3, 8)
@@ -0,0 +1,62 @@
+import asyncio
+
+import main
+from conftest import SETTINGS
+from test_check_stream import events
+
+TEXT = "# t\n\n本文です。\n"
+
+
+def tracked_reviews(monkeypatch, fail=()):
+    """run_persona_review を同時実行数を数えるものに差し替える。"""
+    state = {"active": 0, "peak": 0}
+
+    async def run_persona_review(text, settings, images=None):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        if settings.audience in fail:
+            raise main.http_error(503, "MODEL_UNAVAILABLE", "try again")
+        return {"audience": settings.audience, "verdict": "ok", "items": []}
+
+    monkeypatch.setattr(main, "run_persona_review", run_persona_review)
+    return state
+
+
+def test_all_audiences_are_reviewed_concurrently(fake_client, monkeypatch):
+    state = tracked_reviews(monkeypatch)
+    resp = fake_client.post("/v1/persona-reviews", json={"text": TEXT, "settings": SETTINGS})
+
+    assert resp.status_code == 200
+    assert list(resp.json()["reviews"]) == main.ALL_AUDIENCES
+    assert state["peak"] == min(main.PERSONA_CONCURRENCY, len(main.ALL_AUDIENCES))
+
+
+def test_failed_audience_goes_to_errors(fake_client, monkeypatch):
+    tracked_reviews(monkeypatch, fail={"internal"})
+    audiences = ["executives", "internal", "engineers"]
+    body = fake_client.post("/v1/persona-reviews", json={"text": TEXT, "settings": SETTINGS, "audiences": audiences}).json()
+
+    assert list(body["reviews"]) == ["executives", "engineers"]
+    assert body["errors"] == {"internal": {"status": 503, "error": "MODEL_UNAVAILABLE", "message": "try again"}}
+
+
+def test_stream_sends_each_review_then_done(fake_client, monkeypatch):
+    tracked_reviews(monkeypatch, fail={"general"})
+    audiences = ["general", "engineers"]
+    resp = fake_client.post("/v1/persona-reviews:stream", json={"text": TEXT, "settings": SETTINGS, "audiences": audiences})
+    evs = events(resp.text)
+
+    assert evs[-1] == ("done", {"audiences": audiences})
+    assert sorted((e, d["audience"]) for e, d in evs[:-1]) == [("error", "general"), ("review", "engineers")]
+
+
+def test_persona_review_with_fake_model_is_cached(fake_client):
+    first = fake_client.post("/v1/persona-reviews", json={"text": TEXT, "settings": SETTINGS, "audiences": ["engineers"]}).json()
+    calls = main.client.stats.calls
+    second = fake_client.post("/v1/persona-reviews", json={"text": TEXT, "settings": SETTINGS, "audiences": ["engineers"]}).json()
+
+    assert first == second
+    assert first["reviews"]["engineers"]["audience"] == "engineers"
+    assert main.client.stats.calls == calls
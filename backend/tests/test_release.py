@@ -0,0 +1,81 @@
+import main
+
+
+def patch(original, replacement, start=None):
+    end = None if start is None else start + len(original)
+    return {"patchId": "p", "originalText": original, "replacement": replacement, "start": start, "end": end}
+
+
+def test_pending_at_recorded_position():
+    text = "host internal.corp.example.net"
+    assert main.place_patch(text, patch("internal.corp.example.net", "example.com", 5)) == ("pending", (5, 30))
+
+
+def test_replacement_elsewhere_does_not_count_as_applied():
+    text = "host internal.corp.example.net and example.com"
+    p = patch("internal.corp.example.net", "example.com", 5)
+    assert main.place_patch(text, p)[0] == "pending"
+    out = main.assemble_release(text, [p])
+    assert "internal.corp" not in out["safeMarkdown"]
+    assert len(out["applied"]) == 1 and out["alreadyApplied"] == []
+
+
+def test_applied_when_original_is_gone():
+    text = "host example.com"
+    assert main.place_patch(text, patch("internal.corp.example.net", "example.com", 5)) == ("applied", None)
+
+
+def test_replacement_containing_original_is_not_applied_twice():
+    p = patch("abcd", "abcd (redacted)", 4)
+    assert main.place_patch("key abcd (redacted) z", p) == ("applied", None)
+    # 位置がずれていても、replacement の中の original には当てない
+    assert main.place_patch("moved key abcd (redacted) z", p) == ("applied", None)
+    assert main.place_patch("key abcd z", p) == ("pending", (4, 8))
+
+
+def test_moved_original_is_found_again():
+    p = patch("secret-host", "example.com", 0)
+    assert main.place_patch("new intro. secret-host", p) == ("pending", (11, 22))
+
+
+def test_stale_when_neither_is_present():
+    assert main.place_patch("rewritten", patch("secret-host", "example.com", 0)) == ("stale", None)
+
+
+def test_assemble_release_reports_conflicts_and_redactions():
+    text = "a secret-host b"
+    patches = [patch("secret-host", "example.com", 2), patch("host", "h", 9)]
+    redactions = [{"start": 0, "end": 1, "originalText": "a", "replacement": "A", "rule": "x"}]
+    out = main.assemble_release(text, patches, redactions)
+    assert out["safeMarkdown"] == "A example.com b"
+    assert [p["patchId"] for p in out["conflicts"]] == ["p"]
+    assert len(out["redacted"]) == 1
+
+
+def saved_entry(text):
+    return {
+        "text": text,
+        "report": {"findings": [{"id": "f_001", "title": "メールアドレス"}]},
+        "patches": [{**patch("a@corp.co.jp", "user1@example.com", 3), "findingId": "f_001"}],
+        "contextCache": {"name": "cachedContents/1"},
+    }
+
+
+def test_carry_over_keeps_patches_across_recheck():
+    text = "to a@corp.co.jp"
+    entry = main.carry_over(saved_entry(text), {"text": "new line\n" + text})
+    (p,) = entry["patches"]
+    assert "findingId" not in p and p["findingTitle"] == "メールアドレス"
+    assert (p["start"], p["end"]) == (12, 24)
+    # 本文が変わったので cached content は引き継がない
+    assert "contextCache" not in entry
+    out = main.assemble_release(entry["text"], entry["patches"])
+    assert out["safeMarkdown"] == "new line\nto user1@example.com"
+    assert main.release_brief(None, out["applied"])["applied"][0]["finding"] == "メールアドレス"
+
+
+def test_carry_over_keeps_context_cache_for_same_text():
+    text = "to a@corp.co.jp"
+    entry = main.carry_over(saved_entry(text), {"text": text})
+    assert entry["contextCache"] == {"name": "cachedContents/1"}
+    assert entry["patches"][0]["start"] == 3
@@ -0,0 +1,76 @@
+import asyncio
+
+import main
+from conftest import SETTINGS
+from test_check_stream import events
+
+TEXT = "# t\n\n本文です。\n\n![図](https://img.example.com/a.png)\n"
+
+
+def full_review_model(monkeypatch, check_error=None, persona_error=()):
+    """画像取得・check・ペルソナレビューを差し替え、呼ばれた順を記録する。"""
+    log = []
+
+    async def fetch_images_from_markdown(markdown):
+        log.append("images")
+        return [{"url": "https://img.example.com/a.png", "data": b"", "mime_type": "image/png", "sha256": "s"}]
+
+    async def run_check(text, settings, prompt, images=None):
+        log.append(("check", len(images)))
+        await asyncio.sleep(0.02)
+        if check_error is not None:
+            raise check_error
+        return main.build_report([])
+
+    async def run_persona_review(text, settings, images=None):
+        log.append((settings.audience, len(images)))
+        if settings.audience in persona_error:
+            raise main.http_error(503, "MODEL_UNAVAILABLE", "try again")
+        return {"audience": settings.audience, "verdict": "ok", "items": []}
+
+    monkeypatch.setattr(main, "fetch_images_from_markdown", fetch_images_from_markdown)
+    monkeypatch.setattr(main, "run_check", run_check)
+    monkeypatch.setattr(main, "run_persona_review", run_persona_review)
+    return log
+
+
+def test_review_fetches_images_once_and_runs_both_together(fake_client, monkeypatch):
+    log = full_review_model(monkeypatch, persona_error={"executives"})
+    body = fake_client.post(
+        "/v1/reviews", json={"text": TEXT, "settings": SETTINGS, "audiences": ["general", "executives"]}
+    ).json()
+
+    # 画像は 1 回だけ取得し、check とペルソナの両方に同じ画像を渡す
+    assert log[0] == "images" and log.count("images") == 1
+    assert sorted(log[1:], key=str) == [("check", 1), ("executives", 1), ("general", 1)]
+    assert list(body["persona"]["reviews"]) == ["general"]
+    assert body["persona"]["errors"]["executives"]["status"] == 503
+    saved = fake_client.portal.call(main.CHECK_STORE.get, body["checkId"])
+    assert saved["report"]["findings"] == body["report"]["findings"] == []
+
+
+def test_review_defaults_to_the_settings_audience(fake_client, monkeypatch):
+    log = full_review_model(monkeypatch)
+    body = fake_client.post("/v1/reviews", json={"text": TEXT, "settings": SETTINGS}).json()
+
+    assert list(body["persona"]["reviews"]) == [SETTINGS["audience"]]
+    assert (SETTINGS["audience"], 1) in log
+
+
+def test_failed_check_fails_the_review(fake_client, monkeypatch):
+    full_review_model(monkeypatch, check_error=main.http_error(504, "MODEL_TIMEOUT", "slow"))
+    resp = fake_client.post("/v1/reviews", json={"text": TEXT, "settings": SETTINGS})
+
+    assert resp.status_code == 504
+    assert resp.json()["detail"]["error"] == "MODEL_TIMEOUT"
+
+
+def test_review_stream_sends_report_reviews_and_done(fake_client, monkeypatch):
+    full_review_model(monkeypatch)
+    resp = fake_client.post("/v1/reviews:stream", json={"text": TEXT, "settings": SETTINGS, "audiences": ["general"]})
+    evs = events(resp.text)
+
+    kinds = [e for e, _ in evs]
+    assert sorted(kinds[:-1]) == ["report", "review"]
+    report = next(d for e, d in evs if e == "report")
+    assert evs[-1] == ("done", {"checkId": report["checkId"]})
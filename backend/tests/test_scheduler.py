@@ -0,0 +1,196 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from scheduler import ModelScheduler, SchedulerTimeout, SharedLane, is_rate_limited, is_retryable, priority_lane
+
+
+class APIError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+def test_app_http_errors_are_not_retried():
+    e = HTTPException(status_code=503, detail={"error": "MODEL_NOT_CONFIGURED", "message": "GOOGLE_CLOUD_PROJECT is required"})
+    assert not is_retryable(e)
+    assert not is_rate_limited(HTTPException(status_code=429, detail="429 RESOURCE_EXHAUSTED"))
+
+
+def test_numbers_in_messages_are_not_status_codes():
+    assert not is_retryable(ValueError("invalid value 503 in field"))
+    assert not is_retryable(ValueError("port 5040 refused"))
+
+
+def test_transient_model_errors_are_retried():
+    assert is_retryable(APIError(503, "UNAVAILABLE"))
+    assert is_retryable(APIError(429, "RESOURCE_EXHAUSTED"))
+    assert is_retryable(RuntimeError("DEADLINE_EXCEEDED while waiting"))
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_rate_limited(RuntimeError("429 RESOURCE_EXHAUSTED. {...}"))
+    assert not is_retryable(APIError(400, "INVALID_ARGUMENT"))
+
+
+class FakeClock:
+    """ModelScheduler に渡す時計。sleep は待たずに時計だけを進める。"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+def scheduler(**kwargs):
+    clock = FakeClock()
+    return ModelScheduler(clock=clock, sleep=clock.sleep, **kwargs), clock
+
+
+def test_aimd_halves_on_429_and_recovers_additively():
+    sched, clock = scheduler(max_in_flight=8, base_delay=0.1)
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise APIError(429, "RESOURCE_EXHAUSTED")
+        return "ok"
+
+    assert asyncio.run(sched.run(flaky)) == "ok"
+    assert (sched.throttled, sched.retries) == (1, 1)
+    # 半減してから成功 1 回ぶん（1 / limit）だけ戻る
+    assert sched.limit == 4 + 1 / 4
+
+    # 同じ 1 秒の間の 429 では 2 回下げない
+    sched.on_throttle()
+    assert sched.limit == 4 + 1 / 4
+    clock.now += 1.0
+    sched.on_throttle()
+    assert sched.limit == (4 + 1 / 4) / 2
+
+    for _ in range(100):
+        sched.on_success()
+    assert sched.limit == 8
+
+
+def test_interactive_requests_go_before_batch():
+    sched, _ = scheduler(max_in_flight=1, min_in_flight=1)
+    order = []
+
+    async def hold(release):
+        async with sched.slot("interactive"):
+            await release.wait()
+
+    async def take(lane):
+        async with sched.slot(lane):
+            order.append(lane)
+
+    async def run():
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(release))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(take("batch"))]
+        await asyncio.sleep(0)
+        waiting.append(asyncio.create_task(take("interactive")))
+        await asyncio.sleep(0)
+        assert sched.stats()["queued"] == 2
+        release.set()
+        await asyncio.gather(holder, *waiting)
+
+    asyncio.run(run())
+    assert order == ["interactive", "batch"]
+
+
+def test_token_bucket_waits_then_deadline_raises():
+    sched, clock = scheduler(requests_per_minute=1, deadline=120)
+
+    async def run():
+        async with sched.slot():
+            pass
+        # 2 回目は 1 分ぶん補充されるまで待つ
+        async with sched.slot():
+            pass
+        assert clock.slept == [60.0]
+        # 期限内に補充されない待ちは SchedulerTimeout
+        with pytest.raises(SchedulerTimeout):
+            async with sched.slot(deadline_at=clock.now + 10):
+                pass
+
+    asyncio.run(run())
+    assert sched.timeouts == 1
+
+
+def test_cancelled_waiter_is_not_a_timeout():
+    sched, _ = scheduler(max_in_flight=1)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            async with sched.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(sched.run(lambda: asyncio.sleep(0)))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        release.set()
+        await holder
+
+    asyncio.run(run())
+    assert sched.timeouts == 0
+    assert sched.stats()["queued"] == 0
+
+
+def test_scheduler_can_be_used_from_another_event_loop():
+    sched, _ = scheduler()
+
+    async def call():
+        return await sched.run(lambda: asyncio.sleep(0, "ok"))
+
+    assert asyncio.run(call()) == "ok"
+    assert asyncio.run(call()) == "ok"
+    assert sched.in_flight == 0
+
+
+def test_shared_lane_raised_while_queued_moves_ahead():
+    sched, _ = scheduler(max_in_flight=1, min_in_flight=1)
+    order = []
+    shared = SharedLane("batch")
+
+    async def hold(release):
+        async with sched.slot("interactive"):
+            await release.wait()
+
+    async def take(name, lane):
+        with priority_lane(lane):
+            async with sched.slot():
+                order.append(name)
+
+    async def run():
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(release))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(take("other", "background"))]
+        await asyncio.sleep(0)
+        waiting.append(asyncio.create_task(take("shared", shared)))
+        await asyncio.sleep(0)
+        # 待ち行列に入った後で対話的な呼び出し元が相乗りした
+        shared.raise_to("interactive")
+        shared.raise_to("batch")
+        release.set()
+        await asyncio.gather(holder, *waiting)
+
+    asyncio.run(run())
+    assert order == ["shared", "other"]
+    assert shared.name == "interactive"
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+import pytest
+
+import fastjson
+from cache import CacheBackend, DiskCacheBackend, JsonCache, MemoryCacheBackend, RedisCacheBackend, SqliteCacheBackend
+from store import CheckStore
+
+
+@pytest.fixture(params=["memory", "disk", "sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        backend = RedisCacheBackend("", client=fakeredis.FakeAsyncRedis(decode_responses=True))
+    elif request.param == "memory":
+        backend = MemoryCacheBackend()
+    elif request.param == "disk":
+        backend = DiskCacheBackend(str(tmp_path / "disk"))
+    else:
+        backend = SqliteCacheBackend(str(tmp_path / "store.sqlite3"))
+    return CheckStore(backend, ttl=60)
+
+
+def test_concurrent_updates_keep_every_patch(store):
+    async def add(patch_id):
+        def apply(entry):
+            entry.setdefault("patches", []).append(patch_id)
+            return entry
+
+        # get と put の間で他の更新に切り替わるよう、少し待ってから書く
+        await asyncio.sleep(0)
+        await store.update("c1", apply)
+
+    async def run():
+        await store.put("c1", {"text": "t"})
+        await asyncio.gather(*(add(f"p{i}") for i in range(20)))
+        return await store.get("c1")
+
+    entry = asyncio.run(run())
+    assert sorted(entry["patches"]) == sorted(f"p{i}" for i in range(20))
+
+
+def test_update_skips_write_when_fn_returns_none(store):
+    async def run():
+        assert await store.update("missing", lambda entry: None if entry is None else entry) is None
+        assert await store.get("missing") is None
+        await store.update("new", lambda entry: {"text": "created"})
+        return await store.get("new")
+
+    assert asyncio.run(run()) == {"text": "created"}
+
+
+def test_disk_eviction_keeps_the_newest_entries(tmp_path):
+    backend = DiskCacheBackend(str(tmp_path), max_entries=10)
+
+    async def run():
+        for i in range(25):
+            await backend.set(f"k{i}", "v", 60)
+        return [await backend.get(f"k{i}") for i in range(25)]
+
+    values = asyncio.run(run())
+    assert len(list(tmp_path.glob("*.json"))) <= 10
+    assert values[-1] == "v"
+
+
+def test_memory_backend_counts_utf8_bytes():
+    backend = MemoryCacheBackend(max_entries=10, max_bytes=30)
+
+    async def run():
+        await backend.set("a", "あ" * 6, 60)
+        await backend.set("b", "い" * 6, 60)
+        return await backend.get("a"), await backend.get("b")
+
+    # 6 文字でも 18 バイトなので、2 つ目で 1 つ目が追い出される
+    assert asyncio.run(run()) == (None, "い" * 6)
+
+
+def test_json_cache_decodes_off_the_event_loop(store, monkeypatch):
+    cache = JsonCache(store.backend, ttl=60)
+    loads = fastjson.loads
+    threads = []
+
+    def recording_loads(raw):
+        threads.append(threading.get_ident())
+        return loads(raw)
+
+    async def run():
+        await cache.set("k", {"findings": [1, 2]})
+        monkeypatch.setattr(fastjson, "loads", recording_loads)
+        return await cache.get("k"), threading.get_ident()
+
+    value, loop_thread = asyncio.run(run())
+    assert value == {"findings": [1, 2]}
+    assert threads and loop_thread not in threads
+
+
+def test_cache_backend_requires_get_set_delete():
+    class ReadOnly(CacheBackend):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnly()
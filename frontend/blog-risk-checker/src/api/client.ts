@@ -1,6 +1,8 @@
 // client.ts
 import type {
+  Audience,
   CheckSettings,
+  HighlightItem,
   Report,
   PatchResult,
   ReleaseResult,
@@ -105,20 +107,149 @@ async function apiFetch<T>(
   return response.json();
 }
 
+// エラー応答を ApiError に変換する（本文が JSON でない場合はステータスから作る）
+async function toApiError(response: Response): Promise<ApiError> {
+  try {
+    const errorData = await response.json();
+    return new ApiError(response.status, errorData.detail || {
+      message: errorData.message || 'Request failed',
+    });
+  } catch {
+    return new ApiError(response.status, {
+      message: `Request failed with status ${response.status}`,
+    });
+  }
+}
+
+// Server-Sent Events を返すエンドポイント用の fetch ラッパー
+// イベントを受け取るたびに onEvent(event, data) を呼ぶ
+async function apiStream(
+  endpoint: string,
+  body: unknown,
+  onEvent: (event: string, data: Record<string, unknown>) => void,
+  config?: ApiConfig
+): Promise<void> {
+  const apiKey = config?.apiKey ?? API_KEY;
+  if (!apiKey) {
+    throw new ApiError(401, {
+      message: 'API key is missing. Set VITE_API_KEY.',
+      code: 'MISSING_API_KEY',
+    });
+  }
+
+  const response = await fetch(`${API_BASE_URL}${endpoint}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream',
+      [API_KEY_HEADER]: apiKey,
+    },
+    body: JSON.stringify(body),
+    signal: config?.signal,
+  });
+
+  if (!response.ok || !response.body) {
+    throw await toApiError(response);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // イベントは空行で区切られる
+    let sep: number;
+    while ((sep = buffer.indexOf('\n\n')) >= 0) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+
+      let event = 'message';
+      const dataLines: string[] = [];
+      for (const line of raw.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trimStart());
+      }
+      if (dataLines.length > 0) {
+        onEvent(event, JSON.parse(dataLines.join('\n')));
+      }
+    }
+  }
+}
+
+// compact 形式の report（highlights.items 無し）から items を組み立て直す
+type CompactReport = Omit<Report, 'highlights'> & {
+  highlights: Omit<Report['highlights'], 'items'> & { items?: HighlightItem[] };
+};
+
+function expandReport(report: CompactReport): Report {
+  if (report.highlights.items) {
+    return report as Report;
+  }
+  const items: HighlightItem[] = report.findings.flatMap((f) =>
+    f.highlights.map(({ text, start, end, line, col, match, occurrences }) => ({
+      findingId: f.id,
+      text,
+      start,
+      end,
+      line,
+      col,
+      match,
+      occurrences,
+    }))
+  );
+  return { ...report, highlights: { ...report.highlights, items } };
+}
+
 // チェック作成
 export async function createCheck(
   text: string,
   settings: CheckSettings,
   config?: ApiConfig
 ): Promise<{ checkId: string; report: Report }> {
-  return apiFetch(
-    '/v1/checks',
+  const result = await apiFetch<{ checkId: string; report: CompactReport }>(
+    '/v1/checks?format=compact',
     {
       method: 'POST',
       body: JSON.stringify({ text, settings }),
     },
     config
   );
+  return { ...result, report: expandReport(result.report) };
+}
+
+// チェック + ペルソナレビュー（画像の取得は 1 回、両方を同時に実行）
+export async function fullReview(
+  text: string,
+  settings: CheckSettings,
+  config?: ApiConfig
+): Promise<{
+  checkId: string;
+  report: Report;
+  persona: {
+    reviews: Partial<Record<Audience, PersonaReview>>;
+    errors: Partial<Record<Audience, { message: string }>>;
+  };
+}> {
+  const result = await apiFetch<{
+    checkId: string;
+    report: CompactReport;
+    persona: {
+      reviews: Partial<Record<Audience, PersonaReview>>;
+      errors: Partial<Record<Audience, { message: string }>>;
+    };
+  }>(
+    '/v1/reviews?format=compact',
+    {
+      method: 'POST',
+      body: JSON.stringify({ text, settings }),
+    },
+    config
+  );
+  return { ...result, report: expandReport(result.report) };
 }
 
 // 再チェック
@@ -128,14 +259,15 @@ export async function recheck(
   settings: CheckSettings,
   config?: ApiConfig
 ): Promise<{ report: Report }> {
-  return apiFetch(
-    `/v1/checks/${checkId}/recheck`,
+  const result = await apiFetch<{ report: CompactReport }>(
+    `/v1/checks/${checkId}/recheck?format=compact`,
     {
       method: 'POST',
       body: JSON.stringify({ text, settings }),
     },
     config
   );
+  return { ...result, report: expandReport(result.report) };
 }
 
 // パッチ作成（修正提案の適用）
@@ -188,3 +320,28 @@ export async function personaReview(
   );
 }
 
+// 複数 audience のペルソナレビュー（終わった順に onReview が呼ばれる）
+export async function personaReviewsStream(
+  text: string,
+  settings: CheckSettings,
+  audiences: Audience[],
+  onReview: (review: PersonaReview) => void,
+  config?: ApiConfig
+): Promise<{ errors: Partial<Record<Audience, string>> }> {
+  const errors: Partial<Record<Audience, string>> = {};
+  await apiStream(
+    '/v1/persona-reviews:stream',
+    { text, settings, audiences },
+    (event, data) => {
+      if (event === 'review') {
+        onReview(data.review as PersonaReview);
+      } else if (event === 'error') {
+        errors[data.audience as Audience] = typeof data.message === 'string'
+          ? data.message
+          : 'Failed to run persona review';
+      }
+    },
+    config
+  );
+  return { errors };
+}
@@ -4,12 +4,51 @@ import { EditorState, StateEffect } from '@codemirror/state';
 import { markdown } from '@codemirror/lang-markdown';
 import { Decoration, type DecorationSet, ViewPlugin, type ViewUpdate } from '@codemirror/view';
 import { useAppStore } from '../store/appStore';
+import type { HighlightItem } from '../types';
 
 // ハイライト用のデコレーションマーク
 const highlightMark = Decoration.mark({ class: 'cm-highlight' });
 const selectedHighlightMark = Decoration.mark({ class: 'cm-highlight-selected' });
 const forceUpdateEffect = StateEffect.define<null>();
 
+// 空白（改行・連続スペース）の違いを無視して比べるための正規化（サーバーの normalized 一致と同じ）
+const collapseWhitespace = (s: string) => s.split(/\s+/).filter(Boolean).join(' ');
+
+// ハイライトの位置を求める（同じ文字列が何度も出てくる場合はすべての出現）
+// チェックした本文から変わっていなければサーバーが付けたオフセットをそのまま使う。
+// 変わっていれば、オフセットの位置がまだ一致するか確かめ、ずれていれば文字列検索にフォールバックする
+function highlightRanges(docString: string, h: HighlightItem, checkedText: string | null): { from: number; to: number }[] {
+  if (!h.text) return [];
+  const spans: [number, number][] =
+    h.occurrences ?? (h.start !== undefined && h.end !== undefined ? [[h.start, h.end]] : []);
+  if (spans.length > 0) {
+    // 空白の違いやあいまい一致で見つけた範囲は h.text と一致しないので、本文が同じなら確かめずに使う
+    if (docString === checkedText) {
+      return spans.map(([from, to]) => ({ from, to }));
+    }
+    const fits = ([from, to]: [number, number]) => {
+      const slice = docString.slice(from, to);
+      if (h.match === 'normalized') return collapseWhitespace(slice) === collapseWhitespace(h.text);
+      // fuzzy の範囲は本文が変わると確かめようがない
+      return h.match !== 'fuzzy' && slice === h.text;
+    };
+    if (spans.every(fits)) {
+      return spans.map(([from, to]) => ({ from, to }));
+    }
+  }
+
+  const ranges: { from: number; to: number }[] = [];
+  let startIndex = 0;
+  while (true) {
+    const idx = docString.indexOf(h.text, startIndex);
+    if (idx === -1) break;
+    ranges.push({ from: idx, to: idx + h.text.length });
+    // 重複検知のため +1
+    startIndex = idx + 1;
+  }
+  return ranges;
+}
+
 export function MarkdownEditor() {
   const containerRef = useRef<HTMLDivElement>(null);
   const viewRef = useRef<EditorView | null>(null);
@@ -45,27 +84,15 @@ export function MarkdownEditor() {
           const state = useAppStore.getState();
           const highlights = state.report?.highlights?.items || [];
           const selectedId = state.selectedFindingId;
+          const checkedText = state.checkedText;
 
           const decorations: { from: number; to: number; mark: Decoration }[] = [];
           const docString = view.state.doc.toString();
 
           for (const h of highlights) {
-            if (!h.text) continue;
-
-            // テキスト検索で位置を特定 (簡易実装: 全件ハイライト)
-            let startIndex = 0;
-            while (true) {
-              const idx = docString.indexOf(h.text, startIndex);
-              if (idx === -1) break;
-
-              const from = idx;
-              const to = idx + h.text.length;
-
-              const mark = h.findingId === selectedId ? selectedHighlightMark : highlightMark;
+            const mark = h.findingId === selectedId ? selectedHighlightMark : highlightMark;
+            for (const { from, to } of highlightRanges(docString, h, checkedText)) {
               decorations.push({ from, to, mark });
-
-              // 次の検索へ (重なり防止のため +1 でなく length 分進めるのが無難だが、重複検知のため +1)
-              startIndex = idx + 1;
             }
           }
 
@@ -99,23 +126,13 @@ export function MarkdownEditor() {
               const highlights = state.report?.highlights?.items || [];
               const docString = view.state.doc.toString();
 
-              // クリック位置にあるハイライトを探す
-              // Note: buildDecorations と同じロジックで位置を再計算する必要がある
+              // クリック位置にあるハイライトを探す（buildDecorations と同じ位置計算）
               for (const h of highlights) {
-                if (!h.text) continue;
-                let startIndex = 0;
-                while (true) {
-                  const idx = docString.indexOf(h.text, startIndex);
-                  if (idx === -1) break;
-
-                  const from = idx;
-                  const to = idx + h.text.length;
-
+                for (const { from, to } of highlightRanges(docString, h, state.checkedText)) {
                   if (pos >= from && pos <= to) {
                     selectFinding(h.findingId);
                     return;
                   }
-                  startIndex = idx + 1;
                 }
               }
               // ハイライト外をクリックした場合は選択解除
@@ -1,6 +1,7 @@
 import { create } from 'zustand';
 import type {
   AppState,
+  Audience,
   CheckSettings,
   CheckStatus,
   Report,
@@ -14,7 +15,7 @@ import {
   recheck,
   createPatch,
   release,
-  personaReview,
+  personaReviewsStream,
   ApiError,
 } from '../api/client';
 
@@ -26,6 +27,9 @@ const defaultSettings: CheckSettings = {
   redactMode: 'light',
 };
 
+// ペルソナレビューでまとめて実行する audience
+const allAudiences: Audience[] = ['engineers', 'general', 'internal', 'executives'];
+
 // デフォルトのサンプルテキスト
 const defaultText = `# サンプルブログ記事
 
@@ -62,6 +66,7 @@ export const useAppStore = create<AppState>((set, get) => ({
   // チェック結果
   checkId: null,
   report: null,
+  checkedText: null,
   checkStatus: 'idle',
   errorMessage: null,
 
@@ -75,6 +80,7 @@ export const useAppStore = create<AppState>((set, get) => ({
   // Persona
   personaResult: null,
   personaStatus: 'idle',
+  personaResults: {},
 
   // Release/Export
   releaseResult: null,
@@ -87,7 +93,8 @@ export const useAppStore = create<AppState>((set, get) => ({
   setProjectName: (name: string) => set({ projectName: name }),
   setDocTitle: (title: string) => set({ docTitle: title }),
 
-  setEditorText: (text: string) => set({ editorText: text, isAutosaved: false }),
+  // 本文が変わったら audience ごとのレビュー結果は使えない
+  setEditorText: (text: string) => set({ editorText: text, isAutosaved: false, personaResults: {} }),
 
   setApiKey: (key: string) => set({ apiKey: key }),
 
@@ -95,10 +102,19 @@ export const useAppStore = create<AppState>((set, get) => ({
     set((state) => {
       const audienceChanged = newSettings.audience !== undefined &&
         newSettings.audience !== state.settings.audience;
+      // audience 以外の設定が変わったらレビュー結果は使えない
+      const otherChanged = (Object.keys(newSettings) as (keyof CheckSettings)[]).some(
+        (key) => key !== 'audience' && newSettings[key] !== state.settings[key]
+      );
+      const personaResults = otherChanged ? {} : state.personaResults;
+      const cached = audienceChanged ? personaResults[newSettings.audience!] : undefined;
       return {
         settings: { ...state.settings, ...newSettings },
-        // audience変更時はpersonaStatusをidleにリセットして再実行を促す
-        ...(audienceChanged && { personaStatus: 'idle' as const }),
+        personaResults,
+        // audience変更時は取得済みの結果があればそれを表示し、無ければidleにリセットして再実行を促す
+        ...(audienceChanged && (cached
+          ? { personaResult: cached, personaStatus: 'success' as const }
+          : state.personaStatus !== 'running' && { personaStatus: 'idle' as const })),
       };
     }),
 
@@ -154,10 +170,12 @@ export const useAppStore = create<AppState>((set, get) => ({
     set({ checkStatus: 'running', errorMessage: null });
 
     try {
+      // ペルソナレビューはモデル呼び出しが増えるので、Persona タブで実行したときだけ行う
       const result = await createCheck(editorText, settings, { apiKey: apiKey || undefined });
       set({
         checkId: result.checkId,
         report: result.report,
+        checkedText: editorText,
         checkStatus: 'success',
         isAutosaved: true,
         // Clear release cache when new check is performed
@@ -185,6 +203,7 @@ export const useAppStore = create<AppState>((set, get) => ({
       const result = await recheck(checkId, editorText, settings, { apiKey: apiKey || undefined });
       set({
         report: result.report,
+        checkedText: editorText,
         checkStatus: 'success',
         isAutosaved: true,
         // Clear release cache when recheck is performed
@@ -285,14 +304,32 @@ export const useAppStore = create<AppState>((set, get) => ({
 
   runPersonaReview: async () => {
     const { editorText, settings, apiKey } = get();
-    set({ personaStatus: 'running', errorMessage: null });
+    set({ personaStatus: 'running', personaResults: {}, errorMessage: null });
 
     try {
-      const result = await personaReview(editorText, settings, { apiKey: apiKey || undefined });
-      set({
-        personaResult: result,
-        personaStatus: 'success',
-      });
+      // 全 audience をまとめて実行し、終わったものから保存する
+      const { errors } = await personaReviewsStream(
+        editorText,
+        settings,
+        allAudiences,
+        (review) => {
+          set((state) => {
+            const personaResults = { ...state.personaResults, [review.audience]: review };
+            return review.audience === state.settings.audience
+              ? { personaResults, personaResult: review, personaStatus: 'success' as const }
+              : { personaResults };
+          });
+        },
+        { apiKey: apiKey || undefined }
+      );
+
+      const { settings: current, personaResults } = get();
+      if (!personaResults[current.audience]) {
+        set({
+          personaStatus: 'error',
+          errorMessage: errors[current.audience] ?? 'Failed to run persona review',
+        });
+      }
     } catch (error) {
       const message = error instanceof ApiError
         ? error.detail.message
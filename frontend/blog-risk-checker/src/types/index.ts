@@ -20,14 +20,32 @@ export interface CheckSettings {
 export interface Highlight {
   text: string;
   context?: string;
+  // compact 形式のレスポンスでは位置がここに入る
+  start?: number;
+  end?: number;
+  line?: number;
+  col?: number;
+  match?: 'exact' | 'normalized' | 'fuzzy';
+  // 完全一致で 2 回以上出てくる場合のすべての出現（先頭が start / end と同じ）
+  occurrences?: [number, number][];
+}
+
+export interface HighlightItem {
+  findingId: string;
+  text: string;
+  // サーバー側で解決した本文中の位置（見つからなかった場合は無し）
+  start?: number;
+  end?: number;
+  line?: number;
+  col?: number;
+  match?: 'exact' | 'normalized' | 'fuzzy';
+  occurrences?: [number, number][];
 }
 
 export interface HighlightGroup {
   mode: 'text';
-  items: {
-    findingId: string;
-    text: string;
-  }[];
+  items: HighlightItem[];
+  unresolved?: { findingId: string; text: string }[];
 }
 
 // 個別の指摘
@@ -140,6 +158,8 @@ export interface AppState {
   // チェック結果
   checkId: string | null;
   report: Report | null;
+  // report をチェックしたときの本文（エディタの本文がこれと同じならハイライトの位置をそのまま使える）
+  checkedText: string | null;
   checkStatus: CheckStatus;
   errorMessage: string | null;
 
@@ -153,6 +173,8 @@ export interface AppState {
   // Persona
   personaResult: PersonaReview | null;
   personaStatus: CheckStatus;
+  // audience ごとのレビュー結果（同じ本文なら audience の切り替えで再実行しない）
+  personaResults: Partial<Record<Audience, PersonaReview>>;
 
   // Release/Export
   releaseResult: ReleaseResult | null;